@@ -1,25 +1,28 @@
-import os, time, random, json
-from typing import List, Dict, Any, Tuple
-from PyPDF2 import PdfReader
+import os, time, random, json, asyncio
+from collections import Counter
+from typing import List, Dict, Any, Tuple, Optional, Callable, Awaitable
 from pptx import Presentation
-from openai import OpenAI
+from openai import AsyncOpenAI
 from .metrics_logger import (
     log_metric_entry,
-    compute_quality,
-    compute_accuracy,
+    evaluate_worksheet,
     validate_response
 )
 
-from .pdf import render_pdf
+from .pdf import render_worksheet_pooled
+from . import artifacts, tracing, extract_cache, extract, eval_queue, llm_cache, aio, file_index, question_bank
 from .schemas import WorksheetRequest, WorksheetResponse, WorksheetSetResponse, WorksheetItem
+from pydantic import ValidationError
 
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 
 FILE_ROOT = os.environ.get("FILE_STORE", "/data")
 OPENAI_MODEL = os.environ.get("WORKSHEET_MODEL", "gpt-4o-mini")
+SOURCE_CHAR_BUDGET = 15000  # the prompt carries at most this much source context
+SET_CONCURRENCY = int(os.environ.get("WORKSHEET_SET_CONCURRENCY", "10"))  # sets generated at once per request
 
-client = OpenAI()
+client = AsyncOpenAI()
 
 
 def _id(prefix="ws"):
@@ -30,52 +33,65 @@ def _id(prefix="ws"):
 
 # ---- Source reading ----
 def _find_path(file_id: str) -> Tuple[str, str]:
-    for ext in [".pdf", ".pptx", ".ppt", ".png", ".jpg", ".jpeg", ".webp"]:
-        p = os.path.join(FILE_ROOT, f"{file_id}{ext}")
-        if os.path.exists(p):
-            print("[DEBUG] Listing /data:", os.listdir(FILE_ROOT))
-            return p, ext.lower()
+    found = file_index.resolve(file_id, [".pdf", ".pptx", ".ppt", ".png", ".jpg", ".jpeg", ".webp"])
+    if found is not None:
+        return found
     return os.path.join(FILE_ROOT, file_id), ""
 
 
-def extract_text_from_pdf(path: str) -> str:
-    reader = PdfReader(path)
-    chunks = []
-    for page in reader.pages:
-        try:
-            chunks.append(page.extract_text() or "")
-        except Exception:
-            pass
-    return "\n".join(chunks).strip()
-
-
-def extract_text_from_ppt(path: str) -> str:
+def _ppt_slides(path: str) -> List[str]:
     prs = Presentation(path)
-    texts = []
+    slides = []
     for slide in prs.slides:
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                texts.append(shape.text)
-    return "\n".join(texts).strip()
+        texts = [shape.text for shape in slide.shapes if hasattr(shape, "text")]
+        slides.append("\n".join(texts))
+    return slides
+
+
+def extract_text_from_pdf(path: str, stats: Optional[Dict[str, int]] = None,
+                          char_budget: Optional[int] = None) -> str:
+    pages = extract_cache.cached_units(
+        path, "pdf", lambda p, budget: extract.extract_pdf_pages(p, char_budget=budget),
+        stats, char_budget=char_budget
+    )
+    return "\n".join(pages).strip()
+
+
+def extract_text_from_ppt(path: str, stats: Optional[Dict[str, int]] = None) -> str:
+    slides = extract_cache.cached_units(path, "pptx", lambda p, budget: (_ppt_slides(p), True), stats)
+    return "\n".join(slides).strip()
 
 
-def aggregate_source_text(file_ids: List[str]) -> str:
+def source_shas(file_ids: List[str]) -> List[str]:
+    """Content sha256 of every source file found (the question bank's source key)."""
+    shas = []
+    for fid in file_ids:
+        path, _ = _find_path(fid)
+        if os.path.isfile(path):
+            shas.append(extract_cache.file_sha256(path))
+    return shas
+
+
+def aggregate_source_text(file_ids: List[str], stats: Optional[Dict[str, int]] = None) -> str:
     blobs = []
     for fid in file_ids:
+        used = sum(len(b) + 2 for b in blobs)
+        if used >= SOURCE_CHAR_BUDGET:
+            break  # everything past the budget is cut below anyway
         path, ext = _find_path(fid)
         if not os.path.exists(path):
             blobs.append(f"[WARN] Missing file: {fid}")
             continue
         if ext == ".pdf":
-            blobs.append(f"[PDF:{os.path.basename(path)}]\n" + extract_text_from_pdf(path))
+            blobs.append(f"[PDF:{os.path.basename(path)}]\n" + extract_text_from_pdf(path, stats, SOURCE_CHAR_BUDGET - used))
         elif ext in (".pptx", ".ppt"):
-            blobs.append(f"[PPT:{os.path.basename(path)}]\n" + extract_text_from_ppt(path))
+            blobs.append(f"[PPT:{os.path.basename(path)}]\n" + extract_text_from_ppt(path, stats))
         elif ext in (".png", ".jpg", ".jpeg", ".webp"):
             blobs.append(f"[IMAGE:{os.path.basename(path)}] (content requires OCR/vision; generate items aligned to grade + topic context)")
         else:
             blobs.append(f"[UNKNOWN:{os.path.basename(path)}]")
     text = "\n\n".join(blobs)
-    return text[:15000]
+    return text[:SOURCE_CHAR_BUDGET]
 
 
 # ---- LLM generation ----
@@ -88,7 +104,11 @@ Do not include any other keys.
 """
 
 
-def generate_items(context: str, req: WorksheetRequest, difficulty: str, total_q: int) -> List[Dict[str, Any]]:
+async def generate_items(context: str, req: WorksheetRequest, difficulty: str, total_q: int,
+                         stats: Optional[Dict[str, Any]] = None, set_no: int = 1,
+                         question_mix: Optional[Dict[str, int]] = None,
+                         avoid: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Top-ups of a partly reused set pass the mix still missing and the questions it already has."""
     mix_hint = ""
     if req.question_mix:
         parts = [f'{k}:{v}' for k, v in req.question_mix.items()]
@@ -98,6 +118,12 @@ def generate_items(context: str, req: WorksheetRequest, difficulty: str, total_q
     if req.grade_bands:
         grades_hint = f" Grade bands: {', '.join(req.grade_bands)}."
 
+    topup_hint = ""
+    if question_mix:
+        topup_hint += "\nQuestion types to write: " + ", ".join(f"{k}:{v}" for k, v in question_mix.items()) + "."
+    if avoid:
+        topup_hint += "\nThe set already contains these questions; do not repeat them:\n" + "\n".join(f"- {q}" for q in avoid)
+
     user = f"""
 TARGET LANGUAGE: {req.target_language}
 GRADE LEVELS: {', '.join(req.grade_bands or [])}
@@ -105,6 +131,7 @@ GRADE LEVELS: {', '.join(req.grade_bands or [])}
 You are creating a classroom worksheet with DIFFICULTY = {difficulty.upper()}.
 Each worksheet must be written in {req.target_language.upper()}.
 Generate exactly {total_q} questions, using the SOURCE CONTEXT when possible.
+This is set {set_no} of {req.num_sets}; its questions must differ from the other sets.{topup_hint}
 
 Difficulty must be defined as:
 - EASY → recall or recognition
@@ -121,35 +148,264 @@ SOURCE CONTEXT (may be partial):
 Return STRICT JSON with key "items".
 """
 
-    resp = client.chat.completions.create(
+    messages = [
+        {"role": "system", "content": SYS},
+        {"role": "user", "content": user}
+    ]
+    content, hit = await llm_cache.chat_completion(
+        client,
         model=OPENAI_MODEL,
         temperature=0.7,
-        messages=[
-            {"role": "system", "content": SYS},
-            {"role": "user", "content": user}
-        ],
-        response_format={"type": "json_object"}
+        messages=messages,
+        response_format={"type": "json_object"},
+        bypass=req.bypass_cache,
+        usage=stats,
     )
-    data = json.loads(resp.choices[0].message.content)
+    if stats is not None:
+        key = "llm_cache_hits" if hit else "llm_cache_misses"
+        stats[key] = stats.get(key, 0) + 1
+    try:
+        data = json.loads(content)
+    except ValueError:
+        if hit:
+            await llm_cache.forget(OPENAI_MODEL, messages, 0.7, {"type": "json_object"})
+        raise
     return data.get("items", [])
 
 
+MULTI_SYS = """You are a worksheet designer for multi-grade classrooms in India.
+Create classroom-ready items suitable for the requested difficulty and grades.
+Prefer low-resource, practical prompts. Avoid copyrighted passages.
+You write several worksheet sets at once. Return STRICT JSON only, shaped as
+{ "sets": { "1": { "items": [...] }, "2": { "items": [...] }, ... } }
+where every item is an object:
+{ "type": "mcq|short|diagram|long", "q": "question text", "options": ["A","B","C","D"]?, "answer": "correct or sample", "rubric": "optional" }
+Do not include any other keys.
+"""
+
+
+def valid_set_items(raw: Any, total_q: int) -> Optional[List[Dict[str, Any]]]:
+    """The first total_q items of one set of a multi-set response, or None if the set is unusable."""
+    items = raw.get("items") if isinstance(raw, dict) else raw
+    if not isinstance(items, list) or len(items) < total_q:
+        return None
+    items = items[:total_q]
+    try:
+        for x in items:
+            WorksheetItem(**x)
+    except (TypeError, ValidationError):
+        return None
+    return items
+
+
+async def generate_all_sets(context: str, req: WorksheetRequest, diffs: List[str],
+                            stats: Optional[Dict[str, Any]] = None) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Every set from one model call, so the source context is sent once. Returns
+    {set_no: items} for the sets that passed validation; the rest are missing.
+    """
+    plan = "\n".join(f"- SET {i}: DIFFICULTY = {d.upper()}" for i, d in enumerate(diffs, start=1))
+    user = f"""
+TARGET LANGUAGE: {req.target_language}
+GRADE LEVELS: {', '.join(req.grade_bands or [])}
+
+You are creating {len(diffs)} classroom worksheet sets:
+{plan}
+Each worksheet must be written in {req.target_language.upper()}.
+Generate exactly {req.questions_per_set} questions per set, using the SOURCE CONTEXT when possible.
+The sets must not repeat each other's questions.
+
+Difficulty must be defined as:
+- EASY → recall or recognition
+- MEDIUM → application or explanation
+- HARD → higher-order analysis
+
+Rules:
+- Do not simply reword the same question across sets or difficulties
+- Always prefer context-relevant content. If context is thin or missing, fallback to typical grade topics.
+
+SOURCE CONTEXT (may be partial):
+\"\"\"{context}\"\"\"
+
+Return STRICT JSON with key "sets", one entry per set number.
+"""
+
+    messages = [
+        {"role": "system", "content": MULTI_SYS},
+        {"role": "user", "content": user}
+    ]
+    content, hit = await llm_cache.chat_completion(
+        client,
+        model=OPENAI_MODEL,
+        temperature=0.7,
+        messages=messages,
+        response_format={"type": "json_object"},
+        bypass=req.bypass_cache,
+        usage=stats,
+    )
+    if stats is not None:
+        key = "llm_cache_hits" if hit else "llm_cache_misses"
+        stats[key] = stats.get(key, 0) + 1
+    try:
+        sets = json.loads(content).get("sets") or {}
+    except (ValueError, AttributeError):
+        sets = {}
+    if isinstance(sets, list):
+        sets = {str(i): x for i, x in enumerate(sets, start=1)}
+    out = {}
+    for i in range(1, len(diffs) + 1):
+        items = valid_set_items(sets.get(str(i)), req.questions_per_set) if isinstance(sets, dict) else None
+        if items is not None:
+            out[i] = items
+    if len(out) < len(diffs):
+        # the missing sets are generated one by one; don't replay this answer
+        await llm_cache.forget(OPENAI_MODEL, messages, 0.7, {"type": "json_object"})
+    return out
+
+
+# ---- Sets ----
+async def build_set(context: str, req: WorksheetRequest, i: int, diff: str, stats: Dict[str, Any],
+                    items_dicts: Optional[List[Dict[str, Any]]] = None,
+                    reused: Optional[List[Dict[str, Any]]] = None) -> Tuple[WorksheetSetResponse, List[WorksheetItem]]:
+    """
+    Generate set `i` unless its items are given; `reused` (question bank items)
+    come first and only the missing questions are generated. Its PDF is not
+    rendered here (render_set).
+    """
+    reused = [] if items_dicts is not None else (reused or [])
+    if items_dicts is None:
+        missing = req.questions_per_set - len(reused)
+        generated: List[Dict[str, Any]] = []
+        if missing > 0:
+            mix = None
+            if reused and req.question_mix:
+                have = Counter(x.get("type") for x in reused)
+                mix = {k: v - have[k] for k, v in req.question_mix.items() if v > have[k]} or None
+            with tracing.span("llm", stats):
+                generated = await generate_items(context, req, diff, missing, stats=stats, set_no=i,
+                                                 question_mix=mix, avoid=[x["q"] for x in reused] or None)
+            if reused:
+                generated = generated[:missing]
+        items_dicts = reused + generated
+    items = [WorksheetItem(**x) for x in items_dicts]
+
+    worksheet_id = f"{_id()}-{diff}-set{i}"
+    pdf_name = f"worksheet-set{i}-{diff}-{req.target_language.lower()}.pdf"
+    return WorksheetSetResponse(
+        set_no=i,
+        difficulty=diff,  # type: ignore
+        items=items,
+        printable_pdf_url=artifacts.file_url(worksheet_id, pdf_name),
+        printable_pdf_status="pending",
+        from_bank=len(reused),
+        generated=len(items) - len(reused),
+    ), items
+
+
+async def build_sets(context: str, req: WorksheetRequest, diffs: List[str], stats: Dict[str, Any],
+                     generated: Optional[Dict[int, List[Dict[str, Any]]]] = None,
+                     reused: Optional[Dict[int, List[Dict[str, Any]]]] = None,
+                     on_built: Optional[Callable[[WorksheetSetResponse], Awaitable[None]]] = None
+                     ) -> List[Tuple[WorksheetSetResponse, List[WorksheetItem]]]:
+    """
+    All sets concurrently, at most SET_CONCURRENCY at a time; sets found in
+    `generated` (single-call mode) are taken as they are, sets found in `reused`
+    (reuse mode) are topped up. on_built(set) is awaited as soon as each set is
+    ready, so its PDF renders while later sets are still generated. Results
+    keep set order.
+    If a set fails the ones still running are cancelled and the error of the
+    lowest-numbered failed set is raised, as when the sets ran one after another.
+    """
+    sem = asyncio.Semaphore(max(1, SET_CONCURRENCY))
+    generated = generated or {}
+    reused = reused or {}
+
+    async def one(i: int, diff: str):
+        async with sem:
+            result = await build_set(context, req, i, diff, stats, generated.get(i), reused.get(i))
+        if on_built is not None:
+            await on_built(result[0])
+        return result
+
+    tasks = [asyncio.create_task(one(i, diff)) for i, diff in enumerate(diffs, start=1)]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+        raise
+
+
+def _render_payload(s: WorksheetSetResponse) -> Dict[str, Any]:
+    return {"set_no": s.set_no, "difficulty": s.difficulty, "items": [x.model_dump() for x in s.items]}
+
+
+async def render_set(req: WorksheetRequest, s: WorksheetSetResponse):
+    """Queue one set's PDF on the render pool (build_sets calls this as each set is ready)."""
+    entry = tuple(s.printable_pdf_url.split("/")[2:4])
+    s.printable_pdf_status = await aio.run_blocking(artifacts.submit_many, [entry], render_worksheet_pooled,
+                                                    [_render_payload(s)], req.target_language.lower())
+
+
+async def render_sets(wid: str, req: WorksheetRequest, sets_out: List[WorksheetSetResponse]) -> Dict[str, Any]:
+    """
+    The booklet and answer key, when requested, as one render job once every
+    set is built (the sets' own PDFs are already queued by render_set). Returns
+    their URLs and the status for the response: ready only when every file is.
+    """
+    lang = req.target_language.lower()
+    entries = []
+    extra: Dict[str, Any] = {}
+    if req.booklet:
+        entries.append((f"{wid}-booklet", f"worksheet-booklet-{lang}.pdf"))
+        extra["booklet_pdf_url"] = artifacts.file_url(*entries[-1])
+    if req.answer_key:
+        entries.append((f"{wid}-answer-key", f"worksheet-answer-key-{lang}.pdf"))
+        extra["answer_key_pdf_url"] = artifacts.file_url(*entries[-1])
+
+    statuses = {s.printable_pdf_status for s in sets_out}
+    if entries:
+        statuses.add(await aio.run_blocking(artifacts.submit_many, entries, render_worksheet_pooled,
+                                            [_render_payload(s) for s in sets_out], lang,
+                                            req.booklet, req.answer_key, False))
+    extra["printable_status"] = "ready" if statuses == {"ready"} else "pending"
+    return extra
+
+
+def bank_generated(source_sha: str, req: WorksheetRequest,
+                   built: List[Tuple[WorksheetSetResponse, List[WorksheetItem]]]) -> int:
+    """Store every newly generated item in the question bank; returns how many were new."""
+    added = 0
+    for s, items in built:
+        fresh = [x.model_dump(exclude_none=True) for x in items[s.from_bank:]]
+        added += question_bank.add(source_sha, req.grade_bands, s.difficulty, req.target_language, fresh)
+    return added
+
+
 # ---- Public entry ----
-def build_worksheets(req: WorksheetRequest) -> WorksheetResponse:
+async def build_worksheets(req: WorksheetRequest) -> WorksheetResponse:
     entry = {
         "agent": "worksheet_agent",
+        "trace_id": tracing.trace_id(),
         "grades": req.grade_bands or [],
         "language": req.target_language,
         "success": False,
         "json_valid": False,
         "accuracy": 0.0,
         "quality_score": 0.0,
-        "response_time": 0.0
+        "response_time": 0.0,
+        "extract_cache_hits": 0,
+        "extract_cache_misses": 0
     }
 
     try:
         start = time.time()
-        context = aggregate_source_text(req.file_ids)
+        with tracing.span("extract", entry):
+            context = await aio.run_cpu(aggregate_source_text, req.file_ids, stats=entry)
 
         if len(req.difficulty_levels) == 1 and req.num_sets > 1:
             diffs = [req.difficulty_levels[0]] * req.num_sets
@@ -159,38 +415,57 @@ def build_worksheets(req: WorksheetRequest) -> WorksheetResponse:
             raise ValueError("difficulty_levels must be length 1 (to broadcast) or equal to num_sets")
 
         wid = _id()
-        sets_out = []
+        # keyed by file content, not by the prompt context (file names, char budget)
+        shas = await aio.run_cpu(source_shas, req.file_ids)
+        source_sha = question_bank.source_hash(shas) if shas else None
+        reused: Dict[int, List[Dict[str, Any]]] = {}
+        if req.reuse and source_sha:
+            with tracing.span("bank", entry):
+                reused = await aio.run_blocking(question_bank.fill_sets, source_sha, context, req.grade_bands,
+                                                req.target_language, diffs, req.questions_per_set, req.question_mix)
+
+        generated = None
+        # one call for every set only pays off when the bank had nothing to give
+        entry["generation_mode"] = "single_call" if req.single_call and len(diffs) > 1 and not reused else "per_set"
+        if entry["generation_mode"] == "single_call":
+            try:
+                with tracing.span("llm_multi", entry):
+                    generated = await generate_all_sets(context, req, diffs, stats=entry)
+            except Exception as e:
+                print(f"[WORKSHEET WARN] single-call generation failed, generating per set: {e}")
+                generated = {}
+            # sets that failed validation are regenerated with their own call
+            entry["fallback_sets"] = [i for i in range(1, len(diffs) + 1) if i not in generated]
+        built = await build_sets(context, req, diffs, entry, generated, reused,
+                                 on_built=lambda s: render_set(req, s))
+        sets_out = [s for s, _ in built]
+        entry["bank_items"] = sum(s.from_bank for s in sets_out)
+        entry["generated_items"] = sum(s.generated for s in sets_out)
+        if entry["generated_items"] and source_sha:
+            try:
+                entry["bank_added"] = await aio.run_blocking(bank_generated, source_sha, req, built)
+            except Exception as e:
+                print(f"[WORKSHEET WARN] could not store items in the question bank: {e}")
+        printables = await render_sets(wid, req, sets_out)
 
         # For accuracy evaluation, aggregate all items later
-        all_items = []
-
-        for i, diff in enumerate(diffs, start=1):
-            items_dicts = generate_items(context, req, diff, req.questions_per_set)
-            items = [WorksheetItem(**x) for x in items_dicts]
-            all_items.extend(items)
-
-            worksheet_id = f"{_id()}-{diff}-set{i}"
-            pdf_path = render_pdf(items, worksheet_id, req.target_language.lower())
-            pdf_name = os.path.basename(pdf_path)
-
-            sets_out.append(WorksheetSetResponse(
-                set_no=i,
-                difficulty=diff,  # type: ignore
-                items=items,
-                printable_pdf_url=f"/files/{pdf_name}"
-            ))
+        all_items = [item for _, items in built for item in items]
+        diff = diffs[-1]
 
         duration = round(time.time() - start, 2)
-        resp_dict = WorksheetResponse(worksheet_id=wid, sets=sets_out).model_dump()
+        cache_hit = entry.get("llm_cache_hits", 0) > 0 and not entry.get("llm_cache_misses", 0)
+        resp_dict = WorksheetResponse(worksheet_id=wid, sets=sets_out, cache_hit=cache_hit,
+                                      from_bank=entry["bank_items"], generated=entry["generated_items"],
+                                      **printables).model_dump()
 
         # --- Metrics ---
         entry["response_time"] = duration
-        entry["json_valid"] = validate_response(resp_dict)
-        entry["accuracy"] = compute_accuracy(context, all_items)
-        entry["quality_score"] = compute_quality(all_items, diff, req.grade_bands or [])
+        with tracing.span("validate", entry):
+            entry["json_valid"] = validate_response(resp_dict)
         entry["success"] = True
 
-        log_metric_entry(entry)
+        # accuracy + quality run in the background; the entry is logged when they finish
+        eval_queue.submit(entry, lambda: evaluate_worksheet(context, all_items, diff, req.grade_bands or []))
 
         return WorksheetResponse(**resp_dict)
 
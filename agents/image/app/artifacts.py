@@ -0,0 +1,159 @@
+# app/artifacts.py
+# Content-addressed store for printable files (PDF / Markdown), rendered in the background.
+#   - a rendered file is written once to FILE_STORE/_artifacts/<sha256>.<ext>;
+#     identical renders share the same blob
+#   - artifacts.sqlite indexes artifact IDs (plan / worksheet IDs) to
+#     (content hash, friendly filename, status). The gateway serves
+#     /files/<id>/<filename> from this index with a Content-Disposition name
+#   - the structured response goes out as soon as it is ready; rendering runs
+#     on a small worker pool and the status is shared by every uvicorn worker:
+#       pending -> ready | failed
+#   - submit_many() renders several artifacts in one job (e.g. all PDFs of a worksheet)
+# A pending row older than ARTIFACT_PENDING_TIMEOUT is reported as failed: the
+# worker that owned it was restarted before it finished.
+
+import os, time, sqlite3, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from . import tracing
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+ARTIFACT_DIR = os.path.join(FILE_ROOT, "_artifacts")
+ARTIFACT_DB_PATH = os.environ.get("ARTIFACT_DB_PATH", os.path.join(FILE_ROOT, "artifacts.sqlite"))
+ARTIFACT_WORKERS = int(os.environ.get("ARTIFACT_WORKERS", "2"))
+ARTIFACT_PENDING_TIMEOUT = float(os.environ.get("ARTIFACT_PENDING_TIMEOUT", "300"))
+# RENDER_ASYNC=0 renders inline before the response
+RENDER_ASYNC = os.environ.get("RENDER_ASYNC", "1") not in ("0", "false", "False")
+
+_local = threading.local()
+_pool = ThreadPoolExecutor(max_workers=max(1, ARTIFACT_WORKERS), thread_name_prefix="render")
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(ARTIFACT_DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(ARTIFACT_DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifact_index ("
+            " id TEXT PRIMARY KEY, filename TEXT, sha256 TEXT, ext TEXT, size INTEGER,"
+            " status TEXT, error TEXT, created REAL, updated REAL, render_time REAL, deduplicated INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_artifact_index_sha ON artifact_index(sha256)")
+        _local.conn = conn
+    return conn
+
+
+def blob_path(sha: str, ext: str) -> str:
+    return os.path.join(ARTIFACT_DIR, f"{sha}{ext}")
+
+
+def file_url(artifact_id: str, filename: str) -> str:
+    return f"/files/{artifact_id}/{filename}"
+
+
+def store_bytes(data: bytes, ext: str) -> Dict[str, Any]:
+    """Write data under its content hash unless an identical blob already exists."""
+    sha = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha, ext)
+    if os.path.exists(path):
+        return {"sha256": sha, "size": len(data), "deduplicated": True}
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return {"sha256": sha, "size": len(data), "deduplicated": False}
+
+
+def _run(entries: List[Tuple[str, str]], fn: Callable[..., List[bytes]], args, kwargs):
+    """Render a batch: fn returns one file per (artifact_id, ext) entry, in order."""
+    t0 = time.time()
+    ids = [artifact_id for artifact_id, _ in entries]
+    try:
+        blobs = fn(*args, **kwargs)
+        if len(blobs) != len(entries):
+            raise RuntimeError(f"renderer returned {len(blobs)} files for {len(entries)} artifacts")
+        stored = [store_bytes(data, ext) for data, (_, ext) in zip(blobs, entries)]
+    except Exception as e:
+        print(f"[RENDER ERROR] {', '.join(ids)}: {e}")
+        tracing.observe("render", time.time() - t0, error=True)
+        with _conn() as conn:
+            conn.executemany(
+                "UPDATE artifact_index SET status = 'failed', error = ?, updated = ?, render_time = ? WHERE id = ?",
+                [(str(e), time.time(), round(time.time() - t0, 3), artifact_id) for artifact_id in ids],
+            )
+        return
+    tracing.observe("render", time.time() - t0)
+    with _conn() as conn:
+        conn.executemany(
+            "UPDATE artifact_index SET status = 'ready', sha256 = ?, size = ?, deduplicated = ?,"
+            " updated = ?, render_time = ? WHERE id = ?",
+            [(st["sha256"], st["size"], int(st["deduplicated"]), time.time(), round(time.time() - t0, 3), artifact_id)
+             for st, artifact_id in zip(stored, ids)],
+        )
+
+
+def submit_many(entries: List[Tuple[str, str]], fn: Callable[..., List[bytes]], *args, **kwargs) -> str:
+    """
+    Render several artifacts in one job: entries are (artifact_id, filename)
+    pairs and fn(*args, **kwargs) returns their bytes in the same order. The
+    batch shares one status; see submit().
+    """
+    now = time.time()
+    rows = [(artifact_id, filename, os.path.splitext(filename)[1].lower(), now, now)
+            for artifact_id, filename in entries]
+    with _conn() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO artifact_index (id, filename, sha256, ext, size, status, error,"
+            " created, updated, render_time, deduplicated)"
+            " VALUES (?, ?, NULL, ?, NULL, 'pending', NULL, ?, ?, NULL, NULL)",
+            rows,
+        )
+    batch = [(artifact_id, ext) for artifact_id, _, ext, _, _ in rows]
+    if not RENDER_ASYNC:
+        _run(batch, fn, args, kwargs)
+        st = status(batch[0][0]) or {}
+        if st.get("status") == "failed":
+            raise RuntimeError(st.get("error") or f"rendering {batch[0][0]} failed")
+        return "ready"
+    _pool.submit(_run, batch, fn, args, kwargs)
+    return "pending"
+
+
+def submit(artifact_id: str, filename: str, fn: Callable[..., bytes], *args, **kwargs) -> str:
+    """
+    Render artifact `artifact_id` by calling fn(*args, **kwargs) -> bytes on the
+    render pool; `filename` (its extension picks the media type) is the name it
+    is downloaded under. Returns the status to report right away: "pending",
+    or "ready" when RENDER_ASYNC is off and the file was rendered inline.
+    """
+    return submit_many([(artifact_id, filename)], lambda *a, **k: [fn(*a, **k)], *args, **kwargs)
+
+
+def effective_status(st: str, error: Optional[str], created: float) -> Tuple[str, Optional[str]]:
+    """A pending row older than ARTIFACT_PENDING_TIMEOUT counts as failed (the gateway applies the same rule)."""
+    if st == "pending" and time.time() - created > ARTIFACT_PENDING_TIMEOUT:
+        return "failed", "render timed out"
+    return st, error
+
+
+def status(artifact_id: str) -> Optional[Dict[str, Any]]:
+    """{id, file, url, status, error?, render_time?, deduplicated?} or None for an unknown ID."""
+    row = _conn().execute(
+        "SELECT filename, status, error, created, render_time, deduplicated FROM artifact_index WHERE id = ?",
+        (artifact_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    filename, st, error, created, render_time, dedup = row
+    st, error = effective_status(st, error, created)
+    out: Dict[str, Any] = {"id": artifact_id, "file": filename, "url": file_url(artifact_id, filename), "status": st}
+    if error:
+        out["error"] = error
+    if render_time is not None:
+        out["render_time"] = render_time
+    if dedup is not None:
+        out["deduplicated"] = bool(dedup)
+    return out
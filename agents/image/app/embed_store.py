@@ -0,0 +1,143 @@
+# app/embed_store.py
+# Embeddings of source documents, cached by content hash and shared by every
+# agent and uvicorn worker:
+#   FILE_STORE/_embeddings/<model>.f32      float32 rows, append-only, read through np.memmap
+#   FILE_STORE/_embeddings/index.sqlite     sha256(model, text) -> (model, row, dim)
+# Appends hold an flock on <model>.f32.lock, and a row is indexed only once it is
+# written and flushed to disk, so readers never see a partial vector; the tail of
+# an append that did not finish (crash, disk full) is cut off before the next
+# one, so later rows stay aligned with their index entries. A reader maps the file
+# again when it needs a row past the end of its current mapping.
+# Only texts passed with cache=True are stored: sources repeat across requests,
+# generated text does not.
+
+import os, time, fcntl, sqlite3, hashlib, threading
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+EMBED_DIR = os.environ.get("EMBED_STORE_DIR", os.path.join(FILE_ROOT, "_embeddings"))
+EMBED_INDEX_PATH = os.path.join(EMBED_DIR, "index.sqlite")
+
+_local = threading.local()
+_maps: Dict[str, np.memmap] = {}
+_maps_lock = threading.Lock()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(EMBED_DIR, exist_ok=True)
+        conn = sqlite3.connect(EMBED_INDEX_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT, row INTEGER, dim INTEGER, created REAL)"
+        )
+        _local.conn = conn
+    return conn
+
+
+def _key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _data_path(model: str) -> str:
+    return os.path.join(EMBED_DIR, model.replace("/", "_") + ".f32")
+
+
+def _rows(model: str, dim: int, needed: int) -> np.ndarray:
+    """The store of `model` as an (n, dim) read-only memmap holding at least `needed` rows."""
+    path = _data_path(model)
+    with _maps_lock:
+        m = _maps.get(model)
+        if m is None or m.shape[0] < needed or m.shape[1] != dim:
+            n = os.path.getsize(path) // (dim * 4)
+            m = _maps[model] = np.memmap(path, dtype=np.float32, mode="r", shape=(n, dim))
+        return m
+
+
+# ---------- Public API ----------
+def get_many(model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+    """Cached vector of each text, or None."""
+    keys = [_key(model, t) for t in texts]
+    found = {}
+    for key in set(keys):
+        row = _conn().execute("SELECT row, dim FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            found[key] = row
+    out: List[Optional[np.ndarray]] = []
+    for key in keys:
+        if key not in found:
+            out.append(None)
+            continue
+        r, dim = found[key]
+        try:
+            out.append(np.array(_rows(model, dim, r + 1)[r]))
+        except (OSError, ValueError, IndexError):
+            out.append(None)  # store file replaced or truncated; re-embed
+    return out
+
+
+def put(model: str, text: str, vec: np.ndarray) -> int:
+    """Append `vec` unless the text is already stored; returns its row."""
+    key = _key(model, text)
+    vec = np.asarray(vec, dtype=np.float32).ravel()
+    path = _data_path(model)
+    os.makedirs(EMBED_DIR, exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            conn = _conn()
+            hit = conn.execute("SELECT row FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if hit is not None:
+                return hit[0]
+            row_size = vec.size * 4
+            with open(path, "ab") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size % row_size:
+                    print(f"[EMBED STORE WARN] {path}: dropping {size % row_size} bytes of a partial row")
+                    size -= size % row_size
+                    f.truncate(size)
+                row = size // row_size
+                f.write(vec.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, row, dim, created) VALUES (?, ?, ?, ?, ?)",
+                    (key, model, row, vec.size, time.time()),
+                )
+            return row
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def embed(client, model: str, texts: Sequence[str], cache: Sequence[bool]) -> np.ndarray:
+    """
+    (len(texts), dim) embeddings through the synchronous OpenAI client; texts with
+    cache=True are read from / written to the store, only the rest are requested.
+    """
+    vecs: List[Optional[np.ndarray]] = [None] * len(texts)
+    cached_idx = [i for i, c in enumerate(cache) if c]
+    for i, v in zip(cached_idx, get_many(model, [texts[i] for i in cached_idx])):
+        vecs[i] = v
+    missing = [i for i, v in enumerate(vecs) if v is None]
+    if missing:
+        resp = client.embeddings.create(model=model, input=[texts[i] for i in missing])
+        for i, d in zip(missing, resp.data):
+            vecs[i] = np.asarray(d.embedding, dtype=np.float32)
+            if cache[i]:
+                try:
+                    put(model, texts[i], vecs[i])
+                except (OSError, sqlite3.Error) as e:
+                    print(f"[EMBED STORE WARN] could not store embedding: {e}")
+    return np.vstack(vecs)
+
+
+def cosine(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of `query` with every row of `matrix`, in one operation."""
+    matrix = np.atleast_2d(matrix)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    norms[norms == 0] = 1.0
+    return (matrix @ query) / norms
@@ -0,0 +1,129 @@
+# app/eval_queue.py
+# Runs accuracy / quality evaluation in background threads so responses go out
+# as soon as the artifact exists. The metrics entry is written to the JSONL log
+# once its evaluation finishes (or right away when the request isn't sampled).
+#
+# Sampling is stratified by (agent, language, grades): each stratum keeps its own
+# counter and evaluates ceil(n * rate) of its first n requests, so rare strata
+# are still covered. Configure with
+#   EVAL_SAMPLE_RATE=0.1                                  default for every stratum
+#   EVAL_SAMPLE_RATES='{"*/hi/*": 0.5, "*/*/5": 1.0}'     per-stratum overrides,
+#       keys are "agent/language/grades" with "*" wildcards; the most specific match wins.
+
+import os, json, math, queue, atexit, threading
+from datetime import datetime
+from typing import Dict, Any, Callable, Tuple
+
+from .metrics_logger import log_metric_entry
+from . import tracing
+
+EVAL_SAMPLE_RATE = float(os.environ.get("EVAL_SAMPLE_RATE", "1.0"))
+EVAL_SAMPLE_RATES: Dict[str, float] = json.loads(os.environ.get("EVAL_SAMPLE_RATES", "{}") or "{}")
+EVAL_WORKERS = int(os.environ.get("EVAL_WORKERS", "2"))
+EVAL_QUEUE_MAX = int(os.environ.get("EVAL_QUEUE_MAX", "1000"))
+EVAL_DRAIN_TIMEOUT = float(os.environ.get("EVAL_DRAIN_TIMEOUT", "30"))
+
+_queue: "queue.Queue" = queue.Queue(maxsize=EVAL_QUEUE_MAX)
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, str, str], int] = {}
+_workers = []
+
+
+# ---------- Sampling ----------
+def stratum(entry: Dict[str, Any]) -> Tuple[str, str, str]:
+    grades = entry.get("grades") or []
+    grade_key = ",".join(sorted(str(g) for g in grades)) if grades else "*"
+    return (entry.get("agent", "*"), str(entry.get("language", "*")).lower(), grade_key)
+
+
+def sample_rate(key: Tuple[str, str, str]) -> float:
+    best, best_wild = EVAL_SAMPLE_RATE, 4
+    for pattern, rate in EVAL_SAMPLE_RATES.items():
+        parts = (pattern.split("/") + ["*", "*", "*"])[:3]
+        if all(p == "*" or p.lower() == k.lower() for p, k in zip(parts, key)):
+            wild = parts.count("*")
+            if wild < best_wild:
+                best, best_wild = float(rate), wild
+    return max(0.0, min(1.0, best))
+
+
+def should_sample(entry: Dict[str, Any]) -> bool:
+    key = stratum(entry)
+    rate = sample_rate(key)
+    with _lock:
+        n = _counters.get(key, 0)
+        _counters[key] = n + 1
+    return math.ceil((n + 1) * rate) > math.ceil(n * rate)
+
+
+# ---------- Worker ----------
+def _run():
+    while True:
+        entry, evaluate = _queue.get()
+        try:
+            with tracing.span("eval", entry):
+                entry.update(evaluate() or {})
+            entry["eval_status"] = "done"
+        except Exception as e:
+            print(f"[EVAL ERROR] {e}")
+            entry["eval_status"] = "error"
+            entry["eval_error"] = str(e)
+        finally:
+            entry["evaluated_at"] = datetime.utcnow().isoformat()
+            try:
+                log_metric_entry(entry)
+            except Exception as e:
+                print(f"[EVAL ERROR] could not log entry: {e}")
+            _queue.task_done()
+
+
+def _ensure_workers():
+    with _lock:
+        _workers[:] = [t for t in _workers if t.is_alive()]
+        while len(_workers) < EVAL_WORKERS:
+            t = threading.Thread(target=_run, name=f"eval-{len(_workers)}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+def submit(entry: Dict[str, Any], evaluate: Callable[[], Dict[str, Any]]):
+    """
+    Queue `evaluate()` (returns fields to merge into entry, e.g. accuracy and
+    quality_score) and log the entry when it's done. Unsampled entries, or
+    entries that don't fit in the queue, are logged immediately without scores.
+    """
+    entry.setdefault("timestamp", datetime.utcnow().isoformat())
+    if not should_sample(entry):
+        entry["eval_status"] = "skipped"
+        log_metric_entry(entry)
+        return
+    _ensure_workers()
+    entry["eval_status"] = "queued"
+    try:
+        _queue.put_nowait((entry, evaluate))
+    except queue.Full:
+        print("[EVAL WARN] evaluation queue full, logging without scores")
+        entry["eval_status"] = "dropped"
+        log_metric_entry(entry)
+
+
+@atexit.register
+def _drain():
+    """Give queued evaluations a chance to finish on shutdown; log the rest unscored."""
+    deadline = threading.Event()
+    waiter = threading.Thread(target=lambda: (_queue.join(), deadline.set()), daemon=True)
+    waiter.start()
+    if deadline.wait(EVAL_DRAIN_TIMEOUT):
+        return
+    while True:
+        try:
+            entry, _ = _queue.get_nowait()
+        except queue.Empty:
+            break
+        entry["eval_status"] = "dropped"
+        log_metric_entry(entry)
+        _queue.task_done()
+
+
+def queue_stats() -> Dict[str, Any]:
+    return {"pending": _queue.qsize(), "workers": len(_workers)}
@@ -0,0 +1,144 @@
+# app/extract_cache.py
+# Content-addressed cache of extracted document text, stored on FILE_STORE so
+# every agent and every uvicorn worker can reuse it. One JSON file per document:
+#   <FILE_STORE>/_extract_cache/<sha256 of file bytes>.json
+#   {"sha256": ..., "kind": "pdf|pptx", "units": ["page 1 text", ...], "complete": true}
+# "complete" is false when extraction stopped early at a character budget; such
+# an entry records that budget as "char_budget" and is reused only by callers
+# whose budget it already covers.
+# Access time is tracked via mtime; the oldest entries are evicted once the
+# directory grows past EXTRACT_CACHE_MAX_MB.
+
+import os, json, hashlib, threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+CACHE_DIR = os.environ.get("EXTRACT_CACHE_DIR", os.path.join(FILE_ROOT, "_extract_cache"))
+MAX_BYTES = int(float(os.environ.get("EXTRACT_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_SHA_MEMO_MAX = 4096
+_sha_memo: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()  # path -> (mtime_ns, size, sha256), LRU
+
+
+# ---------- Hashing ----------
+def file_sha256(path: str) -> str:
+    st = os.stat(path)
+    with _lock:
+        memo = _sha_memo.get(path)
+        if memo and memo[:2] == (st.st_mtime_ns, st.st_size):
+            _sha_memo.move_to_end(path)
+            return memo[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    sha = h.hexdigest()
+    with _lock:
+        _sha_memo[path] = (st.st_mtime_ns, st.st_size, sha)
+        _sha_memo.move_to_end(path)
+        while len(_sha_memo) > _SHA_MEMO_MAX:
+            _sha_memo.popitem(last=False)
+    return sha
+
+
+def normalize_text(text: str) -> str:
+    lines = [line.rstrip() for line in (text or "").replace("\r\n", "\n").splitlines()]
+    return "\n".join(lines).strip()
+
+
+# ---------- Storage ----------
+def _entry_path(sha: str) -> str:
+    return os.path.join(CACHE_DIR, f"{sha}.json")
+
+
+def get(sha: str) -> Optional[Dict[str, Any]]:
+    path = _entry_path(sha)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        os.utime(path)  # mark as recently used
+        return data
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def put(sha: str, kind: str, units: List[str], **extra):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    data = {"sha256": sha, "kind": kind, "units": units, **extra}
+    path = _entry_path(sha)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)  # atomic: concurrent readers never see a partial file
+    evict()
+
+
+def evict(max_bytes: int = MAX_BYTES):
+    """Drop least recently used entries until the cache fits in max_bytes."""
+    try:
+        entries = []
+        for name in os.listdir(CACHE_DIR):
+            if not name.endswith(".json"):
+                continue
+            p = os.path.join(CACHE_DIR, name)
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+    except FileNotFoundError:
+        return
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return
+    for _, size, p in sorted(entries):
+        try:
+            os.remove(p)
+            with _lock:
+                _stats["evictions"] += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+# ---------- Public API ----------
+def cached_units(path: str, kind: str, extractor: Callable[[str, Optional[int]], Tuple[List[str], bool]],
+                 stats: Optional[Dict[str, int]] = None, char_budget: Optional[int] = None) -> List[str]:
+    """
+    Return the normalized per-page / per-slide text of `path`, extracting it
+    with `extractor(path, char_budget) -> (units, complete)` only if no worker
+    has done so for these exact bytes yet.
+    """
+    sha = file_sha256(path)
+    cached = get(sha)
+    hit = cached is not None and (
+        cached.get("complete", True)
+        or (char_budget is not None and (cached.get("char_budget") or 0) >= char_budget)
+    )
+    if hit:
+        units = cached.get("units", [])
+    else:
+        raw, complete = extractor(path, char_budget)
+        units = [normalize_text(u) for u in raw]
+        put(sha, kind, units, complete=complete, char_budget=None if complete else char_budget)
+
+    key = "hits" if hit else "misses"
+    with _lock:
+        _stats[key] += 1
+    if stats is not None:
+        stats[f"extract_cache_{key}"] = stats.get(f"extract_cache_{key}", 0) + 1
+    return units
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Counters for this worker process."""
+    with _lock:
+        s = dict(_stats)
+    lookups = s["hits"] + s["misses"]
+    s["hit_rate"] = round(s["hits"] / lookups, 3) if lookups else 0.0
+    return s
@@ -1,17 +1,44 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from .schemas import WorksheetRequest, WorksheetResponse
 from .agent import build_worksheets
+from .metrics_logger import aggregate_metrics
+from . import artifacts, tracing, preextract
 
 app = FastAPI(title="image-agent", version="0.2.0")
+tracing.init("image")
+app.middleware("http")(tracing.middleware)
 
 @app.get("/health", tags=["meta"])
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics", tags=["performance"])
+def get_metrics():
+    return aggregate_metrics()
+
+@app.get("/metrics/prometheus", tags=["performance"], response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Per-stage latency histograms in Prometheus text format."""
+    return PlainTextResponse(tracing.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+@app.get("/files/{artifact_id}/status", tags=["files"])
+def file_status(artifact_id: str):
+    """Rendering state of a worksheet set's PDF (artifact_id from its printable_pdf_url)."""
+    st = artifacts.status(artifact_id)
+    if st is None:
+        raise HTTPException(status_code=404, detail=f"unknown file: {artifact_id}")
+    return st
+
+@app.post("/ingest/{file_id}", tags=["files"], status_code=202)
+def ingest(file_id: str):
+    """Queue eager text extraction of an upload (called by the gateway's /upload)."""
+    return preextract.submit(file_id)
+
 @app.post("/worksheet", response_model=WorksheetResponse)
-def worksheet(body: WorksheetRequest):
+async def worksheet(body: WorksheetRequest):
     try:
-        return build_worksheets(body)
+        return await build_worksheets(body)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except FileNotFoundError as e:
@@ -3,26 +3,24 @@ from datetime import datetime
 from typing import Dict, Any, List
 from pydantic import ValidationError
 from openai import OpenAI
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from . import extract_cache, metrics_sink, metrics_store, scorer, embed_store
 from .schemas import WorksheetResponse, WorksheetItem
 
 METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH", "/data/worksheet_metrics.jsonl")
+# local: scorer.py (no network calls); remote: embeddings + LLM grader per request
+EVAL_BACKEND = os.environ.get("EVAL_BACKEND", "local")
+EMBED_MODEL = "text-embedding-3-small"
 _client = OpenAI()
 
 # ---------- Core Logging ----------
 def log_metric_entry(entry: Dict[str, Any]):
-    entry["timestamp"] = datetime.utcnow().isoformat()
-    os.makedirs(os.path.dirname(METRICS_LOG_PATH), exist_ok=True)
-    with open(METRICS_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    """Buffered; metrics_sink flushes batches under a file lock and rotates the log."""
+    entry.setdefault("timestamp", datetime.utcnow().isoformat())
+    metrics_sink.get_sink(METRICS_LOG_PATH).write(json.dumps(entry, ensure_ascii=False) + "\n")
 
 def load_logs() -> List[Dict[str, Any]]:
-    if not os.path.exists(METRICS_LOG_PATH):
-        return []
-    with open(METRICS_LOG_PATH, encoding="utf-8") as f:
-        return [json.loads(line) for line in f if line.strip()]
+    """Every entry, including rotated segments. /metrics uses metrics_store instead."""
+    return [json.loads(line) for line in metrics_sink.iter_lines(METRICS_LOG_PATH) if line.strip()]
 
 
 # ---------- Accuracy / Relevance ----------
@@ -36,21 +34,15 @@ def compute_accuracy(source_text: str, generated_items: List[WorksheetItem]) ->
     questions_text = questions_text[:24000]
 
     try:
-        emb = _client.embeddings.create(
-            model="text-embedding-3-small",
-            input=[source_text, questions_text]
-        )
-        v1, v2 = np.array(emb.data[0].embedding), np.array(emb.data[1].embedding)
-        sim = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
+        # the source embedding comes from the shared store after its first use
+        vecs = embed_store.embed(_client, EMBED_MODEL, [source_text, questions_text], cache=[True, False])
+        sim = embed_store.cosine(vecs[1], vecs[:1])[0]
         return round(float(sim), 3)
     except Exception as e:
         print("[ACCURACY WARNING] Embedding failed:", e)
-        # Fallback: TF-IDF
+        # Fallback: TF-IDF with the persisted weights
         try:
-            corpus = [source_text, questions_text]
-            X = TfidfVectorizer(stop_words="english").fit_transform(corpus)
-            sim = cosine_similarity(X[0:1], X[1:2])[0][0]
-            return round(float(sim), 3)
+            return scorer.similarity(source_text, questions_text)
         except Exception:
             return 0.0
 
@@ -92,6 +84,20 @@ def compute_quality(items: List[WorksheetItem], difficulty: str, grade_bands: Li
 
 
 
+# ---------- Evaluation ----------
+def evaluate_worksheet(source_text: str, items: List[WorksheetItem], difficulty: str,
+                       grade_bands: List[str]) -> Dict[str, Any]:
+    """accuracy + quality_score for the metrics entry; locally scored unless EVAL_BACKEND=remote."""
+    if EVAL_BACKEND == "remote":
+        return {
+            "accuracy": compute_accuracy(source_text, items),
+            "quality_score": compute_quality(items, difficulty, grade_bands),
+        }
+    texts = [" ".join([i.q] + (i.options or [])) for i in items]
+    s = scorer.score(source_text[:24000], texts)
+    return {"accuracy": s["relevance"], "quality_score": s["quality"], "scores": s}
+
+
 # ---------- Validation ----------
 def validate_response(resp: Dict[str, Any]) -> bool:
     """Ensure the generated structure matches expected Pydantic schema."""
@@ -105,20 +111,18 @@ def validate_response(resp: Dict[str, Any]) -> bool:
 
 # ---------- Aggregation ----------
 def aggregate_metrics() -> Dict[str, Any]:
-    logs = load_logs()
-    if not logs:
+    """Totals, latency percentiles, language/grade breakdowns and rollups; reads only new log lines."""
+    store = metrics_store.get_store(METRICS_LOG_PATH)
+    out = store.summary()
+    if not out:
         return {}
 
-    total = len(logs)
-    successes = sum(1 for x in logs if x.get("success"))
-    valids = sum(1 for x in logs if x.get("json_valid"))
-    qualities = [x["quality_score"] for x in logs if x.get("quality_score")]
-    accuracies = [x["accuracy"] for x in logs if x.get("accuracy")]
-
-    return {
-        "quality_of_response": round(sum(qualities) / len(qualities), 2) if qualities else 0.0,
-        "reliability": round(successes / total, 3),
-        "batch_validation": round(valids / total, 3),
-        "accuracy": round(sum(accuracies) / len(accuracies), 3) if accuracies else 0.0,
-        "total_requests": total
+    c = store.counters()
+    hits, misses = c["xc_hits"], c["xc_misses"]
+    out["extract_cache"] = {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        "worker": extract_cache.cache_stats(),
     }
+    return out
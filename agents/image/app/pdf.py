@@ -1,18 +1,25 @@
-import os
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+import io, os, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
+from xml.sax.saxutils import escape
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
-FILE_STORE = os.environ.get("FILE_STORE", "/data")
 FONTS_DIR = os.path.join(os.path.dirname(__file__), "assets", "fonts")
+# reportlab layout is CPU-bound; it runs in these processes, off the workers' threads
+RENDER_PROCESSES = int(os.environ.get("RENDER_PROCESSES", str(min(2, os.cpu_count() or 1))))
 
 # Register fonts once
 pdfmetrics.registerFont(TTFont("NotoSans", os.path.join(FONTS_DIR, "NotoSans-Regular.ttf")))
 pdfmetrics.registerFont(TTFont("NotoSansDevanagari", os.path.join(FONTS_DIR, "NotoSansDevanagari-Regular.ttf")))
 pdfmetrics.registerFont(TTFont("NotoSansTamil", os.path.join(FONTS_DIR, "NotoSansTamil-Regular.ttf")))
 
+_styles: Dict[str, Dict[str, ParagraphStyle]] = {}  # font -> styles, built once per process
+_pool: Optional[ProcessPoolExecutor] = None
+
 def get_font_for_lang(lang: str) -> str:
     if lang == "hi":
         return "NotoSansDevanagari"
@@ -20,26 +27,102 @@ def get_font_for_lang(lang: str) -> str:
         return "NotoSansTamil"
     return "NotoSans"
 
-def render_pdf(items, worksheet_id: str, lang: str) -> str:
-    styles = getSampleStyleSheet()
-    font_name = get_font_for_lang(lang)
+def styles_for(lang: str) -> Dict[str, ParagraphStyle]:
+    """Styles in the language's font, derived from the sample sheet without modifying it."""
+    font = get_font_for_lang(lang)
+    styles = _styles.get(font)
+    if styles is None:
+        base = getSampleStyleSheet()
+        styles = _styles[font] = {
+            "title": ParagraphStyle(f"{font}-title", parent=base["Heading1"], fontName=font),
+            "heading": ParagraphStyle(f"{font}-heading", parent=base["Heading2"], fontName=font),
+            "body": ParagraphStyle(f"{font}-body", parent=base["Normal"], fontName=font),
+            "note": ParagraphStyle(f"{font}-note", parent=base["Normal"], fontName=font,
+                                   leftIndent=14, textColor="#555555"),
+        }
+    return styles
 
-    styles["Normal"].fontName = font_name
-    styles["Heading1"].fontName = font_name
+def _field(item, key: str):
+    return item.get(key) if isinstance(item, dict) else getattr(item, key, None)
 
-    doc_path = os.path.join(FILE_STORE, f"{worksheet_id}.pdf")
-    doc = SimpleDocTemplate(doc_path, pagesize=A4)
+def _build(story) -> bytes:
+    buf = io.BytesIO()
+    # invariant: no timestamps/random IDs, so identical worksheets give identical bytes
+    doc = SimpleDocTemplate(buf, pagesize=A4, invariant=1)
+    doc.build(story)
+    return buf.getvalue()
 
+# ---------- Stories ----------
+def _questions(items, styles) -> list:
     story = []
-    story.append(Paragraph(f"Generated Worksheet ({lang})", styles["Heading1"]))
-    story.append(Spacer(1, 12))
-
     for i, item in enumerate(items, 1):
-        story.append(Paragraph(f"Q{i}. ({item.type}) {item.q}", styles["Normal"]))
-        if item.options:
-            for opt in item.options:
-                story.append(Paragraph(f"- {opt}", styles["Normal"]))
+        story.append(Paragraph(escape(f"Q{i}. ({_field(item, 'type')}) {_field(item, 'q')}"), styles["body"]))
+        for opt in _field(item, "options") or []:
+            story.append(Paragraph(escape(f"- {opt}"), styles["body"]))
         story.append(Spacer(1, 12))
+    return story
 
-    doc.build(story)
-    return doc_path
+def _answers(items, styles) -> list:
+    story = []
+    for i, item in enumerate(items, 1):
+        story.append(Paragraph(escape(f"Q{i}. {_field(item, 'answer') or '-'}"), styles["body"]))
+        if _field(item, "rubric"):
+            story.append(Paragraph(escape(f"Rubric: {_field(item, 'rubric')}"), styles["note"]))
+        story.append(Spacer(1, 8))
+    return story
+
+def _set_title(s: Dict[str, Any]) -> str:
+    return f"Set {s['set_no']} ({s['difficulty']})"
+
+# ---------- Rendering ----------
+def render_pdf(items, lang: str) -> bytes:
+    styles = styles_for(lang)
+    story = [Paragraph(f"Generated Worksheet ({lang})", styles["title"]), Spacer(1, 12)]
+    return _build(story + _questions(items, styles))
+
+def render_booklet(sets: List[Dict[str, Any]], lang: str) -> bytes:
+    """Every set in one PDF, each starting on a new page."""
+    styles = styles_for(lang)
+    story = [Paragraph(f"Worksheet Booklet ({lang})", styles["title"])]
+    for n, s in enumerate(sets):
+        if n:
+            story.append(PageBreak())
+        story += [Paragraph(escape(_set_title(s)), styles["heading"]), Spacer(1, 8)]
+        story += _questions(s["items"], styles)
+    return _build(story)
+
+def render_answer_key(sets: List[Dict[str, Any]], lang: str) -> bytes:
+    """Answers and rubrics of every set."""
+    styles = styles_for(lang)
+    story = [Paragraph(f"Answer Key ({lang})", styles["title"])]
+    for s in sets:
+        story += [Paragraph(escape(_set_title(s)), styles["heading"]), Spacer(1, 6)]
+        story += _answers(s["items"], styles)
+    return _build(story)
+
+def render_worksheet(sets: List[Dict[str, Any]], lang: str, booklet: bool = False,
+                     answer_key: bool = False, set_pdfs: bool = True) -> List[bytes]:
+    """
+    One PDF per set ({set_no, difficulty, items}) unless set_pdfs is False, then
+    the booklet and the answer key when asked for, in that order.
+    """
+    out = [render_pdf(s["items"], lang) for s in sets] if set_pdfs else []
+    if booklet:
+        out.append(render_booklet(sets, lang))
+    if answer_key:
+        out.append(render_answer_key(sets, lang))
+    return out
+
+# ---------- Pool ----------
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: uvicorn workers run threads, forking them is unsafe
+        _pool = ProcessPoolExecutor(max_workers=max(1, RENDER_PROCESSES),
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def render_worksheet_pooled(sets: List[Dict[str, Any]], lang: str, booklet: bool = False,
+                            answer_key: bool = False, set_pdfs: bool = True) -> List[bytes]:
+    """render_worksheet in a render process; blocks the calling (render pool) thread only."""
+    return _get_pool().submit(render_worksheet, sets, lang, booklet, answer_key, set_pdfs).result()
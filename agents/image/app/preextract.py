@@ -0,0 +1,83 @@
+# app/preextract.py
+# Eager text extraction of uploads, so the first plan / worksheet request for a
+# file finds its text ready in the extract cache (extract_cache.py).
+#   - the gateway's /upload posts each PDF / slide deck to POST /ingest/{file_id};
+#     the job runs on a small pool: extract every page or slide, count them,
+#     detect the language and store the result as a complete extract cache entry
+#     (the studyplan agent shares the cache, whatever char budget it asks for)
+#   - progress goes to the ingestion table of file_index.sqlite
+#     (queued -> running -> ready | failed, skipped for other file types),
+#     which the gateway serves at GET /upload/{file_id}/status
+
+import os, unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+from . import extract, extract_cache, file_index
+
+PREEXTRACT_WORKERS = int(os.environ.get("PREEXTRACT_WORKERS", "2"))
+LANG_SAMPLE_CHARS = 20000  # language is guessed from the head of the document
+
+EXTS = [".pdf", ".pptx", ".ppt"]
+# first word of the Unicode character name -> language code; Latin is read as English
+SCRIPT_LANG = {
+    "LATIN": "en", "DEVANAGARI": "hi", "TAMIL": "ta", "TELUGU": "te", "KANNADA": "kn",
+    "MALAYALAM": "ml", "BENGALI": "bn", "GUJARATI": "gu", "GURMUKHI": "pa", "ORIYA": "or",
+}
+
+_pool = ThreadPoolExecutor(max_workers=max(1, PREEXTRACT_WORKERS), thread_name_prefix="preextract")
+
+
+def detect_language(text: str) -> str:
+    """Language code of the dominant script among the letters of `text`, or "unknown"."""
+    counts: Dict[str, int] = {}
+    for ch in text[:LANG_SAMPLE_CHARS]:
+        if not ch.isalpha():
+            continue
+        script = unicodedata.name(ch, "").split(" ", 1)[0]
+        counts[script] = counts.get(script, 0) + 1
+    if not counts:
+        return "unknown"
+    return SCRIPT_LANG.get(max(counts, key=counts.get), "unknown")
+
+
+def _slides(path: str) -> List[str]:
+    from .agent import _ppt_slides
+    return _ppt_slides(path)
+
+
+def ingest(file_id: str) -> Dict[str, Any]:
+    """Extract, count and store the text of file_id; returns its ingestion record."""
+    found = file_index.resolve(file_id, EXTS)
+    if found is None:
+        file_index.set_ingestion(file_id, "failed", error=f"no PDF or slides found for file_id={file_id}")
+        return file_index.ingestion(file_id) or {}
+    path, ext = found
+    kind = "pdf" if ext == ".pdf" else "pptx"
+    file_index.set_ingestion(file_id, "running", kind=kind)
+    try:
+        sha = extract_cache.file_sha256(path)
+        cached = extract_cache.get(sha)
+        if cached and cached.get("complete", True) and cached.get("language"):
+            units = cached.get("units", [])
+            language = cached["language"]
+        else:
+            if kind == "pdf":
+                raw, _ = extract.extract_pdf_pages(path, char_budget=None)
+            else:
+                raw = _slides(path)
+            units = [extract_cache.normalize_text(u) for u in raw]
+            language = detect_language("\n".join(units))
+            extract_cache.put(sha, kind, units, complete=True, pages=len(units), language=language)
+        file_index.set_ingestion(file_id, "ready", kind=kind, pages=len(units),
+                                 chars=sum(len(u) for u in units), language=language, sha256=sha)
+    except Exception as e:
+        print(f"[PREEXTRACT WARN] {file_id}: {e}")
+        file_index.set_ingestion(file_id, "failed", kind=kind, error=str(e))
+    return file_index.ingestion(file_id) or {}
+
+
+def submit(file_id: str) -> Dict[str, Any]:
+    """Queue ingestion of file_id; returns the record as queued."""
+    file_index.set_ingestion(file_id, "queued")
+    _pool.submit(ingest, file_id)
+    return file_index.ingestion(file_id) or {}
@@ -0,0 +1,168 @@
+# app/question_bank.py
+# Generated worksheet items, kept for reuse (WorksheetRequest.reuse).
+#   - every item the model writes is stored in FILE_STORE/_question_bank/bank.sqlite,
+#     keyed by the source content hash, grade bands, difficulty, language and type,
+#     with a hashed TF-IDF vector of the question (scorer.py tokens and IDF weights)
+#   - the source hash covers the uploads' content sha256s only, so the same
+#     textbook matches under any file_id or file name
+#   - fill_sets() hands each set up to questions_per_set stored items, picked by
+#     relevance to the source and distance from the items already picked (MMR);
+#     an item goes to at most one set per request, and less-used items come first
+#   - near-duplicates (cosine >= DUPLICATE_COSINE) of a stored item are not added
+
+import os, time, json, zlib, sqlite3, hashlib, threading
+from collections import Counter
+from typing import Dict, Any, List, Optional, Sequence
+import numpy as np
+from . import scorer
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+QUESTION_BANK_PATH = os.environ.get("QUESTION_BANK_PATH", os.path.join(FILE_ROOT, "_question_bank", "bank.sqlite"))
+VECTOR_DIM = 512
+DUPLICATE_COSINE = 0.95
+MMR_LAMBDA = 0.7     # relevance vs. distance from the items already picked
+USE_PENALTY = 0.02   # per earlier reuse, so a bank does not keep serving the same items
+
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(QUESTION_BANK_PATH), exist_ok=True)
+        conn = sqlite3.connect(QUESTION_BANK_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            " id INTEGER PRIMARY KEY, source_sha TEXT, grades TEXT, difficulty TEXT, language TEXT,"
+            " type TEXT, q_hash TEXT, item TEXT, vector BLOB, uses INTEGER DEFAULT 0, created REAL,"
+            " UNIQUE (source_sha, grades, difficulty, language, q_hash))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS questions_key"
+            " ON questions (source_sha, grades, difficulty, language, type)"
+        )
+        _local.conn = conn
+    return conn
+
+
+def source_hash(file_shas: Sequence[str]) -> str:
+    """Bank key of a request's sources: their content sha256s, order and repeats ignored."""
+    return hashlib.sha256("\n".join(sorted(set(file_shas))).encode("utf-8")).hexdigest()
+
+
+def grades_key(grade_bands: Optional[Sequence[str]]) -> str:
+    return ",".join(sorted(g.strip() for g in grade_bands or []))
+
+
+def vectors(texts: Sequence[str]) -> np.ndarray:
+    """(len(texts), VECTOR_DIM) L2-normalized TF-IDF vectors, terms hashed into VECTOR_DIM buckets."""
+    model = scorer.get_model()
+    out = np.zeros((len(texts), VECTOR_DIM), dtype=np.float32)
+    for r, text in enumerate(texts):
+        for term, n in Counter(scorer.tokens(text)).items():
+            j = model.vocab.get(term)
+            w = float(model.idf[j]) if j is not None else model.oov_idf
+            out[r, zlib.crc32(term.encode("utf-8")) % VECTOR_DIM] += (1 + np.log(n)) * w
+    norms = np.linalg.norm(out, axis=1)
+    norms[norms == 0] = 1.0
+    return out / norms[:, None]
+
+
+def _q_hash(q: str) -> str:
+    return hashlib.sha256(" ".join(q.lower().split()).encode("utf-8")).hexdigest()
+
+
+# ---------- Storing ----------
+def add(source_sha: str, grade_bands: Optional[Sequence[str]], difficulty: str, language: str,
+        items: List[Dict[str, Any]]) -> int:
+    """Store generated items; returns how many were new (exact or near duplicates are skipped)."""
+    items = [x for x in items if (x.get("q") or "").strip()]
+    if not items:
+        return 0
+    grades, language = grades_key(grade_bands), language.lower()
+    conn = _conn()
+    rows = conn.execute(
+        "SELECT vector FROM questions WHERE source_sha = ? AND grades = ? AND difficulty = ? AND language = ?",
+        (source_sha, grades, difficulty, language),
+    ).fetchall()
+    stored = [np.frombuffer(v, dtype=np.float32) for (v,) in rows]
+    vecs = vectors([x["q"] for x in items])
+    added = 0
+    with conn:
+        for item, vec in zip(items, vecs):
+            if stored and float(np.max(np.vstack(stored) @ vec)) >= DUPLICATE_COSINE:
+                continue
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO questions (source_sha, grades, difficulty, language, type, q_hash,"
+                " item, vector, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (source_sha, grades, difficulty, language, item.get("type") or "", _q_hash(item["q"]),
+                 json.dumps(item, ensure_ascii=False), vec.tobytes(), time.time()),
+            )
+            if cur.rowcount:
+                stored.append(vec)
+                added += 1
+    return added
+
+
+# ---------- Reuse ----------
+def _pick(cands: List[Dict[str, Any]], rel: np.ndarray, k: int, taken: set) -> List[int]:
+    """Indices of up to k candidates by maximal marginal relevance, skipping taken ids."""
+    picked: List[int] = []
+    while len(picked) < k:
+        best, best_score = None, None
+        for n, c in enumerate(cands):
+            if c["id"] in taken or n in picked:
+                continue
+            redundancy = max((float(c["vec"] @ cands[p]["vec"]) for p in picked), default=0.0)
+            s = MMR_LAMBDA * rel[n] - (1 - MMR_LAMBDA) * redundancy - USE_PENALTY * c["uses"]
+            if best_score is None or s > best_score:
+                best, best_score = n, s
+        if best is None:
+            break
+        picked.append(best)
+        taken.add(cands[best]["id"])
+    return picked
+
+
+def fill_sets(source_sha: str, context: str, grade_bands: Optional[Sequence[str]], language: str, diffs: List[str],
+              per_set: int, question_mix: Optional[Dict[str, int]] = None) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    {set_no: stored items} for every set the bank can contribute to, at most
+    per_set items each (and at most question_mix[type] of each type when a mix
+    is given). No item is given to two sets; the chosen items' use counts go up.
+    """
+    grades = grades_key(grade_bands)
+    conn = _conn()
+    ctx_vec = vectors([context])[0]
+    by_diff: Dict[str, List[Dict[str, Any]]] = {}
+    for diff in set(diffs):
+        rows = conn.execute(
+            "SELECT id, type, item, vector, uses FROM questions"
+            " WHERE source_sha = ? AND grades = ? AND difficulty = ? AND language = ?",
+            (source_sha, grades, diff, language.lower()),
+        ).fetchall()
+        by_diff[diff] = [{"id": r[0], "type": r[1], "item": json.loads(r[2]),
+                          "vec": np.frombuffer(r[3], dtype=np.float32), "uses": r[4]} for r in rows]
+
+    taken: set = set()
+    out: Dict[int, List[Dict[str, Any]]] = {}
+    for i, diff in enumerate(diffs, start=1):
+        cands = by_diff[diff]
+        if not cands:
+            continue
+        rel = np.vstack([c["vec"] for c in cands]) @ ctx_vec
+        if question_mix:
+            chosen = []
+            for qtype, count in question_mix.items():
+                sub = [n for n, c in enumerate(cands) if c["type"] == qtype]
+                picked = _pick([cands[n] for n in sub], rel[sub], min(count, per_set - len(chosen)), taken)
+                chosen += [sub[p] for p in picked]
+        else:
+            chosen = _pick(cands, rel, per_set, taken)
+        if chosen:
+            out[i] = [cands[n]["item"] for n in chosen]
+    if taken:
+        with conn:
+            conn.executemany("UPDATE questions SET uses = uses + 1 WHERE id = ?", [(x,) for x in taken])
+    return out
@@ -12,6 +12,11 @@ class WorksheetRequest(BaseModel):
     questions_per_set: int = Field(..., gt=1, le=50)
     question_mix: Optional[Dict[str, int]] = Field(default=None, description='e.g., {"mcq":3,"short":2,"diagram":1}')
     target_language: str = Field(default="en")
+    bypass_cache: bool = Field(default=False, description="Skip the LLM response cache and regenerate")
+    booklet: bool = Field(default=False, description="Also render every set into one combined booklet PDF")
+    answer_key: bool = Field(default=False, description="Also render an answer-key PDF (answers and rubrics of every set)")
+    single_call: bool = Field(default=False, description="Generate every set in one model call (the source context is sent once); sets failing validation are regenerated one by one")
+    reuse: bool = Field(default=False, description="Fill sets from the question bank (items generated earlier for the same source, grades, difficulty and language) and generate only the missing questions")
 
 class WorksheetItem(BaseModel):
     type: str
@@ -25,7 +30,16 @@ class WorksheetSetResponse(BaseModel):
     difficulty: Difficulty
     items: List[WorksheetItem]
     printable_pdf_url: str
+    printable_pdf_status: str = "ready"  # pending|ready|failed, see GET /files/{id}/status
+    from_bank: int = 0  # items reused from the question bank
+    generated: int = 0  # items written by the model for this request
 
 class WorksheetResponse(BaseModel):
     worksheet_id: str
     sets: List[WorksheetSetResponse]
+    cache_hit: bool = False  # every set served from the LLM response cache
+    booklet_pdf_url: Optional[str] = None  # only when requested
+    answer_key_pdf_url: Optional[str] = None  # only when requested
+    printable_status: str = "ready"  # pending|ready|failed, shared by every PDF of the worksheet
+    from_bank: int = 0  # over every set
+    generated: int = 0
@@ -1,22 +1,23 @@
 import os, time, random, string, json
-from typing import List, Dict, Any
-from PyPDF2 import PdfReader
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+from pydantic import ValidationError
 from .metrics_logger import (
-    log_metric_entry, compute_accuracy, compute_quality, validate_plan
+    log_metric_entry, evaluate_plan, validate_plan
 )
 
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 from .schemas import StudyPlanRequest, StudyPlanResponse, WeeklyItem
+from .render import render_plan_bytes, plan_file_name
+from . import artifacts, tracing, translation, extract_cache, extract, eval_queue, llm_cache, aio, stream_parse, ingest, file_index
 
 FILE_ROOT = os.environ.get("FILE_STORE", "/data")
 OPENAI_MODEL = os.environ.get("STUDYPLAN_MODEL", "gpt-4o-mini")
+SYLLABUS_CHAR_BUDGET = 15000  # planning prompt carries at most 15k chars of syllabus
+# longer syllabi go through map-reduce ingestion (ingest.py) up to this many chars
+INGEST_MAX_CHARS = int(os.environ.get("INGEST_MAX_CHARS", "600000"))
 
-_client = OpenAI()
+_client = AsyncOpenAI()
 
 # --------- Utils ---------
 def make_id(prefix="plan"):
@@ -24,95 +25,42 @@ def make_id(prefix="plan"):
     rnd = "".join(random.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(6))
     return f"{prefix}_{ts}{rnd}"
 
-def read_pdf_text(file_id: str) -> str:
-    # find by any extension (pdf required for studyplan)
-    path_pdf = os.path.join(FILE_ROOT, f"{file_id}.pdf")
-    if not os.path.exists(path_pdf):
-        raise FileNotFoundError(f"Syllabus PDF not found at {path_pdf}")
-    reader = PdfReader(path_pdf)
-    chunks = []
-    for page in reader.pages:
-        try:
-            chunks.append(page.extract_text() or "")
-        except Exception:
-            pass
-    return "\n".join(chunks).strip()
-
-def grades_compact(grades: List[str]) -> str:
-    gs = sorted([g.strip() for g in grades if g.strip()])
-    if not gs: return "unknown"
-    # "3,4,5" -> "3to5" if contiguous, else "3-4-6"
-    try:
-        nums = sorted(set(int(x) for x in gs))
-        if nums == list(range(nums[0], nums[-1] + 1)):
-            return f"{nums[0]}to{nums[-1]}"
-        return "-".join(str(x) for x in nums)
-    except:
-        return "-".join(gs)
-
-# basic mapping to choose a likely font family; missing fonts will trigger .md fallback
-LANG_FONT = {
-    "en": ("NotoSans-Regular.ttf",),
-    "hi": ("NotoSansDevanagari-Regular.ttf",),
-    "mr": ("NotoSansDevanagari-Regular.ttf",),
-    "ta": ("NotoSansTamil-Regular.ttf",),
-}
-
-def get_font_for_lang(lang: str):
-    fonts_dir = os.path.join(os.path.dirname(__file__), "assets", "fonts")
-    for fname in LANG_FONT.get(lang, LANG_FONT["en"]):
-        p = os.path.join(fonts_dir, fname)
-        if os.path.exists(p):
-            return p
-    return None
-
-def translate_text(text: str, lang: str) -> str:
+def read_pdf_text(file_id: str, stats: Optional[Dict[str, int]] = None,
+                  char_budget: Optional[int] = SYLLABUS_CHAR_BUDGET) -> str:
+    # pdf required for studyplan
+    found = file_index.resolve(file_id, (".pdf",))
+    if found is None:
+        raise FileNotFoundError(f"Syllabus PDF not found at {os.path.join(FILE_ROOT, f'{file_id}.pdf')}")
+    path_pdf = found[0]
+    pages = extract_cache.cached_units(
+        path_pdf, "pdf", lambda p, budget: extract.extract_pdf_pages(p, char_budget=budget),
+        stats, char_budget=char_budget
+    )
+    return "\n".join(pages).strip()
+
+async def translate_text(text: str, lang: str) -> str:
     """
-    Use LLM to translate text into the target language.
+    Use LLM to translate text into the target language (via the translation memory).
     """
     if not text:
         return text
-    resp = _client.chat.completions.create(
-        model=OPENAI_MODEL,  # or use a smaller/cheaper model here
-        messages=[
-            {"role": "system", "content": f"You are a translator. Translate everything into {lang}. Do not explain, only translate."},
-            {"role": "user", "content": text}
-        ],
-        temperature=0.2
-    )
-    return resp.choices[0].message.content.strip()
+    return (await translation.translate_strings([text], lang))[text]
 
-def translate_plan(plan: Dict[str, Any], lang: str) -> Dict[str, Any]:
+async def translate_plan(plan: Dict[str, Any], lang: str, stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Translate all text fields in the plan JSON into the target language.
-    Keeps structure intact.
+    Keeps structure intact. Strings are deduplicated, looked up in the
+    translation memory and the rest sent as parallel batches. With the plan's
+    metrics entry as `stats`, the memory's hit rate and the calls saved are
+    recorded under stats["translation"].
     """
     if lang.lower() == "en":
         return plan  # no translation needed
 
-    translated = {}
-    translated["overview"] = translate_text(plan.get("overview", ""), lang)
-
-    weekly = []
-    for wk in plan.get("weekly_outline", []):
-        new_wk = {}
-        new_wk["week"] = wk.get("week")
-        new_wk["topics"] = [translate_text(t, lang) for t in wk.get("topics", [])]
-        new_wk["activities"] = [translate_text(a, lang) for a in wk.get("activities", [])]
-        new_wk["assessment"] = translate_text(wk.get("assessment", ""), lang)
-        if wk.get("homework"):
-            new_wk["homework"] = translate_text(wk.get("homework", ""), lang)
-        # resources
-        new_wk["resources"] = []
-        for r in wk.get("resources", []):
-            new_wk["resources"].append({
-                "title": translate_text(r.get("title",""), lang),
-                "platform": r.get("platform",""),  # keep platform names as-is
-                "search_query": translate_text(r.get("search_query",""), lang)
-            })
-        weekly.append(new_wk)
-
-    translated["weekly_outline"] = weekly
+    counts: Dict[str, Any] = {}
+    translated = await translation.translate_plan(plan, lang, stats=counts)
+    if stats is not None:
+        stats["translation"] = counts
     return translated
 
 
@@ -135,8 +83,10 @@ Examples:
 Provide 2-4 suggestions per week, each with: title, platform, search_query.
 """
 
-def build_messages(syllabus_text: str, req: StudyPlanRequest) -> list:
+def build_messages(syllabus_text: str, req: StudyPlanRequest, condensed: bool = False) -> list:
     grades_str = ", ".join(req.grades)
+    source_label = ("SYLLABUS TOPIC OUTLINE (condensed from the full document, in order)"
+                    if condensed else "SYLLABUS (raw text)")
     return [
         {"role": "system",
          "content": f"""{PEDAGOGY_PRINCIPLES}
@@ -151,8 +101,8 @@ Week object keys: week (int), topics (array of strings), activities (array of st
 Keep topics concise; align with the syllabus text supplied.
 """},
         {"role": "user",
-         "content": f"""SYLLABUS (raw text):
-\"\"\"{syllabus_text[:15000]}\"\"\"  # first 15k chars to be safe
+         "content": f"""{source_label}:
+\"\"\"{syllabus_text[:SYLLABUS_CHAR_BUDGET]}\"\"\"  # first 15k chars to be safe
 
 REQUEST:
 - grades: {grades_str}
@@ -167,155 +117,101 @@ TASK:
 """}
     ]
 
-def llm_plan(syllabus_text: str, req: StudyPlanRequest) -> Dict[str, Any]:
-    messages = build_messages(syllabus_text, req)
-    resp = _client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=messages,
-        temperature=0.4,
-        response_format={"type": "json_object"},
-    )
-    content = resp.choices[0].message.content
-    data = json.loads(content)
+async def prepare_source(syllabus_text: str, stats: Optional[Dict[str, Any]] = None) -> Tuple[str, bool]:
+    """
+    Text for the planning prompt. Short syllabi are passed through; longer ones
+    are condensed to a topic outline by map-reduce instead of being truncated.
+    Returns (source_text, condensed).
+    """
+    if len(syllabus_text) <= SYLLABUS_CHAR_BUDGET:
+        return syllabus_text, False
+    with tracing.span("ingest", stats):
+        return await ingest.condense(syllabus_text, SYLLABUS_CHAR_BUDGET, stats), True
+
+async def llm_plan(syllabus_text: str, req: StudyPlanRequest, stats: Optional[Dict[str, Any]] = None,
+                   condensed: bool = False) -> Dict[str, Any]:
+    messages = build_messages(syllabus_text, req, condensed)
+    with tracing.span("llm", stats):
+        content, hit = await llm_cache.chat_completion(
+            _client,
+            model=OPENAI_MODEL,
+            messages=messages,
+            temperature=0.4,
+            response_format={"type": "json_object"},
+            bypass=req.bypass_cache,
+        )
+    if stats is not None:
+        stats["llm_cache_hit"] = hit
+    try:
+        data = json.loads(content)
+    except ValueError:
+        if hit:
+            await llm_cache.forget(OPENAI_MODEL, messages, 0.4, {"type": "json_object"})
+        raise
     return data
 
-# --------- PDF / MD rendering with naming ---------
-def render_plan_file(plan: Dict[str, Any], req: StudyPlanRequest, plan_id: str) -> str:
-    # filename: ai-studyplan-[gradeband]-[weeks]w-<lang>.(pdf|md)
-    gb = grades_compact(req.grades)
-    lang = req.target_language.lower()
-    base = f"ai-studyplan-{gb}-{req.duration_weeks}w-{lang}"
-    font_path = get_font_for_lang(lang)
-
-    if lang != "en" and not font_path:
-        # fallback to markdown if we don't have a font for this language
-        out_md = os.path.join(FILE_ROOT, f"{base}.md")
-        with open(out_md, "w", encoding="utf-8") as f:
-            f.write(f"# Study Plan ({gb}, {req.duration_weeks} weeks) [{lang}]\n\n")
-            f.write(plan.get("overview", "") + "\n\n")
-            for wk in plan.get("weekly_outline", []):
-                f.write(f"## Week {wk.get('week')}\n")
-                f.write(f"**Topics:** {', '.join(wk.get('topics', []))}\n\n")
-                f.write("**Activities:**\n")
-                for a in wk.get("activities", []):
-                    f.write(f"- {a}\n")
-                f.write(f"\n**Assessment:** {wk.get('assessment','')}\n")
-                hw = wk.get("homework")
-                if hw: f.write(f"\n**Homework:** {hw}\n")
-                res = wk.get("resources", [])
-                if res:
-                    f.write("\n**Resources:**\n")
-                    for r in res:
-                        f.write(f"- {r.get('title')} ({r.get('platform')}): search \"{r.get('search_query')}\"\n")
-                f.write("\n")
-        return out_md
-
-    # PDF
-    out_pdf = os.path.join(FILE_ROOT, f"{base}.pdf")
-    c = canvas.Canvas(out_pdf, pagesize=A4)
-    width, height = A4
-
-    # font setup
-    if font_path:
-        try:
-            pdfmetrics.registerFont(TTFont("BodyFont", font_path))
-            font_name = "BodyFont"
-        except Exception:
-            font_name = "Helvetica"
-    else:
-        font_name = "Helvetica"
-
-    def draw_wrapped(text: str, x: int, y: int, max_width: int, leading: int = 14):
-        # naive wrapping
-        from textwrap import wrap
-        for line in text.splitlines():
-            chunks = wrap(line, width= int(max_width/7)) or [""]
-            for ch in chunks:
-                c.drawString(x, y, ch)
-                y -= leading
-        return y
-
-    margin = 40
-    y = height - margin - 10
-
-    c.setFont(font_name, 16); c.drawString(margin, y, "Study Plan"); y -= 24
-    c.setFont(font_name, 10); c.drawString(margin, y, f"Grades: {', '.join(req.grades)}  Weeks: {req.duration_weeks}  Language: {lang}"); y -= 18
-    c.setFont(font_name, 12); y = draw_wrapped(plan.get("overview",""), margin, y, width - 2*margin); y -= 10
-
-    for wk in plan.get("weekly_outline", []):
-        if y < 120:
-            c.showPage(); y = height - margin
-            c.setFont(font_name, 12)
-        c.setFont(font_name, 13); c.drawString(margin, y, f"Week {wk.get('week')}"); y -= 16
-
-        c.setFont(font_name, 11)
-        y = draw_wrapped("Topics: " + ", ".join(wk.get("topics", [])), margin, y, width-2*margin)
-        y = draw_wrapped("Activities:", margin, y, width-2*margin)
-        for a in wk.get("activities", []):
-            y = draw_wrapped(f" • {a}", margin+12, y, width-2*margin)
-        y = draw_wrapped("Assessment: " + wk.get("assessment",""), margin, y, width-2*margin)
-        hw = wk.get("homework")
-        if hw:
-            y = draw_wrapped("Homework: " + hw, margin, y, width-2*margin)
-        res = wk.get("resources", [])
-        if res:
-            y = draw_wrapped("Resources:", margin, y, width-2*margin)
-            for r in res:
-                y = draw_wrapped(f" • {r.get('title')} ({r.get('platform')}): search \"{r.get('search_query')}\"", margin+12, y, width-2*margin)
-        y -= 6
-
-    c.showPage(); c.save()
-    return out_pdf
-
 # --------- Public entry ----------
-def generate_study_plan(req: StudyPlanRequest) -> StudyPlanResponse:
-    entry = {
+def _new_entry(req: StudyPlanRequest) -> Dict[str, Any]:
+    return {
         "agent": "studyplan_agent",
+        "trace_id": tracing.trace_id(),
         "grades": req.grades,
         "language": req.target_language,
         "success": False,
         "json_valid": False,
         "accuracy": 0.0,
         "quality_score": 0.0,
-        "response_time": 0.0
+        "response_time": 0.0,
+        "extract_cache_hits": 0,
+        "extract_cache_misses": 0
     }
 
-    try:
-        start = time.time()
-        syllabus_text = read_pdf_text(req.file_id)
-        plan_data = llm_plan(syllabus_text, req)
-        duration = time.time() - start
+def to_weekly_item(wk: Dict[str, Any]) -> WeeklyItem:
+    return WeeklyItem(
+        week=wk.get("week"),
+        topics=wk.get("topics", []),
+        activities=wk.get("activities", []),
+        assessment=wk.get("assessment", ""),
+        homework=wk.get("homework"),
+        resources=wk.get("resources", [])
+    )
 
-        entry["response_time"] = round(duration, 2)
+async def _finish_plan(plan_data: Dict[str, Any], req: StudyPlanRequest, entry: Dict[str, Any],
+                       syllabus_text: str, start: float, plan_id: str) -> Tuple[str, str]:
+    """
+    Validate, queue rendering and evaluation for a finished plan.
+    Returns (printable URL, file status); the file itself is rendered in the background.
+    """
+    entry["response_time"] = round(time.time() - start, 2)
+    with tracing.span("validate", entry):
         entry["json_valid"] = validate_plan(req, plan_data)
 
-        # --- Compute Accuracy (real syllabus-topic overlap) ---
-        entry["accuracy"] = compute_accuracy(syllabus_text, plan_data)
+    # stored under plan_id in the artifact index, downloaded as out_name
+    out_name = plan_file_name(req)
+    file_status = await aio.run_blocking(artifacts.submit, plan_id, out_name, render_plan_bytes, plan_data, req)
 
-        # --- Compute Quality (real LLM rubric evaluation) ---
-        entry["quality_score"] = compute_quality(plan_data)
+    entry["success"] = True
+    entry["output_file"] = out_name
 
-        plan_id = make_id()
-        out_path = render_plan_file(plan_data, req, plan_id)
-        out_name = os.path.basename(out_path)
-        printable_url = f"/files/{out_name}"
+    # --- Accuracy (syllabus-plan relevance) + Quality, off the request path ---
+    eval_queue.submit(entry, lambda: evaluate_plan(syllabus_text, plan_data))
+    return artifacts.file_url(plan_id, out_name), file_status
 
-        entry["success"] = True
-        entry["output_file"] = out_name
-        log_metric_entry(entry)
+async def generate_study_plan(req: StudyPlanRequest) -> StudyPlanResponse:
+    entry = _new_entry(req)
+
+    try:
+        start = time.time()
+        with tracing.span("extract", entry):
+            syllabus_text = await aio.run_cpu(read_pdf_text, req.file_id, stats=entry, char_budget=INGEST_MAX_CHARS)
+        source_text, condensed = await prepare_source(syllabus_text, stats=entry)
+        plan_data = await llm_plan(source_text, req, stats=entry, condensed=condensed)
+
+        plan_id = make_id()
+        printable_url, file_status = await _finish_plan(plan_data, req, entry, syllabus_text, start, plan_id)
 
         # build final structured response
-        weekly = [
-            WeeklyItem(
-                week=wk.get("week"),
-                topics=wk.get("topics", []),
-                activities=wk.get("activities", []),
-                assessment=wk.get("assessment", ""),
-                homework=wk.get("homework"),
-                resources=wk.get("resources", [])
-            )
-            for wk in plan_data.get("weekly_outline", [])
-        ]
+        weekly = [to_weekly_item(wk) for wk in plan_data.get("weekly_outline", [])]
 
         return StudyPlanResponse(
             plan_id=plan_id,
@@ -324,7 +220,9 @@ def generate_study_plan(req: StudyPlanRequest) -> StudyPlanResponse:
             target_language=req.target_language,
             overview=plan_data.get("overview", ""),
             weekly_outline=weekly,
-            printable_file_url=printable_url
+            printable_file_url=printable_url,
+            printable_file_status=file_status,
+            cache_hit=entry.get("llm_cache_hit", False)
         )
 
     except Exception as e:
@@ -333,3 +231,85 @@ def generate_study_plan(req: StudyPlanRequest) -> StudyPlanResponse:
         raise
 
 
+# --------- Streaming (SSE) entry ----------
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_study_plan(req: StudyPlanRequest) -> AsyncIterator[str]:
+    """
+    Server-Sent Events version of generate_study_plan. The syllabus is read
+    before returning so missing files still fail with a normal HTTP error;
+    the returned generator then emits
+      meta     {plan_id}
+      overview {overview}
+      week     one validated WeeklyItem as soon as its object is complete
+      done     {plan_id, printable_file_url, printable_file_status, weeks, json_valid, cache_hit}
+      error    {detail}  if anything fails mid-stream
+    """
+    entry = _new_entry(req)
+    entry["stream"] = True
+    start = time.time()
+    try:
+        with tracing.span("extract", entry):
+            syllabus_text = await aio.run_cpu(read_pdf_text, req.file_id, stats=entry, char_budget=INGEST_MAX_CHARS)
+    except Exception as e:
+        entry["error"] = str(e)
+        log_metric_entry(entry)
+        raise
+
+    async def events() -> AsyncIterator[str]:
+        plan_id = make_id()
+        parser = stream_parse.PlanStreamParser()
+        meta: Dict[str, Any] = {}
+        sent_weeks = 0
+        try:
+            yield sse("meta", {"plan_id": plan_id})
+            source_text, condensed = await prepare_source(syllabus_text, stats=entry)
+            messages = build_messages(source_text, req, condensed)
+            # includes the time the client takes to read each event
+            with tracing.span("llm_stream", entry):
+                async for delta in llm_cache.stream_chat_completion(
+                    _client,
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    temperature=0.4,
+                    response_format={"type": "json_object"},
+                    bypass=req.bypass_cache,
+                    meta=meta,
+                ):
+                    if "first_token_time" not in entry:
+                        entry["first_token_time"] = round(time.time() - start, 2)
+                    for kind, value in parser.feed(delta):
+                        if kind == "overview":
+                            yield sse("overview", {"overview": value})
+                        elif kind == "week":
+                            try:
+                                item = to_weekly_item(value)
+                            except ValidationError as e:
+                                print(f"[STREAM WARN] invalid week skipped: {e}")
+                                continue
+                            sent_weeks += 1
+                            yield sse("week", item.model_dump())
+
+            entry["llm_cache_hit"] = meta.get("cache_hit", False)
+            try:
+                plan_data = json.loads(parser.buf)
+            except ValueError:
+                if entry["llm_cache_hit"]:
+                    await llm_cache.forget(OPENAI_MODEL, messages, 0.4, {"type": "json_object"})
+                raise
+            printable_url, file_status = await _finish_plan(plan_data, req, entry, syllabus_text, start, plan_id)
+            yield sse("done", {
+                "plan_id": plan_id,
+                "printable_file_url": printable_url,
+                "printable_file_status": file_status,
+                "weeks": sent_weeks,
+                "json_valid": entry["json_valid"],
+                "cache_hit": entry["llm_cache_hit"],
+            })
+        except Exception as e:
+            entry["error"] = str(e)
+            log_metric_entry(entry)
+            yield sse("error", {"detail": f"studyplan error: {e}"})
+
+    return events()
@@ -0,0 +1,30 @@
+# app/aio.py
+# Async helpers shared by the agent pipeline:
+#   - llm_slot(): semaphore capping in-flight model calls per worker (LLM_CONCURRENCY)
+#   - run_blocking(): file / SQLite I/O off the event loop
+#   - run_cpu(): CPU-heavy work (PDF parsing, reportlab rendering) on a dedicated pool
+
+import os, asyncio, functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "16"))
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+T = TypeVar("T")
+
+_llm_sem = asyncio.Semaphore(LLM_CONCURRENCY)
+_cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+
+
+def llm_slot() -> asyncio.Semaphore:
+    return _llm_sem
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable[..., T], *args, **kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_pool, functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,148 @@
+# app/extract.py
+# Single PDF text extraction interface with selectable backends.
+#   - "pymupdf" (fitz): fast C parser, default
+#   - "pypdf2": pure-python fallback
+# Large documents are split into page ranges that run in a process pool; pages
+# are consumed in order and extraction stops once `char_budget` characters
+# have been collected, since the prompt only uses the head of the document.
+
+import os, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple, Callable, Dict
+
+PDF_BACKEND = os.environ.get("PDF_BACKEND", "pymupdf").lower()
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = int(os.environ.get("EXTRACT_PAGES_PER_TASK", "8"))
+# below this many pages the pool's IPC costs more than it saves
+POOL_MIN_PAGES = int(os.environ.get("EXTRACT_POOL_MIN_PAGES", "24"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+# ---------- Backends ----------
+def _pymupdf_count(path: str) -> int:
+    import fitz  # pymupdf
+    with fitz.open(path) as doc:
+        return len(doc)
+
+
+def _pymupdf_range(path: str, start: int, end: int) -> List[str]:
+    import fitz  # pymupdf
+    out = []
+    with fitz.open(path) as doc:
+        for i in range(start, min(end, len(doc))):
+            try:
+                out.append(doc[i].get_text("text") or "")
+            except Exception:
+                out.append("")
+    return out
+
+
+def _pypdf2_count(path: str) -> int:
+    from PyPDF2 import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def _pypdf2_range(path: str, start: int, end: int) -> List[str]:
+    from PyPDF2 import PdfReader
+    reader = PdfReader(path)
+    out = []
+    for i in range(start, min(end, len(reader.pages))):
+        try:
+            out.append(reader.pages[i].extract_text() or "")
+        except Exception:
+            out.append("")
+    return out
+
+
+BACKENDS: Dict[str, Tuple[Callable[[str], int], Callable[[str, int, int], List[str]]]] = {
+    "pymupdf": (_pymupdf_count, _pymupdf_range),
+    "pypdf2": (_pypdf2_count, _pypdf2_range),
+}
+
+
+def available_backends() -> List[str]:
+    names = []
+    for name in BACKENDS:
+        try:
+            __import__("fitz" if name == "pymupdf" else "PyPDF2")
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    name = (backend or PDF_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{name}', expected one of {list(BACKENDS)}")
+    avail = available_backends()
+    if name not in avail:
+        if not avail:
+            raise RuntimeError("No PDF backend installed (need pymupdf or PyPDF2)")
+        print(f"[EXTRACT WARN] backend '{name}' not installed, using '{avail[0]}'")
+        name = avail[0]
+    return name
+
+
+def _run_range(backend: str, path: str, start: int, end: int) -> List[str]:
+    return BACKENDS[backend][1](path, start, end)
+
+
+# ---------- Pool ----------
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: uvicorn workers run threads, forking them is unsafe
+        _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+# ---------- Public API ----------
+def extract_pdf_pages(path: str, backend: Optional[str] = None, char_budget: Optional[int] = None,
+                      parallel: Optional[bool] = None) -> Tuple[List[str], bool]:
+    """
+    Extract per-page text from a PDF.
+    Returns (pages, complete); complete is False when extraction stopped early
+    because `char_budget` characters were already collected.
+    """
+    backend = resolve_backend(backend)
+    count_fn, range_fn = BACKENDS[backend]
+    n_pages = count_fn(path)
+    ranges = [(s, min(s + PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, PAGES_PER_TASK)]
+    if parallel is None:
+        parallel = EXTRACT_WORKERS > 1 and n_pages >= POOL_MIN_PAGES
+
+    pages: List[str] = []
+    chars = 0
+
+    def budget_full() -> bool:
+        return char_budget is not None and chars >= char_budget
+
+    if not parallel:
+        for start, end in ranges:
+            for text in range_fn(path, start, end):
+                pages.append(text)
+                chars += len(text)
+            if budget_full():
+                return pages, len(pages) >= n_pages
+        return pages, True
+
+    # keep at most one wave of ranges in flight so an early stop wastes little work
+    pool = _get_pool()
+    in_flight = []
+    next_idx = 0
+    while next_idx < len(ranges) or in_flight:
+        while next_idx < len(ranges) and len(in_flight) < EXTRACT_WORKERS:
+            start, end = ranges[next_idx]
+            in_flight.append(pool.submit(_run_range, backend, path, start, end))
+            next_idx += 1
+        for text in in_flight.pop(0).result():
+            pages.append(text)
+            chars += len(text)
+        if budget_full():
+            for fut in in_flight:
+                fut.cancel()
+            return pages, len(pages) >= n_pages
+    return pages, True
@@ -0,0 +1,109 @@
+# app/file_index.py
+# file_id -> uploaded file, without probing FILE_STORE.
+#   - the gateway's /upload router records every upload in FILE_STORE/file_index.sqlite
+#     (name relative to FILE_STORE, kind, size, sha256); resolve() is a primary-key
+#     lookup, memoized per worker and re-checked with a single stat
+#   - on a miss (files copied onto the volume by hand, uploads from before the
+#     index existed) the old extension probe runs once and its result is recorded
+# Lookup only: registering uploads and their ingestion state is the gateway's
+# (gateway/app/utils/file_index.py) and the image agent's (preextract.py) job.
+
+import os, time, sqlite3, threading
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+FILE_INDEX_PATH = os.environ.get("FILE_INDEX_PATH", os.path.join(FILE_ROOT, "file_index.sqlite"))
+_MEMO_MAX = 50000
+
+KINDS = {
+    ".pdf": "pdf", ".pptx": "slides", ".ppt": "slides",
+    ".png": "image", ".jpg": "image", ".jpeg": "image", ".webp": "image",
+    ".wav": "audio", ".mp3": "audio", ".m4a": "audio",
+}
+
+_local = threading.local()
+_memo: Dict[str, str] = {}  # file_id -> name relative to FILE_ROOT
+_memo_lock = threading.Lock()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(FILE_INDEX_PATH), exist_ok=True)
+        conn = sqlite3.connect(FILE_INDEX_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_index ("
+            " file_id TEXT PRIMARY KEY, path TEXT, ext TEXT, kind TEXT, size INTEGER,"
+            " sha256 TEXT, uploaded REAL)"
+        )
+        _local.conn = conn
+    return conn
+
+
+def lookup(file_id: str) -> Optional[Dict[str, Any]]:
+    """The manifest row of file_id: {file_id, path, ext, kind, size, sha256, uploaded}, or None."""
+    try:
+        row = _conn().execute(
+            "SELECT file_id, path, ext, kind, size, sha256, uploaded FROM file_index WHERE file_id = ?", (file_id,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"[FILE INDEX WARN] lookup failed: {e}")
+        return None
+    if row is None:
+        return None
+    return dict(zip(("file_id", "path", "ext", "kind", "size", "sha256", "uploaded"), row))
+
+
+def record(file_id: str, name: str, size: Optional[int] = None, sha256: Optional[str] = None):
+    """Add or replace the manifest row of file_id (a file resolve() found by probing)."""
+    ext = os.path.splitext(name)[1].lower()
+    try:
+        with _conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_index (file_id, path, ext, kind, size, sha256, uploaded)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_id, name, ext, KINDS.get(ext, "other"), size, sha256, time.time()),
+            )
+    except sqlite3.Error as e:
+        print(f"[FILE INDEX WARN] could not record {file_id}: {e}")
+
+
+# ---------- Resolution ----------
+def _remember(file_id: str, name: str):
+    with _memo_lock:
+        if len(_memo) >= _MEMO_MAX:
+            _memo.clear()
+        _memo[file_id] = name
+
+
+def _scan(file_id: str, exts: Sequence[str], raw: bool) -> Optional[str]:
+    for ext in exts:
+        name = f"{file_id}{ext}"
+        if os.path.exists(os.path.join(FILE_ROOT, name)):
+            return name
+    if raw and os.path.exists(os.path.join(FILE_ROOT, file_id)):
+        return file_id
+    return None
+
+
+def resolve(file_id: str, exts: Sequence[str], raw: bool = False) -> Optional[Tuple[str, str]]:
+    """
+    (absolute path, lowercase extension) of the upload `file_id` whose extension is
+    one of `exts`, or None. raw=True also accepts a file named exactly file_id.
+    """
+    name = _memo.get(file_id)
+    if name is None:
+        row = lookup(file_id)
+        name = row["path"] if row is not None else None
+    accepted = name is not None and (os.path.splitext(name)[1].lower() in exts or (raw and name == file_id))
+    present = name is not None and os.path.exists(os.path.join(FILE_ROOT, name))
+    if not (accepted and present):
+        found = _scan(file_id, exts, raw)
+        if found is None:
+            return None
+        if not present:  # not indexed, or the indexed file is gone
+            record(file_id, found, os.path.getsize(os.path.join(FILE_ROOT, found)))
+        name = found
+    _remember(file_id, name)
+    return os.path.join(FILE_ROOT, name), os.path.splitext(name)[1].lower()
@@ -0,0 +1,136 @@
+# app/ingest.py
+# Map-reduce ingestion for syllabi longer than the planning prompt window.
+#   map:    split the text into chunks and extract an ordered topic list from each,
+#           concurrently. The map prompt does not depend on the request (grades,
+#           language, weeks), so its LLM cache entry is effectively keyed by the
+#           chunk's content hash and re-planning the same book skips this step.
+#   reduce: merge and deduplicate topics in document order and render them as a
+#           condensed outline that fits the single planning call.
+
+import os, re, json, asyncio
+from typing import List, Dict, Any, Optional, Tuple
+from openai import AsyncOpenAI
+from . import llm_cache
+
+INGEST_MODEL = os.environ.get("INGEST_MODEL", os.environ.get("STUDYPLAN_MODEL", "gpt-4o-mini"))
+CHUNK_CHARS = int(os.environ.get("INGEST_CHUNK_CHARS", "12000"))
+CHUNK_OVERLAP = int(os.environ.get("INGEST_CHUNK_OVERLAP", "300"))
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "8"))
+
+_client = AsyncOpenAI()
+
+MAP_SYS = """You extract the syllabus structure from a fragment of a school textbook or syllabus.
+Return STRICT JSON: {"topics": [{"title": "short topic name", "subtopics": ["...", "..."]}]}
+List topics in the order they appear. Keep titles short, keep the document's language.
+Ignore prefaces, indexes, page headers and exercises' answer keys. No other keys."""
+
+
+# ---------- Map ----------
+def chunk_text(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split on paragraph / line boundaries near `size` characters, with a small overlap."""
+    chunks, start, n = [], 0, len(text)
+    while start < n:
+        end = min(start + size, n)
+        if end < n:
+            cut = max(text.rfind("\n\n", start + size // 2, end), text.rfind("\n", start + size // 2, end))
+            if cut > start:
+                end = cut
+        chunks.append(text[start:end].strip())
+        if end >= n:
+            break
+        start = max(end - overlap, start + 1)
+    return [c for c in chunks if c]
+
+
+async def extract_topics(chunk: str) -> Tuple[List[Dict[str, Any]], bool]:
+    """Topics of one chunk; returns (topics, cache_hit)."""
+    messages = [
+        {"role": "system", "content": MAP_SYS},
+        {"role": "user", "content": f'FRAGMENT:\n"""{chunk}"""'},
+    ]
+    content, hit = await llm_cache.chat_completion(
+        _client,
+        model=INGEST_MODEL,
+        messages=messages,
+        temperature=0,
+        response_format={"type": "json_object"},
+    )
+    try:
+        topics = json.loads(content).get("topics", [])
+    except (ValueError, AttributeError):
+        topics = []
+    topics = [t for t in topics if isinstance(t, dict) and t.get("title")] if isinstance(topics, list) else []
+    if not topics:
+        # don't replay an empty answer for this chunk; ask again next time
+        await llm_cache.forget(INGEST_MODEL, messages, 0, {"type": "json_object"})
+    return topics, hit
+
+
+# ---------- Reduce ----------
+def _norm(title: str) -> str:
+    return re.sub(r"[\W_]+", " ", title.casefold()).strip()
+
+
+def merge_topics(per_chunk: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Deduplicate topics across chunks (chunk overlap repeats some), keeping first-seen order."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for topics in per_chunk:
+        for t in topics:
+            key = _norm(str(t["title"]))
+            if not key:
+                continue
+            cur = merged.setdefault(key, {"title": str(t["title"]).strip(), "subtopics": []})
+            seen = {_norm(s) for s in cur["subtopics"]}
+            for sub in t.get("subtopics") or []:
+                if isinstance(sub, str) and _norm(sub) and _norm(sub) not in seen:
+                    cur["subtopics"].append(sub.strip())
+                    seen.add(_norm(sub))
+    return list(merged.values())
+
+
+def _outline_line(i: int, title: str, subtopics: List[str]) -> str:
+    return f"{i}. {title}: " + "; ".join(subtopics) if subtopics else f"{i}. {title}"
+
+
+def render_outline(topics: List[Dict[str, Any]], max_chars: int) -> str:
+    """
+    Numbered outline of at most max_chars. If it doesn't fit, subtopics are
+    dropped from the end of the last topic backwards; if the titles alone are
+    still too long, the last whole lines are dropped.
+    """
+    subs = [list(t["subtopics"]) for t in topics]
+    lines = [_outline_line(i, t["title"], s) for i, (t, s) in enumerate(zip(topics, subs), 1)]
+    total = sum(len(l) for l in lines) + max(len(lines) - 1, 0)
+    for n in range(len(topics) - 1, -1, -1):
+        while total > max_chars and subs[n]:
+            subs[n].pop()
+            line = _outline_line(n + 1, topics[n]["title"], subs[n])
+            total += len(line) - len(lines[n])
+            lines[n] = line
+        if total <= max_chars:
+            break
+    while lines and total > max_chars:
+        total -= len(lines.pop()) + (1 if lines else 0)
+    return "\n".join(lines)
+
+
+# ---------- Public API ----------
+async def condense(text: str, max_chars: int, stats: Optional[Dict[str, Any]] = None) -> str:
+    """Condense a long syllabus into an ordered topic outline of at most max_chars."""
+    chunks = chunk_text(text)
+    sem = asyncio.Semaphore(max(1, INGEST_CONCURRENCY))
+
+    async def run(chunk: str):
+        async with sem:
+            return await extract_topics(chunk)
+
+    results = await asyncio.gather(*(run(c) for c in chunks))
+    topics = merge_topics([r[0] for r in results])
+    if stats is not None:
+        stats["ingest"] = {
+            "source_chars": len(text),
+            "chunks": len(chunks),
+            "chunk_cache_hits": sum(1 for r in results if r[1]),
+            "topics": len(topics),
+        }
+    return render_outline(topics, max_chars)
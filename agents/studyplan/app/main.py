@@ -1,9 +1,13 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from .schemas import StudyPlanRequest, StudyPlanResponse
-from .agent import generate_study_plan
+from .agent import generate_study_plan, stream_study_plan
 from .metrics_logger import aggregate_metrics
+from . import artifacts, tracing
 
 app = FastAPI(title="studyplan-agent", version="0.2.0")
+tracing.init("studyplan")
+app.middleware("http")(tracing.middleware)
 
 @app.get("/health", tags=["meta"])
 def health():
@@ -13,11 +17,36 @@ def health():
 def get_metrics():
     return aggregate_metrics()
 
+@app.get("/metrics/prometheus", tags=["performance"], response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Per-stage latency histograms in Prometheus text format."""
+    return PlainTextResponse(tracing.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+@app.get("/files/{artifact_id}/status", tags=["files"])
+def file_status(artifact_id: str):
+    """Rendering state of a plan's printable file (artifact_id is the plan_id)."""
+    st = artifacts.status(artifact_id)
+    if st is None:
+        raise HTTPException(status_code=404, detail=f"unknown file: {artifact_id}")
+    return st
+
 @app.post("/from-syllabus", response_model=StudyPlanResponse)
-def from_syllabus(body: StudyPlanRequest):
+async def from_syllabus(body: StudyPlanRequest):
+    try:
+        return await generate_study_plan(body)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"studyplan error: {e}")
+
+@app.post("/from-syllabus/stream")
+async def from_syllabus_stream(body: StudyPlanRequest):
+    """Server-Sent Events: weeks are emitted as soon as they are generated."""
     try:
-        return generate_study_plan(body)
+        events = await stream_study_plan(body)
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"studyplan error: {e}")
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -3,29 +3,28 @@
 import os, json, re
 from datetime import datetime
 from typing import Dict, Any, List
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from pydantic import ValidationError
 from .schemas import StudyPlanResponse, WeeklyItem
 from openai import OpenAI
+from . import extract_cache, metrics_sink, metrics_store, scorer, embed_store
 
 METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH", "/data/studyplan_metrics.jsonl")
+# local: scorer.py (no network calls); remote: embeddings + LLM grader per request
+EVAL_BACKEND = os.environ.get("EVAL_BACKEND", "local")
+EMBED_MODEL = "text-embedding-3-small"
 _client = OpenAI()
 
 
 # ---------- Core Logging ----------
 def log_metric_entry(entry: Dict[str, Any]):
-    entry["timestamp"] = datetime.utcnow().isoformat()
-    os.makedirs(os.path.dirname(METRICS_LOG_PATH), exist_ok=True)
-    with open(METRICS_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    """Buffered; metrics_sink flushes batches under a file lock and rotates the log."""
+    entry.setdefault("timestamp", datetime.utcnow().isoformat())
+    metrics_sink.get_sink(METRICS_LOG_PATH).write(json.dumps(entry, ensure_ascii=False) + "\n")
 
 
 def load_logs() -> List[Dict[str, Any]]:
-    if not os.path.exists(METRICS_LOG_PATH):
-        return []
-    with open(METRICS_LOG_PATH, encoding="utf-8") as f:
-        return [json.loads(line) for line in f if line.strip()]
+    """Every entry, including rotated segments. /metrics uses metrics_store instead."""
+    return [json.loads(line) for line in metrics_sink.iter_lines(METRICS_LOG_PATH) if line.strip()]
 
 
 # ---------- Accuracy ----------
@@ -34,13 +33,6 @@ def compute_accuracy(syllabus_text: str, plan_data: dict) -> float:
     Compute semantic similarity between syllabus and generated plan.
     Falls back to TF-IDF if embeddings fail or input too long.
     """
-    from openai import OpenAI
-    import numpy as np
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
-
-    _eval = OpenAI()
-
     generated_topics = " ".join(
         sum((wk.get("topics", []) for wk in plan_data.get("weekly_outline", [])), [])
     )
@@ -54,24 +46,19 @@ def compute_accuracy(syllabus_text: str, plan_data: dict) -> float:
     generated_topics = generated_topics[:max_chars]
 
     try:
-        emb = _eval.embeddings.create(
-            model="text-embedding-3-small",
-            input=[syllabus_text, generated_topics]
-        )
+        # the syllabus embedding comes from the shared store after its first use
+        vecs = embed_store.embed(_client, EMBED_MODEL, [syllabus_text, generated_topics], cache=[True, False])
         print(f"[ACCURACY] Using embeddings: syllabus_len={len(syllabus_text)}, topics_len={len(generated_topics)}")
-        v1, v2 = np.array(emb.data[0].embedding), np.array(emb.data[1].embedding)
-        sim = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
+        sim = embed_store.cosine(vecs[1], vecs[:1])[0]
         print("[ACCURACY] Cosine similarity (embeddings):", sim)
         return round(float(sim), 3)
 
     except Exception as e:
         print("[ACCURACY WARNING] Embedding failed, falling back to TF-IDF:", e)
         try:
-            corpus = [syllabus_text, generated_topics]
-            X = TfidfVectorizer(stop_words="english").fit_transform(corpus)
-            sim = cosine_similarity(X[0:1], X[1:2])[0][0]
+            sim = scorer.similarity(syllabus_text, generated_topics)  # persisted IDF weights
             print("[ACCURACY] Cosine similarity (TF-IDF):", sim)
-            return round(float(sim), 3)
+            return sim
         except Exception as e2:
             print("[ACCURACY ERROR] Both embedding and TF-IDF failed:", e2)
             return 0.0
@@ -120,6 +107,22 @@ def compute_quality(plan_data: dict) -> float:
         return 0.0
 
 
+# ---------- Evaluation ----------
+def evaluate_plan(syllabus_text: str, plan_data: dict) -> Dict[str, Any]:
+    """accuracy + quality_score for the metrics entry; locally scored unless EVAL_BACKEND=remote."""
+    if EVAL_BACKEND == "remote":
+        return {
+            "accuracy": compute_accuracy(syllabus_text, plan_data),
+            "quality_score": compute_quality(plan_data),
+        }
+    texts = [
+        " ".join(wk.get("topics", []) + wk.get("activities", []) + [wk.get("assessment") or "", wk.get("homework") or ""])
+        for wk in plan_data.get("weekly_outline", [])
+    ]
+    s = scorer.score((syllabus_text or "")[:24000], texts)
+    return {"accuracy": s["relevance"], "quality_score": s["quality"], "scores": s}
+
+
 # ---------- Batch Validation ----------
 def validate_plan(req, plan_data: dict) -> bool:
     """Check if output matches expected schema (real validation)."""
@@ -140,20 +143,18 @@ def validate_plan(req, plan_data: dict) -> bool:
 
 # ---------- Aggregation ----------
 def aggregate_metrics() -> Dict[str, Any]:
-    logs = load_logs()
-    if not logs:
+    """Totals, latency percentiles, language/grade breakdowns and rollups; reads only new log lines."""
+    store = metrics_store.get_store(METRICS_LOG_PATH)
+    out = store.summary()
+    if not out:
         return {}
 
-    total = len(logs)
-    successes = sum(1 for x in logs if x.get("success"))
-    valids = sum(1 for x in logs if x.get("json_valid"))
-    qualities = [x["quality_score"] for x in logs if x.get("quality_score", 0) > 0]
-    accuracies = [x["accuracy"] for x in logs if x.get("accuracy", 0) > 0]
-
-    return {
-        "quality_of_response": round(sum(qualities) / len(qualities), 2) if qualities else 0.0,
-        "reliability": round(successes / total, 3),
-        "batch_validation": round(valids / total, 3),
-        "accuracy": round(sum(accuracies) / len(accuracies), 3) if accuracies else 0.0,
-        "total_requests": total
+    c = store.counters()
+    hits, misses = c["xc_hits"], c["xc_misses"]
+    out["extract_cache"] = {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        "worker": extract_cache.cache_stats(),
     }
+    return out
@@ -0,0 +1,188 @@
+# app/metrics_sink.py
+# Buffered, multi-process-safe writer for the metrics JSONL.
+#   - entries are serialized into an in-memory buffer and flushed when it holds
+#     METRICS_FLUSH_ENTRIES lines or every METRICS_FLUSH_INTERVAL seconds (and at exit)
+#   - a flush appends the whole batch with one write while holding an exclusive
+#     flock on <log>.lock, so the uvicorn workers of an agent never interleave lines
+#   - under the same lock the active file is rotated once it exceeds
+#     METRICS_ROTATE_MB or was last written on an earlier (UTC) day; the rotated
+#     segment is gzip-compressed afterwards and the oldest segments beyond
+#     METRICS_MAX_SEGMENTS are deleted
+# Rotated segments are named <log>.<UTC stamp>.<inode of the rotated file>[.gz];
+# the inode lets the aggregation (metrics_store.py) finish a segment it was
+# part-way through before rotation.
+
+import os, gzip, time, fcntl, atexit, shutil, threading
+from datetime import datetime
+from typing import Dict, List, Optional, Iterator, Tuple
+
+METRICS_FLUSH_ENTRIES = int(os.environ.get("METRICS_FLUSH_ENTRIES", "50"))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "2"))
+METRICS_ROTATE_BYTES = int(float(os.environ.get("METRICS_ROTATE_MB", "64")) * 1024 * 1024)
+METRICS_ROTATE_DAILY = os.environ.get("METRICS_ROTATE_DAILY", "1") not in ("0", "false", "False")
+METRICS_MAX_SEGMENTS = int(os.environ.get("METRICS_MAX_SEGMENTS", "60"))
+
+
+# ---------- Segments ----------
+def rotated_segments(path: str) -> List[Tuple[str, str, int]]:
+    """
+    Rotated segments of `path`, oldest first, as (canonical name, file to read, inode).
+    While a segment is being compressed both forms may exist; the plain one is returned.
+    """
+    folder, base = os.path.split(path)
+    prefix = base + "."
+    found: Dict[str, str] = {}
+    try:
+        names = os.listdir(folder or ".")
+    except FileNotFoundError:
+        return []
+    for name in names:
+        if not name.startswith(prefix) or name.endswith((".lock", ".tmp", ".json")):
+            continue
+        canonical = name[:-3] if name.endswith(".gz") else name
+        if canonical.count(".") != base.count(".") + 2:
+            continue
+        if canonical not in found or not name.endswith(".gz"):
+            found[canonical] = name
+    out = []
+    for canonical in sorted(found):
+        try:
+            inode = int(canonical.rsplit(".", 1)[1])
+        except ValueError:
+            continue
+        out.append((canonical, os.path.join(folder, found[canonical]), inode))
+    return out
+
+
+def open_segment(path: str):
+    """Binary reader for a plain or gzip-compressed segment."""
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def iter_lines(path: str) -> Iterator[bytes]:
+    """Every line of the log, rotated segments first, then the active file."""
+    for _, seg, _ in rotated_segments(path):
+        try:
+            with open_segment(seg) as f:
+                yield from f
+        except FileNotFoundError:
+            continue  # compressed or deleted while listing
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            yield from f
+
+
+def _segment_name(path: str, inode: int) -> str:
+    # inodes are reused once a compressed segment's plain file is removed, so the
+    # stamp carries microseconds and a counter in case it still collides
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+    name, n = f"{path}.{stamp}.{inode}", 0
+    while os.path.exists(name) or os.path.exists(name + ".gz"):
+        n += 1
+        name = f"{path}.{stamp}-{n}.{inode}"
+    return name
+
+
+def _compress(seg: str):
+    tmp = seg + ".gz.tmp"
+    try:
+        with open(seg, "rb") as src, gzip.open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, seg + ".gz")
+        os.remove(seg)
+    except OSError as e:
+        print(f"[METRICS WARN] could not compress {seg}: {e}")
+
+
+def _prune(path: str):
+    segs = rotated_segments(path)
+    for canonical, seg, _ in segs[:max(0, len(segs) - METRICS_MAX_SEGMENTS)]:
+        for p in (canonical, canonical + ".gz"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+
+# ---------- Sink ----------
+class MetricsSink:
+    def __init__(self, path: str):
+        self.path = path
+        self._buf: List[str] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self, line: str):
+        with self._lock:
+            self._buf.append(line)
+            full = len(self._buf) >= METRICS_FLUSH_ENTRIES
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._flush_loop, name="metrics-sink", daemon=True)
+                self._thread.start()
+        if full or self._closed:
+            self.flush()
+
+    def _flush_loop(self):
+        while not self._closed:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def _should_rotate(self, st: os.stat_result) -> bool:
+        if st.st_size == 0:
+            return False
+        if st.st_size >= METRICS_ROTATE_BYTES:
+            return True
+        return METRICS_ROTATE_DAILY and time.gmtime(st.st_mtime)[:3] != time.gmtime()[:3]
+
+    def flush(self):
+        with self._lock:
+            lines, self._buf = self._buf, []
+        if not lines:
+            return
+        rotated = None
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    try:
+                        st = os.stat(self.path)
+                        if self._should_rotate(st):
+                            rotated = _segment_name(self.path, st.st_ino)
+                            os.rename(self.path, rotated)
+                    except FileNotFoundError:
+                        pass
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write("".join(lines))
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        except OSError as e:
+            print(f"[METRICS WARN] flush failed, {len(lines)} entries kept for retry: {e}")
+            with self._lock:
+                self._buf[:0] = lines
+            return
+        if rotated:
+            _compress(rotated)
+            _prune(self.path)
+
+    def close(self):
+        self._closed = True
+        self.flush()
+
+
+_sinks: Dict[str, MetricsSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(path: str) -> MetricsSink:
+    with _sinks_lock:
+        if path not in _sinks:
+            _sinks[path] = MetricsSink(path)
+        return _sinks[path]
+
+
+@atexit.register
+def _close_all():
+    for sink in list(_sinks.values()):
+        sink.close()
@@ -0,0 +1,197 @@
+# app/render.py
+# Study plan rendering (PDF via reportlab, Markdown fallback).
+#   - each TTF is parsed and registered once per process
+#   - text is wrapped by real glyph widths, from a per-(font, size) table
+#     memoized char by char, so wrapping never calls into reportlab twice for the same glyph
+#   - output is built in memory and handed to the artifact store (artifacts.py)
+
+import io, os, threading
+from typing import List, Dict, Any, Optional, Tuple
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+FONTS_DIR = os.path.join(os.path.dirname(__file__), "assets", "fonts")
+
+# basic mapping to choose a likely font family; missing fonts will trigger .md fallback
+LANG_FONT = {
+    "en": ("NotoSans-Regular.ttf",),
+    "hi": ("NotoSansDevanagari-Regular.ttf",),
+    "mr": ("NotoSansDevanagari-Regular.ttf",),
+    "ta": ("NotoSansTamil-Regular.ttf",),
+}
+
+_font_lock = threading.Lock()
+_registered: Dict[str, str] = {}  # font path -> registered font name
+_widths: Dict[Tuple[str, float], Dict[str, float]] = {}  # (font, size) -> char -> width
+
+
+# ---------- Fonts ----------
+def grades_compact(grades: List[str]) -> str:
+    gs = sorted([g.strip() for g in grades if g.strip()])
+    if not gs: return "unknown"
+    # "3,4,5" -> "3to5" if contiguous, else "3-4-6"
+    try:
+        nums = sorted(set(int(x) for x in gs))
+        if nums == list(range(nums[0], nums[-1] + 1)):
+            return f"{nums[0]}to{nums[-1]}"
+        return "-".join(str(x) for x in nums)
+    except:
+        return "-".join(gs)
+
+def get_font_for_lang(lang: str) -> Optional[str]:
+    for fname in LANG_FONT.get(lang, LANG_FONT["en"]):
+        p = os.path.join(FONTS_DIR, fname)
+        if os.path.exists(p):
+            return p
+    return None
+
+def font_name_for(font_path: Optional[str]) -> str:
+    """Register the TTF on first use and return its reportlab font name."""
+    if not font_path:
+        return "Helvetica"
+    name = _registered.get(font_path)
+    if name:
+        return name
+    with _font_lock:
+        if font_path not in _registered:
+            name = "Body-" + os.path.splitext(os.path.basename(font_path))[0]
+            try:
+                pdfmetrics.registerFont(TTFont(name, font_path))
+            except Exception as e:
+                print(f"[RENDER WARN] could not load {font_path}: {e}")
+                name = "Helvetica"
+            _registered[font_path] = name
+    return _registered[font_path]
+
+
+# ---------- Measuring / wrapping ----------
+def text_width(text: str, font: str, size: float) -> float:
+    table = _widths.get((font, size))
+    if table is None:
+        table = _widths.setdefault((font, size), {})
+    total = 0.0
+    for ch in text:
+        w = table.get(ch)
+        if w is None:
+            w = table[ch] = pdfmetrics.stringWidth(ch, font, size)
+        total += w
+    return total
+
+def wrap_text(text: str, font: str, size: float, max_width: float) -> List[str]:
+    """Greedy word wrap by measured width; words wider than a line are split by characters."""
+    lines: List[str] = []
+    space = text_width(" ", font, size)
+    for para in (text or "").splitlines() or [""]:
+        cur, cur_w = "", 0.0
+        for word in para.split():
+            w = text_width(word, font, size)
+            if cur and cur_w + space + w <= max_width:
+                cur, cur_w = f"{cur} {word}", cur_w + space + w
+                continue
+            if cur:
+                lines.append(cur)
+            while w > max_width and len(word) > 1:
+                # hard-break an overlong word at the last character that still fits
+                acc, cut = 0.0, 0
+                for i, ch in enumerate(word):
+                    acc += text_width(ch, font, size)
+                    if acc > max_width:
+                        break
+                    cut = i + 1
+                cut = max(cut, 1)
+                lines.append(word[:cut])
+                word = word[cut:]
+                w = text_width(word, font, size)
+            cur, cur_w = word, w
+        lines.append(cur)
+    return lines
+
+
+# ---------- Output ----------
+def render_markdown(plan: Dict[str, Any], gb: str, weeks: int, lang: str) -> str:
+    out = [f"# Study Plan ({gb}, {weeks} weeks) [{lang}]\n\n", plan.get("overview", "") + "\n\n"]
+    for wk in plan.get("weekly_outline", []):
+        out.append(f"## Week {wk.get('week')}\n")
+        out.append(f"**Topics:** {', '.join(wk.get('topics', []))}\n\n")
+        out.append("**Activities:**\n")
+        for a in wk.get("activities", []):
+            out.append(f"- {a}\n")
+        out.append(f"\n**Assessment:** {wk.get('assessment','')}\n")
+        hw = wk.get("homework")
+        if hw: out.append(f"\n**Homework:** {hw}\n")
+        res = wk.get("resources", [])
+        if res:
+            out.append("\n**Resources:**\n")
+            for r in res:
+                out.append(f"- {r.get('title')} ({r.get('platform')}): search \"{r.get('search_query')}\"\n")
+        out.append("\n")
+    return "".join(out)
+
+def render_pdf_bytes(plan: Dict[str, Any], grades: List[str], weeks: int, lang: str,
+                     font_path: Optional[str]) -> bytes:
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4, invariant=1)  # no timestamps/random IDs: same plan -> same bytes
+    width, height = A4
+    font_name = font_name_for(font_path)
+
+    margin = 40
+    state = {"y": height - margin - 10, "size": 12}
+
+    def set_font(size: float):
+        state["size"] = size
+        c.setFont(font_name, size)
+
+    def draw_wrapped(text: str, x: float, max_width: float, leading: int = 14):
+        for line in wrap_text(text, font_name, state["size"], max_width):
+            if state["y"] < margin:
+                c.showPage(); state["y"] = height - margin
+                c.setFont(font_name, state["size"])
+            c.drawString(x, state["y"], line)
+            state["y"] -= leading
+
+    text_w = width - 2*margin
+    set_font(16); c.drawString(margin, state["y"], "Study Plan"); state["y"] -= 24
+    set_font(10); c.drawString(margin, state["y"], f"Grades: {', '.join(grades)}  Weeks: {weeks}  Language: {lang}"); state["y"] -= 18
+    set_font(12); draw_wrapped(plan.get("overview",""), margin, text_w); state["y"] -= 10
+
+    for wk in plan.get("weekly_outline", []):
+        if state["y"] < 120:
+            c.showPage(); state["y"] = height - margin
+        set_font(13); c.drawString(margin, state["y"], f"Week {wk.get('week')}"); state["y"] -= 16
+
+        set_font(11)
+        draw_wrapped("Topics: " + ", ".join(wk.get("topics", [])), margin, text_w)
+        draw_wrapped("Activities:", margin, text_w)
+        for a in wk.get("activities", []):
+            draw_wrapped(f" • {a}", margin+12, text_w - 12)
+        draw_wrapped("Assessment: " + wk.get("assessment",""), margin, text_w)
+        hw = wk.get("homework")
+        if hw:
+            draw_wrapped("Homework: " + hw, margin, text_w)
+        res = wk.get("resources", [])
+        if res:
+            draw_wrapped("Resources:", margin, text_w)
+            for r in res:
+                draw_wrapped(f" • {r.get('title')} ({r.get('platform')}): search \"{r.get('search_query')}\"", margin+12, text_w - 12)
+        state["y"] -= 6
+
+    c.showPage(); c.save()
+    return buf.getvalue()
+
+def plan_file_name(req) -> str:
+    # filename: ai-studyplan-[gradeband]-[weeks]w-<lang>.(pdf|md)
+    gb = grades_compact(req.grades)
+    lang = req.target_language.lower()
+    base = f"ai-studyplan-{gb}-{req.duration_weeks}w-{lang}"
+    # fallback to markdown if we don't have a font for this language
+    ext = ".md" if lang != "en" and not get_font_for_lang(lang) else ".pdf"
+    return base + ext
+
+def render_plan_bytes(plan: Dict[str, Any], req) -> bytes:
+    """Printable plan in the format plan_file_name() picks (.pdf, or .md without a font)."""
+    lang = req.target_language.lower()
+    if plan_file_name(req).endswith(".md"):
+        return render_markdown(plan, grades_compact(req.grades), req.duration_weeks, lang).encode("utf-8")
+    return render_pdf_bytes(plan, req.grades, req.duration_weeks, lang, get_font_for_lang(lang))
@@ -7,6 +7,7 @@ class StudyPlanRequest(BaseModel):
     duration_weeks: int = Field(gt=0, le=52)
     constraints: Optional[Dict[str, Any]] = None
     target_language: str = Field(default="en", description="BCP-47 like 'en', 'hi', 'ta'")
+    bypass_cache: bool = Field(default=False, description="Skip the LLM response cache and regenerate")
 
 class WeeklyItem(BaseModel):
     week: int
@@ -24,3 +25,5 @@ class StudyPlanResponse(BaseModel):
     overview: str
     weekly_outline: List[WeeklyItem]
     printable_file_url: str  # can be .pdf or .md depending on font availability
+    printable_file_status: str = "ready"  # pending|ready|failed, see GET /files/{plan_id}/status
+    cache_hit: bool = False  # plan served from the LLM response cache
@@ -0,0 +1,229 @@
+# app/scorer.py
+# Local relevance / quality scoring of generated content, no network calls.
+#   - vocabulary and IDF weights are fitted once on our corpus (the documents in
+#     the extract cache) and persisted to SCORER_MODEL_PATH; every worker loads
+#     them on first use. Refit with:  python -m app.scorer fit [--min-df 2]
+#     Without a fitted model the first use fits one, and saves it when the cache
+#     holds at least SCORER_MIN_DOCS documents. A model fitted on fewer is only
+#     provisional: it is fitted again (or a saved one loaded) after
+#     SCORER_REFIT_SECONDS, so a worker that started on an empty corpus does not
+#     keep its near-uniform weights
+#   - score() builds one sparse TF-IDF matrix for the source and all generated
+#     items and reads every metric off it:
+#       relevance    cosine of the source and all items together
+#       diversity    1 - mean pairwise cosine between items
+#       coverage     share of the source's top terms that some item uses
+#       readability  item length and word length against classroom-friendly ranges
+#       quality      the four blended onto the old 1-10 grader scale
+# Terms outside the vocabulary still count, with the highest IDF.
+
+import os, re, sys, json, glob, math, time, threading
+from collections import Counter
+from typing import Dict, Any, List, Iterable, Optional
+import numpy as np
+from scipy import sparse
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+SCORER_MODEL_PATH = os.environ.get("SCORER_MODEL_PATH", os.path.join(FILE_ROOT, "_scorer", "idf.json"))
+SCORER_MIN_DOCS = int(os.environ.get("SCORER_MIN_DOCS", "20"))
+SCORER_REFIT_SECONDS = float(os.environ.get("SCORER_REFIT_SECONDS", "300"))
+EXTRACT_CACHE_DIR = os.environ.get("EXTRACT_CACHE_DIR", os.path.join(FILE_ROOT, "_extract_cache"))
+MAX_TERMS = 100000
+TOP_SOURCE_TERMS = 50   # coverage looks at this many of the source's heaviest terms
+RELEVANCE_FULL = 0.5    # TF-IDF cosine that already counts as fully on-topic
+
+# word characters plus the Indic blocks (Devanagari .. Sinhala, without the danda
+# punctuation), whose vowel signs \w does not match
+TOKEN_RE = re.compile(r"[\w\u0900-\u0963\u0966-\u0DFF]+")
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how if in is it its of on or that the their them
+then there these this to was were what when where which who why will with you your not but all any each
+""".split())
+
+_lock = threading.Lock()
+_model: Optional["Model"] = None
+_refit_at = 0.0  # when a provisional _model is replaced; 0 once the model is saved or loaded
+
+
+def _stem(t: str) -> str:
+    # plural "s" only: enough to match "fractions" with "fraction"
+    return t[:-1] if t.isascii() and len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t
+
+
+def tokens(text: str) -> List[str]:
+    return [_stem(t) for t in TOKEN_RE.findall((text or "").lower())
+            if len(t) > 1 and not t.isdigit() and t not in STOPWORDS]
+
+
+# ---------- Model ----------
+class Model:
+    def __init__(self, vocab: Dict[str, int], idf: np.ndarray, n_docs: int):
+        self.vocab = vocab
+        self.idf = idf
+        self.n_docs = n_docs
+        self.oov_idf = math.log((1 + n_docs) / 1) + 1  # as if seen in no document
+
+    @classmethod
+    def fit(cls, docs: Iterable[str], min_df: int = 2, max_terms: int = MAX_TERMS) -> "Model":
+        df: Counter = Counter()
+        n = 0
+        for doc in docs:
+            df.update(set(tokens(doc)))
+            n += 1
+        if n < 5:
+            min_df = 1
+        terms = [t for t, c in df.most_common(max_terms) if c >= min_df]
+        vocab = {t: i for i, t in enumerate(sorted(terms))}
+        idf = np.empty(len(vocab), dtype=np.float32)
+        for t, i in vocab.items():
+            idf[i] = math.log((1 + n) / (1 + df[t])) + 1
+        return cls(vocab, idf, n)
+
+    def save(self, path: str = SCORER_MODEL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "n_docs": self.n_docs, "terms": sorted(self.vocab, key=self.vocab.get),
+                       "idf": [round(float(x), 5) for x in self.idf]}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = SCORER_MODEL_PATH) -> Optional["Model"]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != 1:
+            return None
+        vocab = {t: i for i, t in enumerate(data["terms"])}
+        return cls(vocab, np.asarray(data["idf"], dtype=np.float32), data["n_docs"])
+
+    def matrix(self, counts: List[Counter]) -> sparse.csr_matrix:
+        """L2-normalized rows of sublinear TF x IDF; unseen terms get columns past the vocabulary."""
+        extra: Dict[str, int] = {}
+        rows, cols, vals = [], [], []
+        for r, c in enumerate(counts):
+            for term, n in c.items():
+                j = self.vocab.get(term)
+                if j is None:
+                    j = extra.setdefault(term, len(self.vocab) + len(extra))
+                    w = self.oov_idf
+                else:
+                    w = float(self.idf[j])
+                rows.append(r); cols.append(j); vals.append((1 + math.log(n)) * w)
+        X = sparse.csr_matrix((np.asarray(vals, dtype=np.float64), (rows, cols)),
+                              shape=(len(counts), len(self.vocab) + len(extra)))
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms) @ X
+
+
+def corpus_documents(cache_dir: str = EXTRACT_CACHE_DIR) -> Iterable[str]:
+    """One text per document in the extract cache."""
+    for path in glob.glob(os.path.join(cache_dir, "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                yield "\n".join(json.load(f).get("units", []))
+        except (OSError, ValueError):
+            continue
+
+
+def _current() -> Optional[Model]:
+    if _model is not None and (not _refit_at or time.time() < _refit_at):
+        return _model
+    return None
+
+
+def get_model() -> Model:
+    global _model, _refit_at
+    model = _current()
+    if model is None:
+        with _lock:
+            model = _current()
+            if model is None:
+                model, provisional = Model.load(), False
+                if model is None:
+                    docs = list(corpus_documents())
+                    model, provisional = Model.fit(docs), True
+                    if len(docs) >= SCORER_MIN_DOCS:
+                        try:
+                            model.save()
+                            provisional = False
+                        except OSError as e:
+                            print(f"[SCORER WARN] could not save the fitted model: {e}")
+                _model = model
+                _refit_at = time.time() + SCORER_REFIT_SECONDS if provisional else 0.0
+    return model
+
+
+# ---------- Scoring ----------
+def _readability(texts: List[str]) -> float:
+    """1.0 for items of 5-20 words with ordinary word lengths; long items and long words cost."""
+    scores = []
+    for t in texts:
+        words = t.split()
+        if not words:
+            scores.append(0.0)
+            continue
+        n = len(words)
+        length = 1.0 if 5 <= n <= 20 else (n / 5 if n < 5 else max(0.0, 1 - (n - 20) / 30))
+        avg = sum(len(w) for w in words) / n
+        scores.append(length * (1 - min(0.5, max(0.0, avg - 8) / 8)))
+    return float(np.mean(scores))
+
+
+def score(source_text: str, texts: List[str]) -> Dict[str, float]:
+    """Relevance, diversity, coverage, readability and quality (1-10) of `texts` against the source."""
+    texts = [t for t in texts if t and t.strip()]
+    if not texts:
+        return {"relevance": 0.0, "diversity": 0.0, "coverage": 0.0, "readability": 0.0, "quality": 0.0}
+    model = get_model()
+    item_counts = [Counter(tokens(t)) for t in texts]
+    joined = sum(item_counts, Counter())
+    X = model.matrix([Counter(tokens(source_text)), joined] + item_counts)
+    src, items = X[0], X[2:]
+
+    relevance = float(src.multiply(X[1]).sum())
+
+    k = items.shape[0]
+    if k > 1:
+        sims = (items @ items.T).toarray()
+        diversity = 1 - float((sims.sum() - np.trace(sims)) / (k * (k - 1)))
+    else:
+        diversity = 1.0
+
+    src = src.tocoo()
+    if src.nnz:
+        top = src.col[np.argsort(-src.data)[:TOP_SOURCE_TERMS]]
+        used = np.asarray(items[:, top].getnnz(axis=0)) > 0
+        coverage = float(used.mean())
+    else:
+        coverage = 0.0
+
+    readability = _readability(texts)
+    blend = (0.35 * min(1.0, relevance / RELEVANCE_FULL) + 0.25 * diversity
+             + 0.2 * coverage + 0.2 * readability)
+    return {
+        "relevance": round(relevance, 3),
+        "diversity": round(max(0.0, diversity), 3),
+        "coverage": round(coverage, 3),
+        "readability": round(readability, 3),
+        "quality": round(1 + 9 * blend, 2),
+    }
+
+
+def similarity(a: str, b: str) -> float:
+    """TF-IDF cosine of two texts with the fitted weights."""
+    X = get_model().matrix([Counter(tokens(a)), Counter(tokens(b))])
+    return round(float(X[0].multiply(X[1]).sum()), 3)
+
+
+if __name__ == "__main__":
+    # python -m app.scorer fit [--min-df N]: refit on the extract cache and persist
+    if sys.argv[1:2] != ["fit"]:
+        sys.exit("usage: python -m app.scorer fit [--min-df N]")
+    min_df = int(sys.argv[sys.argv.index("--min-df") + 1]) if "--min-df" in sys.argv else 2
+    fitted = Model.fit(corpus_documents(), min_df=min_df)
+    fitted.save()
+    print(f"[SCORER] {len(fitted.vocab)} terms from {fitted.n_docs} documents -> {SCORER_MODEL_PATH}")
@@ -0,0 +1,99 @@
+# app/stream_parse.py
+# Incremental parser for the streamed plan JSON:
+#   {"overview": "...", "weekly_outline": [ {...}, {...}, ... ]}
+# feed() takes raw model deltas and returns events as soon as they are complete:
+#   ("overview", str) once the overview string is closed
+#   ("week", dict)    for every finished object inside weekly_outline
+
+import re, json
+from typing import List, Tuple, Any, Optional
+
+_OVERVIEW_RE = re.compile(r'"overview"\s*:\s*"')
+_WEEKLY_RE = re.compile(r'"weekly_outline"\s*:\s*\[')
+
+
+def _string_end(buf: str, start: int) -> int:
+    """Index of the closing quote of the JSON string whose body starts at `start`, or -1."""
+    i, esc = start, False
+    while i < len(buf):
+        ch = buf[i]
+        if esc:
+            esc = False
+        elif ch == "\\":
+            esc = True
+        elif ch == '"':
+            return i
+        i += 1
+    return -1
+
+
+class PlanStreamParser:
+    def __init__(self):
+        self.buf = ""
+        self.overview_done = False
+        self.array_pos: Optional[int] = None  # scan position inside weekly_outline
+        self.array_done = False
+        # state of the object currently being scanned
+        self._obj_start = -1
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.buf += chunk or ""
+        events: List[Tuple[str, Any]] = []
+
+        if not self.overview_done:
+            m = _OVERVIEW_RE.search(self.buf)
+            if m:
+                end = _string_end(self.buf, m.end())
+                if end >= 0:
+                    self.overview_done = True
+                    events.append(("overview", json.loads(self.buf[m.end() - 1:end + 1])))
+
+        if self.array_pos is None:
+            m = _WEEKLY_RE.search(self.buf)
+            if m:
+                self.array_pos = m.end()
+
+        if self.array_pos is not None and not self.array_done:
+            events.extend(self._scan_array())
+        return events
+
+    def _scan_array(self) -> List[Tuple[str, Any]]:
+        events = []
+        buf, i = self.buf, self.array_pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._obj_start < 0:
+                if ch == "{":
+                    self._obj_start, self._depth = i, 1
+                elif ch == "]":
+                    self.array_done = True
+                    i += 1
+                    break
+                i += 1
+                continue
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = buf[self._obj_start:i + 1]
+                    self._obj_start = -1
+                    try:
+                        events.append(("week", json.loads(raw)))
+                    except ValueError as e:
+                        print(f"[STREAM WARN] could not parse week object: {e}")
+            i += 1
+        self.array_pos = i
+        return events
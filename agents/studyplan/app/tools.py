@@ -1,9 +1,9 @@
 import os
-import fitz  # pymupdf
+from .extract import extract_pdf_pages
 
 FILE_STORE = os.environ.get("FILE_STORE", "/data")
 
-def syllabus_text_from_file_id(file_id: str) -> str:
+def syllabus_text_from_file_id(file_id: str, backend: str = "pymupdf") -> str:
     """
     Resolves file path like /data/<file_id>.pdf and extracts text.
     You can swap this later for S3/GCS.
@@ -13,12 +13,8 @@ def syllabus_text_from_file_id(file_id: str) -> str:
     if not os.path.exists(path_pdf):
         raise FileNotFoundError(f"PDF not found at: {path_pdf}")
 
-    doc = fitz.open(path_pdf)
-    chunks = []
-    for page in doc:
-        chunks.append(page.get_text("text"))
-    doc.close()
-    text = "\n".join(chunks)
+    pages, _ = extract_pdf_pages(path_pdf, backend=backend, char_budget=120_000)
+    text = "\n".join(pages)
     # Light cleanup
     text = "\n".join([line.strip() for line in text.splitlines() if line.strip()])
     return text[:120_000]  # safety: cap very long docs
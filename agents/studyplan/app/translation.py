@@ -0,0 +1,229 @@
+# app/translation.py
+# Batched plan translation backed by an on-disk translation memory (TM).
+# The TM is a SQLite file on FILE_STORE so every uvicorn worker shares it.
+
+import os, json, time, sqlite3, asyncio, hashlib, threading
+from typing import List, Dict, Any, Optional, Tuple
+from openai import AsyncOpenAI
+from . import llm_cache, aio, tracing
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+TRANSLATE_MODEL = os.environ.get("TRANSLATE_MODEL", os.environ.get("STUDYPLAN_MODEL", "gpt-4o-mini"))
+TM_PATH = os.environ.get("TRANSLATION_MEMORY_PATH", os.path.join(FILE_ROOT, "translation_memory.sqlite"))
+BATCH_SIZE = int(os.environ.get("TRANSLATE_BATCH_SIZE", "40"))
+BATCH_MAX_CHARS = int(os.environ.get("TRANSLATE_BATCH_MAX_CHARS", "6000"))
+CONCURRENCY = int(os.environ.get("TRANSLATE_CONCURRENCY", "4"))
+
+_client = AsyncOpenAI()
+
+
+# --------- Translation memory ---------
+class TranslationMemory:
+    """(source text, target language, model) -> translation, persisted in SQLite."""
+
+    def __init__(self, path: str = TM_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tm ("
+                " key TEXT PRIMARY KEY, lang TEXT, model TEXT,"
+                " source TEXT, target TEXT, created REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(text: str, lang: str, model: str) -> str:
+        raw = json.dumps([text, lang.lower(), model], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: List[str], lang: str, model: str) -> Dict[str, str]:
+        if not texts:
+            return {}
+        keys = {self.key(t, lang, model): t for t in texts}
+        found = {}
+        conn = self._conn()
+        key_list = list(keys)
+        for i in range(0, len(key_list), 500):  # stay under SQLite's variable limit
+            chunk = key_list[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, target FROM tm WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for k, target in rows:
+                found[keys[k]] = target
+        return found
+
+    def put_many(self, pairs: Dict[str, str], lang: str, model: str):
+        if not pairs:
+            return
+        now = time.time()
+        rows = [(self.key(s, lang, model), lang.lower(), model, s, t, now) for s, t in pairs.items()]
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO tm VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+_tm = TranslationMemory()
+
+
+# --------- Plan traversal ---------
+def collect_strings(plan: Dict[str, Any]) -> List[str]:
+    """Every translatable string in the plan, in document order (with repeats)."""
+    out = [plan.get("overview", "")]
+    for wk in plan.get("weekly_outline", []):
+        out.extend(wk.get("topics", []))
+        out.extend(wk.get("activities", []))
+        out.append(wk.get("assessment", ""))
+        if wk.get("homework"):
+            out.append(wk.get("homework", ""))
+        for r in wk.get("resources", []):
+            out.append(r.get("title", ""))
+            out.append(r.get("search_query", ""))
+    return [s for s in out if s]
+
+
+def apply_translations(plan: Dict[str, Any], mapping: Dict[str, str]) -> Dict[str, Any]:
+    """Rebuild the plan with every string replaced by its translation (same shape as before)."""
+    tr = lambda s: mapping.get(s, s) if s else s
+
+    weekly = []
+    for wk in plan.get("weekly_outline", []):
+        new_wk = {
+            "week": wk.get("week"),
+            "topics": [tr(t) for t in wk.get("topics", [])],
+            "activities": [tr(a) for a in wk.get("activities", [])],
+            "assessment": tr(wk.get("assessment", "")),
+        }
+        if wk.get("homework"):
+            new_wk["homework"] = tr(wk.get("homework", ""))
+        new_wk["resources"] = [
+            {
+                "title": tr(r.get("title", "")),
+                "platform": r.get("platform", ""),  # keep platform names as-is
+                "search_query": tr(r.get("search_query", "")),
+            }
+            for r in wk.get("resources", [])
+        ]
+        weekly.append(new_wk)
+
+    return {"overview": tr(plan.get("overview", "")), "weekly_outline": weekly}
+
+
+# --------- LLM calls ---------
+def _make_batches(texts: List[str]) -> List[List[str]]:
+    batches, cur, size = [], [], 0
+    for t in texts:
+        if cur and (len(cur) >= BATCH_SIZE or size + len(t) > BATCH_MAX_CHARS):
+            batches.append(cur)
+            cur, size = [], 0
+        cur.append(t)
+        size += len(t)
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+async def translate_one(text: str, lang: str, model: str = TRANSLATE_MODEL) -> str:
+    content, _ = await llm_cache.chat_completion(
+        _client,
+        model=model,
+        messages=[
+            {"role": "system", "content": f"You are a translator. Translate everything into {lang}. Do not explain, only translate."},
+            {"role": "user", "content": text}
+        ],
+        temperature=0.2
+    )
+    return content.strip()
+
+
+async def translate_batch(texts: List[str], lang: str, model: str = TRANSLATE_MODEL) -> Tuple[Dict[str, str], int]:
+    """
+    Translate a batch in one structure-preserving request. Items the model drops
+    or mangles are retried one by one. Returns (source -> translation, llm calls).
+    """
+    if len(texts) == 1:
+        return {texts[0]: await translate_one(texts[0], lang, model)}, 1
+
+    payload = {str(i): t for i, t in enumerate(texts)}
+    content, _ = await llm_cache.chat_completion(
+        _client,
+        model=model,
+        messages=[
+            {"role": "system", "content": (
+                f"You are a translator. Translate every value of the JSON object into {lang}. "
+                "Keep exactly the same keys, translate each value independently, do not merge or split items. "
+                "Return STRICT JSON with the same keys and the translated strings as values. Do not explain."
+            )},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+        ],
+        temperature=0.2,
+        response_format={"type": "json_object"},
+    )
+    calls = 1
+    try:
+        data = json.loads(content)
+    except Exception:
+        data = {}
+
+    out = {}
+    for i, src in enumerate(texts):
+        val = data.get(str(i)) if isinstance(data, dict) else None
+        if isinstance(val, str) and val.strip():
+            out[src] = val.strip()
+        else:
+            out[src] = await translate_one(src, lang, model)
+            calls += 1
+    return out, calls
+
+
+async def translate_strings(texts: List[str], lang: str, model: str = TRANSLATE_MODEL,
+                            stats: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """
+    Translate a list of strings: dedupe, serve what we can from the TM, send the
+    rest as parallel batches and write the results back to the TM.
+    """
+    unique = list(dict.fromkeys(t for t in texts if t))
+    mapping = await aio.run_blocking(_tm.get_many, unique, lang, model)
+    misses = [t for t in unique if t not in mapping]
+
+    calls = 0
+    sem = asyncio.Semaphore(max(1, CONCURRENCY))
+
+    async def run(batch: List[str]) -> Tuple[Dict[str, str], int]:
+        async with sem:
+            result, n = await translate_batch(batch, lang, model)
+        await aio.run_blocking(_tm.put_many, result, lang, model)
+        return result, n
+
+    with tracing.span("translate"):
+        for result, n in await asyncio.gather(*(run(b) for b in _make_batches(misses))):
+            mapping.update(result)
+            calls += n
+
+    if stats is not None:
+        hits = len(unique) - len(misses)
+        stats.update({
+            "strings": len(texts),
+            "unique": len(unique),
+            "cache_hits": hits,
+            "cache_hit_rate": round(hits / len(unique), 3) if unique else 0.0,
+            "llm_calls": calls,
+            # the old path made one call per non-empty string
+            "calls_saved": len([t for t in texts if t]) - calls,
+        })
+    return mapping
+
+
+async def translate_plan(plan: Dict[str, Any], lang: str, model: str = TRANSLATE_MODEL,
+                         stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Translate all text fields in the plan JSON into the target language. Keeps structure intact."""
+    texts = collect_strings(plan)
+    mapping = await translate_strings(texts, lang, model, stats)
+    return apply_translations(plan, mapping)
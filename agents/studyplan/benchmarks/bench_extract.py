@@ -0,0 +1,82 @@
+"""
+Compare PDF extraction backends on large multi-script documents.
+
+    cd agents/studyplan
+    python -m benchmarks.bench_extract --pages 300 --repeat 3
+
+Generates synthetic en / hi / ta textbooks with reportlab (using the bundled
+Noto fonts) and times every backend serially, through the process pool, and
+with the 15k-character early stop the agents use.
+"""
+
+import os, time, argparse, tempfile, statistics
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from app import extract
+
+FONTS_DIR = os.path.join(os.path.dirname(__file__), "..", "app", "assets", "fonts")
+
+SAMPLES = {
+    "en": ("NotoSans-Regular.ttf", "Fractions describe parts of a whole. Compare 1/2 and 1/4 using paper strips. "),
+    "hi": ("NotoSansDevanagari-Regular.ttf", "भिन्न किसी पूरे के भाग को दर्शाते हैं। कागज़ की पट्टियों से आधा और चौथाई की तुलना करें। "),
+    "ta": ("NotoSansTamil-Regular.ttf", "பின்னங்கள் ஒரு முழுமையின் பகுதிகளைக் குறிக்கின்றன. காகிதப் பட்டைகளால் ஒப்பிடுக. "),
+}
+
+
+def make_pdf(path: str, lang: str, pages: int):
+    font_file, sentence = SAMPLES[lang]
+    font_name = f"Bench-{lang}"
+    pdfmetrics.registerFont(TTFont(font_name, os.path.join(FONTS_DIR, font_file)))
+    c = canvas.Canvas(path, pagesize=A4)
+    width, height = A4
+    for p in range(pages):
+        c.setFont(font_name, 10)
+        y = height - 40
+        line_no = 0
+        while y > 40:
+            c.drawString(40, y, f"{p + 1}.{line_no} " + sentence[: 80])
+            y -= 13
+            line_no += 1
+        c.showPage()
+    c.save()
+
+
+def timed(fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=300)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--budget", type=int, default=15000)
+    args = ap.parse_args()
+
+    backends = extract.available_backends()
+    print(f"backends={backends} workers={extract.EXTRACT_WORKERS} pages={args.pages} repeat={args.repeat}")
+    print(f"{'lang':<5}{'backend':<10}{'serial':>10}{'pool':>10}{'budget':>10}{'chars':>10}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for lang in SAMPLES:
+            path = os.path.join(tmp, f"bench-{lang}.pdf")
+            make_pdf(path, lang, args.pages)
+            for backend in backends:
+                pages, _ = extract.extract_pdf_pages(path, backend=backend, parallel=False)
+                serial = timed(lambda: extract.extract_pdf_pages(path, backend=backend, parallel=False), args.repeat)
+                extract.extract_pdf_pages(path, backend=backend, parallel=True)  # warm up the pool
+                pool = timed(lambda: extract.extract_pdf_pages(path, backend=backend, parallel=True), args.repeat)
+                budget = timed(lambda: extract.extract_pdf_pages(path, backend=backend, char_budget=args.budget), args.repeat)
+                chars = sum(len(p) for p in pages)
+                print(f"{lang:<5}{backend:<10}{serial:>9.3f}s{pool:>9.3f}s{budget:>9.3f}s{chars:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark for study plan rendering on 52-week plans.
+
+    cd agents/studyplan
+    python -m benchmarks.bench_render --repeat 5
+
+For en / hi / ta it reports the first render in the process (font parsing,
+empty width tables), the median of warm renders, and the time spent in
+wrap_text alone. Renders go to memory; nothing is written to FILE_STORE.
+"""
+
+import time, argparse, statistics
+
+from app import render
+
+TEXT = {
+    "en": ("Fractions with paper strips", "Fold a strip into halves and quarters, compare lengths with a partner and record the result on the slate"),
+    "hi": ("कागज़ की पट्टियों से भिन्न", "पट्टी को आधे और चौथाई में मोड़ें, साथी के साथ लंबाई की तुलना करें और परिणाम स्लेट पर लिखें"),
+    "ta": ("காகிதப் பட்டைகளால் பின்னங்கள்", "பட்டையை பாதியாகவும் காலாகவும் மடித்து, நண்பருடன் நீளங்களை ஒப்பிட்டு, முடிவை பலகையில் எழுதுங்கள்"),
+}
+
+
+def make_plan(lang: str, weeks: int = 52):
+    topic, activity = TEXT[lang]
+    return {
+        "overview": (activity + ". ") * 6,
+        "weekly_outline": [
+            {
+                "week": w,
+                "topics": [f"{topic} {w}", f"{topic} ({w}b)"],
+                "activities": [f"{activity} ({i})" for i in range(4)],
+                "assessment": activity,
+                "homework": activity,
+                "resources": [{"title": topic, "platform": "DIKSHA", "search_query": f"{topic} class 4"}] * 3,
+            }
+            for w in range(1, weeks + 1)
+        ],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--weeks", type=int, default=52)
+    args = ap.parse_args()
+
+    print(f"{'lang':<5}{'first':>10}{'warm':>10}{'wrap':>10}{'pages':>8}{'KB':>8}")
+    for lang in TEXT:
+        plan = make_plan(lang, args.weeks)
+        font_path = render.get_font_for_lang(lang)
+
+        t0 = time.perf_counter()
+        pdf = render.render_pdf_bytes(plan, ["3", "4", "5"], args.weeks, lang, font_path)
+        first = time.perf_counter() - t0
+
+        runs = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            render.render_pdf_bytes(plan, ["3", "4", "5"], args.weeks, lang, font_path)
+            runs.append(time.perf_counter() - t0)
+
+        font = render.font_name_for(font_path)
+        strings = [a for wk in plan["weekly_outline"] for a in wk["activities"]] * 10
+        t0 = time.perf_counter()
+        for s in strings:
+            render.wrap_text(s, font, 11, 500)
+        wrap = time.perf_counter() - t0
+
+        print(f"{lang:<5}{first:>9.3f}s{statistics.median(runs):>9.3f}s{wrap:>9.3f}s"
+              f"{pdf.count(b'/Type /Page') - pdf.count(b'/Type /Pages'):>8}{len(pdf) // 1024:>8}")
+
+
+if __name__ == "__main__":
+    main()
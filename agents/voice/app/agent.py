@@ -1,10 +1,11 @@
-import os, re, time, random
-from typing import Optional
-from openai import OpenAI
+import os, re, time, json, base64, random, asyncio, sqlite3
+from typing import Optional, Dict, Any, List, AsyncIterator
+from openai import AsyncOpenAI
 from .schemas import VoiceRequest, VoiceResponse
+from . import eval_queue, llm_cache, aio, tracing, file_index, tts_cache
 from .metrics_logger import (
     log_metric_entry,
-    compute_quality,
+    evaluate_answer,
     validate_response
 )
 
@@ -12,8 +13,10 @@ FILE_ROOT = os.environ.get("FILE_STORE", "/data")
 ASR_MODEL = os.environ.get("OPENAI_ASR_MODEL", "gpt-4o-mini-transcribe")
 REASON_MODEL = os.environ.get("OPENAI_REASON_MODEL", "gpt-4o-mini")
 TTS_MODEL = os.environ.get("OPENAI_TTS_MODEL", "gpt-4o-mini-tts")
+# streaming: a sentence shorter than this waits for the next one, so TTS is not called per fragment
+MIN_SENTENCE_CHARS = int(os.environ.get("TTS_MIN_SENTENCE_CHARS", "20"))
 
-client = OpenAI()
+client = AsyncOpenAI()
 
 
 # ---------- Utility ----------
@@ -24,15 +27,11 @@ def _id(prefix="ans"):
 
 
 def _find_audio_path(file_id: str) -> str:
-    for ext in (".wav", ".mp3", ".m4a"):
-        p = os.path.join(FILE_ROOT, f"{file_id}{ext}")
-        if os.path.exists(p):
-            return p
-    # raw id fallback
-    p = os.path.join(FILE_ROOT, file_id)
-    if os.path.exists(p):
-        return p
-    raise FileNotFoundError(f"Audio not found for file_id={file_id}")
+    # raw id accepted as a fallback
+    found = file_index.resolve(file_id, (".wav", ".mp3", ".m4a"), raw=True)
+    if found is None:
+        raise FileNotFoundError(f"Audio not found for file_id={file_id}")
+    return found[0]
 
 
 def clean_markdown(text: str) -> str:
@@ -50,19 +49,29 @@ def clean_markdown(text: str) -> str:
 
 
 # ---------- Pipeline Stages ----------
-def transcribe(audio_path: str, lang: str) -> str:
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, data, mode: str = "wb"):
+    with open(path, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+        f.write(data)
+
+
+async def transcribe(audio_path: str, lang: str) -> str:
     """Speech-to-text using OpenAI ASR."""
-    with open(audio_path, "rb") as f:
-        tr = client.audio.transcriptions.create(
+    audio = await aio.run_blocking(_read_bytes, audio_path)
+    async with aio.llm_slot():
+        tr = await client.audio.transcriptions.create(
             model=ASR_MODEL,
-            file=f,
+            file=(os.path.basename(audio_path), audio),
             language=lang
         )
     return tr.text.strip()
 
 
-def reason(text: str, lang: str, topic_hint: Optional[str]) -> str:
-    """Generate a concise spoken explanation using an LLM."""
+def _reason_messages(text: str, lang: str, topic_hint: Optional[str]) -> List[Dict[str, str]]:
     sys = f"""You are a helpful teaching assistant. 
 Respond ONLY in language: {lang}. 
 Write in short paragraphs with clear formatting. 
@@ -71,39 +80,131 @@ Avoid markdown syntax like **bold** or # headings."""
 \"\"\"{text}\"\"\"
 {f"Topic hint: {topic_hint}" if topic_hint else ""}
 Create a concise explanation for students. Include: key idea, one small example, and one quick practice question."""
-    out = client.chat.completions.create(
+    return [
+        {"role": "system", "content": sys},
+        {"role": "user", "content": user}
+    ]
+
+
+async def reason(text: str, lang: str, topic_hint: Optional[str], bypass_cache: bool = False,
+           stats: Optional[Dict[str, Any]] = None) -> str:
+    """Generate a concise spoken explanation using an LLM."""
+    content, hit = await llm_cache.chat_completion(
+        client,
         model=REASON_MODEL,
         temperature=0.4,
-        messages=[
-            {"role": "system", "content": sys},
-            {"role": "user", "content": user}
-        ]
+        messages=_reason_messages(text, lang, topic_hint),
+        bypass=bypass_cache,
     )
-    return out.choices[0].message.content.strip()
+    if stats is not None:
+        stats["llm_cache_hit"] = hit
+    return content.strip()
 
 
-def tts_to_file(text: str, voice: str, speed: float, lang: str) -> str:
-    """Text-to-speech synthesis into MP3."""
-    ans_id = _id()
-    fname = f"ai-voice-{lang}-{ans_id}.mp3"
-    out_path = os.path.join(FILE_ROOT, fname)
+async def _speech(text: str, voice: str, speed: float, stats: Optional[Dict[str, Any]] = None) -> bytes:
+    """Text-to-speech synthesis; MP3 bytes."""
+    with tracing.span("tts", stats):
+        async with aio.llm_slot():
+            audio = await client.audio.speech.create(
+                model=TTS_MODEL,
+                voice=voice,
+                input=text,
+                speed=speed
+            )
+    return audio.content
 
-    audio = client.audio.speech.create(
-        model=TTS_MODEL,
-        voice=voice,
-        input=text,
-        speed=speed
-    )
-    with open(out_path, "wb") as f:
-        f.write(audio.content)
-    return out_path
+
+async def _cache_get(key: str, stats: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not tts_cache.TTS_CACHE_ENABLED:
+        return None
+    try:
+        name = await aio.run_blocking(tts_cache.get, key)
+    except sqlite3.Error as e:
+        print(f"[TTS CACHE WARN] read failed: {e}")
+        name = None
+    if stats is not None:
+        k = "tts_cache_hits" if name else "tts_cache_misses"
+        stats[k] = stats.get(k, 0) + 1
+    return name
+
+
+async def _cache_put(key: str, audio: bytes) -> Optional[str]:
+    if not tts_cache.TTS_CACHE_ENABLED:
+        return None
+    try:
+        return await aio.run_blocking(tts_cache.put, key, audio)
+    except (OSError, sqlite3.Error) as e:
+        print(f"[TTS CACHE WARN] write failed: {e}")
+        return None
+
+
+async def synthesize(text: str, voice: str, speed: float, stats: Optional[Dict[str, Any]] = None) -> bytes:
+    """MP3 bytes of text; from the TTS cache when it was spoken before with the same voice and speed."""
+    key = tts_cache.cache_key(text, voice, speed, TTS_MODEL)
+    name = await _cache_get(key, stats)
+    if name is not None:
+        try:
+            return await aio.run_blocking(_read_bytes, os.path.join(FILE_ROOT, name))
+        except OSError:
+            pass  # evicted since the lookup
+    audio = await _speech(text, voice, speed, stats)
+    await _cache_put(key, audio)
+    return audio
+
+
+async def tts_to_file(text: str, voice: str, speed: float, lang: str,
+                      stats: Optional[Dict[str, Any]] = None, audio: Optional[bytes] = None) -> str:
+    """
+    Path of an MP3 of text: the cached file when it was spoken before with the
+    same voice and speed, else a new one. `audio` (the joined sentences of a
+    streamed answer) is stored as it is instead of synthesizing.
+    """
+    key = tts_cache.cache_key(text, voice, speed, TTS_MODEL)
+    name = await _cache_get(key, stats)
+    if name is None:
+        if audio is None:
+            audio = await _speech(text, voice, speed, stats)
+        with tracing.span("file_write", stats):
+            name = await _cache_put(key, audio)
+            if name is None:  # cache disabled or not writable
+                name = f"ai-voice-{lang}-{_id()}.mp3"
+                await aio.run_blocking(_write_file, os.path.join(FILE_ROOT, name), audio)
+    return os.path.join(FILE_ROOT, name)
+
+
+# ---------- Sentence streaming ----------
+# a sentence ends at . ! ? or the danda, plus closing quotes / brackets, before whitespace; or at a line break
+SENTENCE_END = re.compile(r"(?<=[.!?\u0964])[\"')\]]*\s+|\n+")
+
+
+class SentenceSplitter:
+    """Cuts streamed text into sentences of at least min_chars as soon as they are complete."""
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.buf = ""
+        self.min_chars = min_chars
+
+    def feed(self, delta: str) -> List[str]:
+        self.buf += delta
+        out, start = [], 0
+        for m in SENTENCE_END.finditer(self.buf):
+            piece = self.buf[start:m.end()].strip()
+            if len(piece) >= self.min_chars:  # shorter pieces are joined to the next sentence
+                out.append(piece)
+                start = m.end()
+        self.buf = self.buf[start:]
+        return out
+
+    def flush(self) -> List[str]:
+        rest, self.buf = self.buf.strip(), ""
+        return [rest] if rest else []
 
 
 # ---------- Main Entry ----------
-def handle_voice(req: VoiceRequest) -> VoiceResponse:
-    """Full voice request processing pipeline + metrics logging."""
-    entry = {
+def _new_entry(req: VoiceRequest) -> Dict[str, Any]:
+    return {
         "agent": "voice_agent",
+        "trace_id": tracing.trace_id(),
         "language": req.target_language,
         "success": False,
         "json_valid": False,
@@ -111,34 +212,43 @@ def handle_voice(req: VoiceRequest) -> VoiceResponse:
         "response_time": 0.0
     }
 
+
+async def handle_voice(req: VoiceRequest) -> VoiceResponse:
+    """Full voice request processing pipeline + metrics logging."""
+    entry = _new_entry(req)
+
     try:
         start = time.time()
         audio_path = _find_audio_path(req.file_id)
 
         # --- 1️⃣ ASR: Transcription ---
-        transcript = transcribe(audio_path, req.target_language)
+        with tracing.span("asr", entry):
+            transcript = await transcribe(audio_path, req.target_language)
         cleaned_transcript = clean_markdown(transcript)
 
         # --- 2️⃣ Reasoning: Generate Answer ---
-        answer = reason(cleaned_transcript, req.target_language, req.topic_hint)
+        with tracing.span("reason", entry):
+            answer = await reason(cleaned_transcript, req.target_language, req.topic_hint, req.bypass_cache, stats=entry)
         answer_clean = clean_markdown(answer)
 
         # --- 3️⃣ TTS: Convert to Audio File ---
-        mp3_path = tts_to_file(answer_clean, req.tts_voice, req.tts_speed, req.target_language)
+        mp3_path = await tts_to_file(answer_clean, req.tts_voice, req.tts_speed, req.target_language, stats=entry)
         mp3_name = os.path.basename(mp3_path)
 
         # --- 4️⃣ Save Transcript as Text File ---
-        txt_name = f"{os.path.splitext(mp3_name)[0]}.txt"
+        # the MP3 may be shared with earlier answers; the transcript file is per request
+        txt_name = f"ai-voice-{req.target_language}-{_id()}.txt"
         txt_path = os.path.join(FILE_ROOT, txt_name)
-        with open(txt_path, "w", encoding="utf-8") as f:
-            f.write(answer_clean)
+        with tracing.span("file_write", entry):
+            await aio.run_blocking(_write_file, txt_path, answer_clean, "w")
 
         # --- 5️⃣ Build Response Object ---
         response = VoiceResponse(
             transcript=cleaned_transcript,
             answer_text=answer_clean,
             answer_audio_url=f"/files/{mp3_name}",
-            transcript_file_url=f"/files/{txt_name}"
+            transcript_file_url=f"/files/{txt_name}",
+            cache_hit=entry.get("llm_cache_hit", False)
         )
 
         duration = round(time.time() - start, 2)
@@ -146,14 +256,133 @@ def handle_voice(req: VoiceRequest) -> VoiceResponse:
         # --- 6️⃣ Metrics ---
         entry["response_time"] = duration
         entry["json_valid"] = validate_response(response.model_dump())
-        entry["quality_score"] = compute_quality(cleaned_transcript, answer_clean)
         entry["success"] = True
+        eval_queue.submit(entry, lambda: evaluate_answer(cleaned_transcript, answer_clean))
+
+        return response
 
+    except Exception as e:
+        entry["error"] = str(e)
         log_metric_entry(entry)
+        raise
 
-        return response
 
+# ---------- Streaming (SSE) entry ----------
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_voice(req: VoiceRequest) -> AsyncIterator[str]:
+    """
+    Server-Sent Events version of handle_voice. The answer is streamed from the
+    model and cut into sentences; each sentence goes to TTS while the next one
+    is still being written, and its audio is sent as soon as it and every
+    earlier sentence are synthesized. The audio file is resolved before
+    returning, so a missing upload still fails with a normal HTTP error; the
+    returned generator then emits
+      meta       {answer_id}
+      transcript {transcript}
+      audio      {index, text, audio}  one sentence, audio is base64 MP3
+      done       {answer_text, answer_audio_url, transcript_file_url, sentences, cache_hit}
+      error      {detail}  if anything fails mid-stream
+    Sentences and the joined MP3 of the whole answer go through the TTS cache,
+    so phrases spoken before are not synthesized again.
+    """
+    entry = _new_entry(req)
+    entry["stream"] = True
+    start = time.time()
+    try:
+        audio_path = _find_audio_path(req.file_id)
     except Exception as e:
         entry["error"] = str(e)
         log_metric_entry(entry)
         raise
+
+    async def events() -> AsyncIterator[str]:
+        ans_id = _id()
+        queue: asyncio.Queue = asyncio.Queue()
+        tts_tasks: List[asyncio.Task] = []
+        parts: List[str] = []
+        meta: Dict[str, Any] = {}
+
+        def speak(sentence: str):
+            text = clean_markdown(sentence)
+            if text:
+                task = asyncio.create_task(synthesize(text, req.tts_voice, req.tts_speed, entry))
+                tts_tasks.append(task)
+                queue.put_nowait((text, task))
+
+        async def produce(transcript: str):
+            try:
+                splitter = SentenceSplitter()
+                with tracing.span("reason", entry):
+                    async for delta in llm_cache.stream_chat_completion(
+                        client,
+                        model=REASON_MODEL,
+                        messages=_reason_messages(transcript, req.target_language, req.topic_hint),
+                        temperature=0.4,
+                        bypass=req.bypass_cache,
+                        meta=meta,
+                    ):
+                        parts.append(delta)
+                        for sentence in splitter.feed(delta):
+                            speak(sentence)
+                for sentence in splitter.flush():
+                    speak(sentence)
+            finally:
+                queue.put_nowait(None)
+
+        producer = None
+        try:
+            yield sse("meta", {"answer_id": ans_id})
+            with tracing.span("asr", entry):
+                transcript = await transcribe(audio_path, req.target_language)
+            cleaned_transcript = clean_markdown(transcript)
+            yield sse("transcript", {"transcript": cleaned_transcript})
+
+            producer = asyncio.create_task(produce(cleaned_transcript))
+            segments: List[bytes] = []
+            while (item := await queue.get()) is not None:
+                text, task = item
+                audio = await task
+                if not segments:
+                    entry["first_audio_time"] = round(time.time() - start, 2)
+                yield sse("audio", {"index": len(segments), "text": text,
+                                    "audio": base64.b64encode(audio).decode("ascii")})
+                segments.append(audio)
+            await producer  # raises the model's error, if any
+
+            answer_clean = clean_markdown("".join(parts).strip())
+            # MP3 frames concatenate into one playable file, cached like a whole answer
+            mp3_path = await tts_to_file(answer_clean, req.tts_voice, req.tts_speed, req.target_language,
+                                         stats=entry, audio=b"".join(segments))
+            mp3_name = os.path.basename(mp3_path)
+            txt_name = f"ai-voice-{req.target_language}-{ans_id}.txt"
+            with tracing.span("file_write", entry):
+                await aio.run_blocking(_write_file, os.path.join(FILE_ROOT, txt_name), answer_clean, "w")
+
+            entry["llm_cache_hit"] = meta.get("cache_hit", False)
+            response = VoiceResponse(
+                transcript=cleaned_transcript,
+                answer_text=answer_clean,
+                answer_audio_url=f"/files/{mp3_name}",
+                transcript_file_url=f"/files/{txt_name}",
+                cache_hit=entry["llm_cache_hit"]
+            )
+            entry["sentences"] = len(segments)
+            entry["response_time"] = round(time.time() - start, 2)
+            entry["json_valid"] = validate_response(response.model_dump())
+            entry["success"] = True
+            eval_queue.submit(entry, lambda: evaluate_answer(cleaned_transcript, answer_clean))
+            yield sse("done", {**response.model_dump(exclude={"transcript"}), "sentences": len(segments)})
+        except Exception as e:
+            entry["error"] = str(e)
+            log_metric_entry(entry)
+            yield sse("error", {"detail": f"voice-agent error: {e}"})
+        finally:
+            # client gone or failure: stop generating and synthesizing
+            for task in [producer, *tts_tasks]:
+                if task is not None and not task.done():
+                    task.cancel()
+
+    return events()
@@ -0,0 +1,238 @@
+# app/llm_cache.py
+# Persistent cache for chat completions, shared by every agent and worker via a
+# SQLite file on FILE_STORE. Keyed by a hash of (model, messages, temperature,
+# response_format); entries expire after LLM_CACHE_TTL seconds and the least
+# recently used ones are dropped once the stored content exceeds LLM_CACHE_MAX_MB.
+# Only complete responses are stored (finish_reason "stop", and content that
+# parses when a JSON response_format was asked for); callers forget() a hit
+# they cannot use, so a bad entry is not replayed until it expires.
+
+import os, json, time, asyncio, sqlite3, hashlib, threading
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from . import aio
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(FILE_ROOT, "llm_cache.sqlite"))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(float(os.environ.get("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+_EVICT_EVERY = 50  # puts between size checks
+
+_local = threading.local()
+_lock = threading.Lock()
+_puts = 0
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(LLM_CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(LLM_CACHE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, model TEXT, content TEXT, size INTEGER,"
+            " created REAL, last_access REAL, hits INTEGER DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+        _local.conn = conn
+    return conn
+
+
+def cache_key(model: str, messages: List[Dict[str, Any]], temperature: Optional[float],
+              response_format: Optional[Dict[str, Any]] = None) -> str:
+    raw = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "response_format": response_format},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    now = time.time()
+    conn = _conn()
+    row = conn.execute("SELECT content, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    content, created = row
+    with conn:
+        if now - created > LLM_CACHE_TTL:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+    return content
+
+
+def delete(key: str):
+    conn = _conn()
+    with conn:
+        conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+
+
+def put(key: str, model: str, content: str):
+    global _puts
+    now = time.time()
+    conn = _conn()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, model, content, size, created, last_access, hits)"
+            " VALUES (?, ?, ?, ?, ?, ?, 0)",
+            (key, model, content, len(content.encode("utf-8")), now, now),
+        )
+    with _lock:
+        _puts += 1
+        check = _puts % _EVICT_EVERY == 1
+    if check:
+        evict()
+
+
+def evict(max_bytes: int = LLM_CACHE_MAX_BYTES):
+    """Delete expired rows, then least recently used rows until under max_bytes."""
+    conn = _conn()
+    with conn:
+        conn.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - LLM_CACHE_TTL,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        while total > max_bytes:
+            rows = conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access LIMIT 100").fetchall()
+            if not rows:
+                break
+            conn.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k, _ in rows])
+            total -= sum(size for _, size in rows)
+
+
+def add_usage(usage: Optional[Dict[str, Any]], resp) -> None:
+    """Add the token counts of a completion to usage["prompt_tokens"], ... (a hit adds nothing)."""
+    counts = getattr(resp, "usage", None)
+    if usage is None or counts is None:
+        return
+    for k in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        usage[k] = usage.get(k, 0) + (getattr(counts, k, 0) or 0)
+
+
+def storable(content: Optional[str], finish_reason: Optional[str],
+             response_format: Optional[Dict[str, Any]] = None) -> bool:
+    """Whether a response is complete and well-formed enough to be replayed from the cache."""
+    if not content or finish_reason != "stop":
+        return False
+    if (response_format or {}).get("type") == "json_object":
+        try:
+            json.loads(content)
+        except ValueError:
+            return False
+    return True
+
+
+async def forget(model: str, messages: List[Dict[str, Any]], temperature: Optional[float] = None,
+                 response_format: Optional[Dict[str, Any]] = None):
+    """Drop the cached response for these arguments (a hit the caller could not use)."""
+    if not LLM_CACHE_ENABLED:
+        return
+    try:
+        await aio.run_blocking(delete, cache_key(model, messages, temperature, response_format))
+    except sqlite3.Error as e:
+        print(f"[LLM CACHE WARN] delete failed: {e}")
+
+
+async def chat_completion(client, model: str, messages: List[Dict[str, Any]], temperature: Optional[float] = None,
+                          response_format: Optional[Dict[str, Any]] = None, bypass: bool = False,
+                          usage: Optional[Dict[str, Any]] = None) -> Tuple[str, bool]:
+    """
+    await client.chat.completions.create with a cache in front of it (AsyncOpenAI
+    client). Returns (message content, cache_hit). With bypass=True the cache is
+    not read, but the fresh response still replaces the stored one. Token counts
+    of a fresh response are added to `usage` when given.
+    """
+    key = cache_key(model, messages, temperature, response_format)
+    if LLM_CACHE_ENABLED and not bypass:
+        try:
+            cached = await aio.run_blocking(get, key)
+        except sqlite3.Error as e:
+            print(f"[LLM CACHE WARN] read failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached, True
+
+    kwargs = {"model": model, "messages": messages}
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    async with aio.llm_slot():
+        resp = await client.chat.completions.create(**kwargs)
+    content = resp.choices[0].message.content
+    add_usage(usage, resp)
+
+    if LLM_CACHE_ENABLED and storable(content, resp.choices[0].finish_reason, response_format):
+        try:
+            await aio.run_blocking(put, key, model, content)
+        except sqlite3.Error as e:
+            print(f"[LLM CACHE WARN] write failed: {e}")
+    return content, False
+
+
+async def stream_chat_completion(client, model: str, messages: List[Dict[str, Any]], temperature: Optional[float] = None,
+                                 response_format: Optional[Dict[str, Any]] = None, bypass: bool = False,
+                                 meta: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """
+    Streaming variant of chat_completion: yields content deltas. A cache hit is
+    yielded as one chunk; a miss is streamed and stored once complete.
+    meta["cache_hit"] tells the caller which one happened. The upstream stream
+    is read into a queue as fast as it arrives, so the LLM slot is released
+    when the model is done, however slowly the caller consumes the deltas.
+    """
+    meta = {} if meta is None else meta
+    key = cache_key(model, messages, temperature, response_format)
+    if LLM_CACHE_ENABLED and not bypass:
+        try:
+            cached = await aio.run_blocking(get, key)
+        except sqlite3.Error as e:
+            print(f"[LLM CACHE WARN] read failed: {e}")
+            cached = None
+        if cached is not None:
+            meta["cache_hit"] = True
+            yield cached
+            return
+
+    meta["cache_hit"] = False
+    kwargs = {"model": model, "messages": messages, "stream": True}
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+    async def pump() -> Optional[str]:
+        finish_reason = None
+        try:
+            async with aio.llm_slot():
+                stream = await client.chat.completions.create(**kwargs)
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        queue.put_nowait(delta)
+        finally:
+            queue.put_nowait(None)
+        return finish_reason
+
+    parts = []
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            delta = await queue.get()
+            if delta is None:
+                break
+            parts.append(delta)
+            yield delta
+        finish_reason = await task  # raises the upstream error, if any
+    finally:
+        task.cancel()  # the caller stopped early
+
+    content = "".join(parts)
+    if LLM_CACHE_ENABLED and storable(content, finish_reason, response_format):
+        try:
+            await aio.run_blocking(put, key, model, content)
+        except sqlite3.Error as e:
+            print(f"[LLM CACHE WARN] write failed: {e}")
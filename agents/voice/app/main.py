@@ -1,17 +1,43 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from .schemas import VoiceRequest, VoiceResponse
-from .agent import handle_voice
+from .agent import handle_voice, stream_voice
+from .metrics_logger import aggregate_metrics
+from . import tracing
 
 app = FastAPI(title="voice-agent", version="0.2.0")
+tracing.init("voice")
+app.middleware("http")(tracing.middleware)
 
 @app.get("/health")
 def health(): return {"status":"ok"}
 
+@app.get("/metrics", tags=["performance"])
+def get_metrics():
+    return aggregate_metrics()
+
+@app.get("/metrics/prometheus", tags=["performance"], response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Per-stage latency histograms in Prometheus text format."""
+    return PlainTextResponse(tracing.prometheus_text(), media_type="text/plain; version=0.0.4")
+
 @app.post("/explain", response_model=VoiceResponse)
-def explain(body: VoiceRequest):
+async def explain(body: VoiceRequest):
+    try:
+        return await handle_voice(body)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"voice-agent error: {e}")
+
+@app.post("/explain/stream")
+async def explain_stream(body: VoiceRequest):
+    """Server-Sent Events: each sentence's audio is sent as soon as it is synthesized."""
     try:
-        return handle_voice(body)
+        events = await stream_voice(body)
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"voice-agent error: {e}")
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
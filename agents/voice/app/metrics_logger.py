@@ -6,24 +6,24 @@ import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from openai import OpenAI
+from . import metrics_sink, metrics_store, scorer
 from .schemas import VoiceResponse  # assuming you have a response model
 
 METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH", "/data/voice_metrics.jsonl")
+# local: scorer.py (no network calls); remote: LLM grader per request
+EVAL_BACKEND = os.environ.get("EVAL_BACKEND", "local")
 _client = OpenAI()
 
 
 # ---------- Core Logging ----------
 def log_metric_entry(entry: Dict[str, Any]):
-    entry["timestamp"] = datetime.utcnow().isoformat()
-    os.makedirs(os.path.dirname(METRICS_LOG_PATH), exist_ok=True)
-    with open(METRICS_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    """Buffered; metrics_sink flushes batches under a file lock and rotates the log."""
+    entry.setdefault("timestamp", datetime.utcnow().isoformat())
+    metrics_sink.get_sink(METRICS_LOG_PATH).write(json.dumps(entry, ensure_ascii=False) + "\n")
 
 def load_logs() -> List[Dict[str, Any]]:
-    if not os.path.exists(METRICS_LOG_PATH):
-        return []
-    with open(METRICS_LOG_PATH, encoding="utf-8") as f:
-        return [json.loads(line) for line in f if line.strip()]
+    """Every entry, including rotated segments. /metrics uses metrics_store instead."""
+    return [json.loads(line) for line in metrics_sink.iter_lines(METRICS_LOG_PATH) if line.strip()]
 
 
 # ---------- Quality ----------
@@ -62,6 +62,16 @@ def compute_quality(asr_text: str, llm_text: str) -> float:
         return 0.0
 
 
+# ---------- Evaluation ----------
+def evaluate_answer(asr_text: str, llm_text: str) -> Dict[str, Any]:
+    """quality_score for the metrics entry; the answer's sentences are scored against the question."""
+    if EVAL_BACKEND == "remote":
+        return {"quality_score": compute_quality(asr_text, llm_text)}
+    sentences = re.split(r"(?<=[.!?।])\s+", llm_text or "")
+    s = scorer.score(asr_text or "", sentences)
+    return {"quality_score": s["quality"], "scores": s}
+
+
 # ---------- Validation ----------
 def validate_response(resp_dict: Dict[str, Any]) -> bool:
     """Check if VoiceResponse schema validates correctly."""
@@ -75,20 +85,5 @@ def validate_response(resp_dict: Dict[str, Any]) -> bool:
 
 # ---------- Aggregation ----------
 def aggregate_metrics() -> Dict[str, Any]:
-    logs = load_logs()
-    if not logs:
-        return {}
-
-    total = len(logs)
-    successes = sum(1 for x in logs if x.get("success"))
-    valids = sum(1 for x in logs if x.get("json_valid"))
-    qualities = [x["quality_score"] for x in logs if x.get("quality_score")]
-    accuracies = [x["accuracy"] for x in logs if x.get("accuracy")]
-
-    return {
-        "quality_of_response": round(sum(qualities) / len(qualities), 2) if qualities else 0.0,
-        "reliability": round(successes / total, 3),
-        "batch_validation": round(valids / total, 3),
-        "accuracy": round(sum(accuracies) / len(accuracies), 3) if accuracies else 0.0,
-        "total_requests": total
-    }
+    """Totals, latency percentiles, language/grade breakdowns and rollups; reads only new log lines."""
+    return metrics_store.get_store(METRICS_LOG_PATH).summary()
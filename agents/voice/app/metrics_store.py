@@ -0,0 +1,251 @@
+# app/metrics_store.py
+# Incremental aggregation of the metrics JSONL for /metrics.
+#   - remembers the byte offset it has read up to and only parses lines appended
+#     since the last call; rotated segments (metrics_sink.py) are read once each,
+#     resuming the segment that was the active file when it was rotated
+#   - keeps mergeable counters: totals, breakdowns by language and by grade, and
+#     rolling per-minute / per-hour / per-day buckets
+#   - response_time goes into a log-scale histogram (bins ~10% wide), which is
+#     what p50/p95/p99 are read from
+#   - state is snapshotted next to the log (METRICS_ROLLUP_PATH), so a restarted
+#     worker resumes from the saved offset instead of re-reading the history
+
+import os, json, math, time, threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from .metrics_sink import rotated_segments, open_segment
+
+ROLLUP_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+ROLLUP_KEEP = {"minute": 120, "hour": 48, "day": 90}
+ROLLUP_REPORT = {"minute": 60, "hour": 24, "day": 30}  # most recent buckets returned by summary()
+_SNAPSHOT_VERSION = 2
+_READ_CHUNK = 4 * 1024 * 1024
+
+LAT_MIN = 0.01     # seconds; everything faster lands in bin 0
+LAT_GROWTH = 1.1   # each bin is 10% wider than the previous one
+LAT_BINS = 128     # 0.01s * 1.1^127 ~ 18 minutes
+
+
+# ---------- Counters ----------
+def _new_cell() -> Dict[str, Any]:
+    return {"n": 0, "ok": 0, "valid": 0, "evaluated": 0, "q_sum": 0.0, "q_n": 0,
+            "a_sum": 0.0, "a_n": 0, "xc_hits": 0, "xc_misses": 0, "lat": {}}
+
+
+def _lat_bin(seconds: float) -> int:
+    if seconds <= LAT_MIN:
+        return 0
+    return min(LAT_BINS - 1, int(math.log(seconds / LAT_MIN, LAT_GROWTH)) + 1)
+
+
+def _add(cell: Dict[str, Any], e: Dict[str, Any]):
+    cell["n"] += 1
+    if e.get("success"):
+        cell["ok"] += 1
+        if e.get("eval_status", "done") == "done":
+            cell["evaluated"] += 1
+        rt = e.get("response_time") or 0
+        if rt > 0:
+            b = str(_lat_bin(float(rt)))
+            cell["lat"][b] = cell["lat"].get(b, 0) + 1
+    if e.get("json_valid"):
+        cell["valid"] += 1
+    if (e.get("quality_score") or 0) > 0:
+        cell["q_sum"] += e["quality_score"]; cell["q_n"] += 1
+    if (e.get("accuracy") or 0) > 0:
+        cell["a_sum"] += e["accuracy"]; cell["a_n"] += 1
+    cell["xc_hits"] += e.get("extract_cache_hits", 0) or 0
+    cell["xc_misses"] += e.get("extract_cache_misses", 0) or 0
+
+
+def percentile(lat: Dict[str, int], q: float) -> float:
+    """Upper edge of the histogram bin holding the q-quantile (overestimates by < 10%)."""
+    total = sum(lat.values())
+    if not total:
+        return 0.0
+    need, seen = q * total, 0
+    for b in sorted(lat, key=int):
+        seen += lat[b]
+        if seen >= need:
+            return round(LAT_MIN * LAT_GROWTH ** int(b), 3)
+    return round(LAT_MIN * LAT_GROWTH ** (LAT_BINS - 1), 3)
+
+
+def cell_summary(cell: Dict[str, Any]) -> Dict[str, Any]:
+    n = cell["n"]
+    return {
+        "requests": n,
+        "reliability": round(cell["ok"] / n, 3) if n else 0.0,
+        "quality_of_response": round(cell["q_sum"] / cell["q_n"], 2) if cell["q_n"] else 0.0,
+        "p50": percentile(cell["lat"], 0.50),
+        "p95": percentile(cell["lat"], 0.95),
+        "p99": percentile(cell["lat"], 0.99),
+    }
+
+
+def _entry_time(e: Dict[str, Any]) -> float:
+    try:
+        ts = datetime.fromisoformat(e["timestamp"])
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)  # log_metric_entry writes naive UTC
+        return ts.timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+# ---------- Store ----------
+class MetricsStore:
+    def __init__(self, log_path: str, snapshot_path: Optional[str] = None):
+        self.log_path = log_path
+        self.snapshot_path = snapshot_path or os.environ.get("METRICS_ROLLUP_PATH", log_path + ".rollup.json")
+        self._lock = threading.Lock()
+        self.state = self._load_snapshot() or self._empty()
+
+    def _empty(self) -> Dict[str, Any]:
+        return {"version": _SNAPSHOT_VERSION, "offset": 0, "inode": None, "done": [], "total": _new_cell(),
+                "by_language": {}, "by_grade": {}, "minute": {}, "hour": {}, "day": {}}
+
+    def _load_snapshot(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return state if state.get("version") == _SNAPSHOT_VERSION else None
+
+    def _save_snapshot(self):
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            print(f"[METRICS WARN] could not save rollup snapshot: {e}")
+
+    def _ingest(self, e: Dict[str, Any]):
+        s = self.state
+        _add(s["total"], e)
+        _add(s["by_language"].setdefault(str(e.get("language") or "unknown"), _new_cell()), e)
+        for g in e.get("grades") or ["unknown"]:
+            _add(s["by_grade"].setdefault(str(g), _new_cell()), e)
+        t = _entry_time(e)
+        for res, secs in ROLLUP_SECONDS.items():
+            start = str(int(t // secs * secs))
+            _add(s[res].setdefault(start, _new_cell()), e)
+
+    def _prune(self):
+        now = time.time()
+        for res, secs in ROLLUP_SECONDS.items():
+            oldest = now - secs * ROLLUP_KEEP[res]
+            for start in [k for k in self.state[res] if int(k) < oldest]:
+                del self.state[res][start]
+
+    def _ingest_lines(self, lines) -> int:
+        added = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                self._ingest(json.loads(line))
+                added += 1
+            except ValueError:
+                print("[METRICS WARN] skipped malformed metrics line")
+        return added
+
+    def _read_segments(self) -> int:
+        """Ingest rotated segments not read yet; finish the one that was the active file."""
+        s, added = self.state, 0
+        segs = rotated_segments(self.log_path)
+        done = set(s["done"])
+        for canonical, seg, inode in segs:
+            if canonical in done:
+                continue
+            resume = inode == s["inode"]
+            try:
+                with open_segment(seg) as f:
+                    if resume:
+                        f.seek(s["offset"])
+                    added += self._ingest_lines(f)
+            except FileNotFoundError:
+                continue  # compressed or pruned in the meantime; picked up next time
+            done.add(canonical)
+            if resume:
+                s["inode"], s["offset"] = None, 0  # the new active file starts from 0
+        s["done"] = sorted(done & {c for c, _, _ in segs})
+        return added
+
+    def refresh(self) -> int:
+        """Read lines appended since the last call. Returns how many entries were added."""
+        with self._lock:
+            s = self.state
+            added = self._read_segments()
+            try:
+                st = os.stat(self.log_path)
+            except FileNotFoundError:
+                st = None
+            if st is not None:
+                if s["inode"] == st.st_ino and st.st_size < s["offset"]:
+                    # truncated in place: start over from every segment
+                    self.state = s = self._empty()
+                    added = self._read_segments()
+                if s["inode"] != st.st_ino:
+                    s["inode"], s["offset"] = st.st_ino, 0
+
+                with open(self.log_path, "rb") as f:
+                    f.seek(s["offset"])
+                    while s["offset"] < st.st_size:
+                        data = f.read(min(_READ_CHUNK, st.st_size - s["offset"]))
+                        end = data.rfind(b"\n") + 1  # a half-written last line waits for next time
+                        if not end:
+                            break
+                        added += self._ingest_lines(data[:end].splitlines())
+                        s["offset"] += end
+                        f.seek(s["offset"])
+            self._prune()
+            if added:
+                self._save_snapshot()
+            return added
+
+    def summary(self) -> Dict[str, Any]:
+        self.refresh()
+        with self._lock:
+            s = self.state
+            total = s["total"]
+            n = total["n"]
+            if not n:
+                return {}
+            rollups = {}
+            for res in ROLLUP_SECONDS:
+                starts = sorted(s[res], key=int)[-ROLLUP_REPORT[res]:]
+                rollups[res] = [
+                    dict(start=datetime.fromtimestamp(int(k), timezone.utc).isoformat(), **cell_summary(s[res][k]))
+                    for k in starts
+                ]
+            return {
+                "quality_of_response": round(total["q_sum"] / total["q_n"], 2) if total["q_n"] else 0.0,
+                "reliability": round(total["ok"] / n, 3),
+                "batch_validation": round(total["valid"] / n, 3),
+                "accuracy": round(total["a_sum"] / total["a_n"], 3) if total["a_n"] else 0.0,
+                "total_requests": n,
+                "evaluated_requests": total["evaluated"],
+                "latency": {k: v for k, v in cell_summary(total).items() if k.startswith("p")},
+                "by_language": {k: cell_summary(c) for k, c in sorted(s["by_language"].items())},
+                "by_grade": {k: cell_summary(c) for k, c in sorted(s["by_grade"].items())},
+                "rollups": rollups,
+            }
+
+    def counters(self) -> Dict[str, Any]:
+        """Raw all-time counters (n, ok, q_sum, xc_hits, ...), as of the last refresh."""
+        with self._lock:
+            return {k: v for k, v in self.state["total"].items() if k != "lat"}
+
+
+_stores: Dict[str, MetricsStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(log_path: str) -> MetricsStore:
+    with _stores_lock:
+        if log_path not in _stores:
+            _stores[log_path] = MetricsStore(log_path)
+        return _stores[log_path]
@@ -7,9 +7,11 @@ class VoiceRequest(BaseModel):
     tts_voice: str = "alloy"
     tts_speed: float = 1.0
     topic_hint: Optional[str] = None
+    bypass_cache: bool = False  # skip the LLM response cache and regenerate
 
 class VoiceResponse(BaseModel):
     transcript: str
     answer_text: str
     answer_audio_url: str
     transcript_file_url: Optional[str] = None
+    cache_hit: bool = False  # answer served from the LLM response cache
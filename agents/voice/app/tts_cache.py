@@ -0,0 +1,100 @@
+# app/tts_cache.py
+# Synthesized speech, reused whenever the same text is spoken again with the same
+# voice, speed and TTS model: whole answers (tts_to_file) and single sentences of
+# the streaming pipeline alike. Audio lives on FILE_STORE as
+# ai-voice-cache-<key>.mp3, so a hit is served by pointing at the existing file;
+# FILE_STORE/tts_cache.sqlite maps the key to it. The least recently used files
+# are deleted once they add up to more than TTS_CACHE_MAX_MB (URLs handed out
+# for them stop working then, as the files are shared).
+
+import os, time, sqlite3, hashlib, threading
+from typing import Optional
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+TTS_CACHE_PATH = os.environ.get("TTS_CACHE_PATH", os.path.join(FILE_ROOT, "tts_cache.sqlite"))
+TTS_CACHE_MAX_BYTES = int(float(os.environ.get("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+TTS_CACHE_ENABLED = os.environ.get("TTS_CACHE_ENABLED", "1") not in ("0", "false", "False")
+_EVICT_EVERY = 50  # puts between size checks
+
+_local = threading.local()
+_lock = threading.Lock()
+_puts = 0
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(TTS_CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(TTS_CACHE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tts_cache ("
+            " key TEXT PRIMARY KEY, name TEXT, size INTEGER,"
+            " created REAL, last_access REAL, hits INTEGER DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tts_cache_access ON tts_cache(last_access)")
+        _local.conn = conn
+    return conn
+
+
+def cache_key(text: str, voice: str, speed: float, model: str) -> str:
+    return hashlib.sha256(f"{model}\n{voice}\n{float(speed)!r}\n{text}".encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """Name (relative to FILE_ROOT) of the cached audio, or None."""
+    conn = _conn()
+    row = conn.execute("SELECT name FROM tts_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    with conn:
+        if not os.path.exists(os.path.join(FILE_ROOT, row[0])):
+            conn.execute("DELETE FROM tts_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE tts_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+    return row[0]
+
+
+def put(key: str, audio: bytes) -> str:
+    """Store the audio of key; returns its name relative to FILE_ROOT."""
+    global _puts
+    name = f"ai-voice-cache-{key[:40]}.mp3"
+    path = os.path.join(FILE_ROOT, name)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(audio)
+    os.replace(tmp, path)
+    now = time.time()
+    conn = _conn()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO tts_cache (key, name, size, created, last_access, hits)"
+            " VALUES (?, ?, ?, ?, ?, 0)",
+            (key, name, len(audio), now, now),
+        )
+    with _lock:
+        _puts += 1
+        check = _puts % _EVICT_EVERY == 1
+    if check:
+        evict()
+    return name
+
+
+def evict(max_bytes: int = TTS_CACHE_MAX_BYTES):
+    """Delete the least recently used entries and their files until under max_bytes."""
+    conn = _conn()
+    with conn:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tts_cache").fetchone()[0]
+        while total > max_bytes:
+            rows = conn.execute("SELECT key, name, size FROM tts_cache ORDER BY last_access LIMIT 100").fetchall()
+            if not rows:
+                break
+            for key, name, size in rows:
+                if total <= max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(FILE_ROOT, name))
+                except FileNotFoundError:
+                    pass
+                conn.execute("DELETE FROM tts_cache WHERE key = ?", (key,))
+                total -= size
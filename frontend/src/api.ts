@@ -19,6 +19,45 @@ export async function createStudyPlan(payload: any) {
   return res.json();
 }
 
+// Streams a study plan over Server-Sent Events. `onEvent` receives
+// meta / overview / week / done / error events as they arrive.
+export async function streamStudyPlan(
+  payload: any,
+  onEvent: (event: string, data: any) => void
+) {
+  const res = await fetch(`${API}/studyplan/from-syllabus/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(payload),
+  });
+  await readEvents(res, onEvent);
+}
+
+// Server-Sent Events of a fetch response, dispatched to `onEvent` as they arrive.
+async function readEvents(res: Response, onEvent: (event: string, data: any) => void) {
+  if (!res.ok || !res.body) throw new Error(await res.text());
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buf.indexOf("\n\n")) >= 0) {
+      const raw = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      let event = "message";
+      let data = "";
+      for (const line of raw.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      onEvent(event, data ? JSON.parse(data) : null);
+    }
+  }
+}
+
 export async function generateWorksheet(payload: any) {
   const res = await fetch(`${API}/image/worksheet`, {
     method: "POST",
@@ -29,6 +68,86 @@ export async function generateWorksheet(payload: any) {
   return res.json();
 }
 
+// Polls a printable file's render status until it is ready or failed.
+// `service` is the gateway prefix ("studyplan" or "image"), `fileUrl` the
+// /files/<id>/<filename> URL from the response.
+export async function waitForFile(
+  service: "studyplan" | "image",
+  fileUrl: string,
+  { intervalMs = 1000, timeoutMs = 120000 } = {}
+): Promise<"ready" | "failed"> {
+  const id = fileUrl.split("/")[2];
+  const deadline = Date.now() + timeoutMs;
+  while (Date.now() < deadline) {
+    const res = await fetch(`${API}/${service}/files/${id}/status`);
+    if (res.ok) {
+      const { status } = await res.json();
+      if (status === "ready" || status === "failed") return status;
+    } else if (res.status !== 404) {
+      throw new Error(await res.text());
+    }
+    await new Promise(r => setTimeout(r, intervalMs));
+  }
+  return "failed";
+}
+
+// Eager text extraction state of an upload: queued|running|ready|failed|skipped,
+// plus pages and language once ready. uploadFile's response carries the first one.
+export async function ingestionStatus(fileId: string) {
+  const res = await fetch(`${API}/upload/${fileId}/status`);
+  if (!res.ok) throw new Error(await res.text());
+  return res.json();
+}
+
+// Bulk jobs: queue many studyplan / worksheet requests at once, then poll
+// jobProgress and read jobResults. `items` are request bodies of `kind`, or
+// { kind, request } objects to mix kinds.
+export async function createJob(kind: "studyplan" | "worksheet" | null, items: any[]) {
+  const res = await fetch(`${API}/jobs`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ kind, items }),
+  });
+  if (!res.ok) throw new Error(await res.text());
+  return res.json();
+}
+
+export async function jobProgress(jobId: string) {
+  const res = await fetch(`${API}/jobs/${jobId}`);
+  if (!res.ok) throw new Error(await res.text());
+  return res.json();
+}
+
+export async function jobResults(jobId: string, status?: "queued" | "running" | "done" | "failed") {
+  const query = status ? `?status=${status}` : "";
+  const res = await fetch(`${API}/jobs/${jobId}/results${query}`);
+  if (!res.ok) throw new Error(await res.text());
+  return res.json();
+}
+
+// Re-queues the failed items only; finished items keep their results.
+export async function retryJob(jobId: string) {
+  const res = await fetch(`${API}/jobs/${jobId}/retry`, { method: "POST" });
+  if (!res.ok) throw new Error(await res.text());
+  return res.json();
+}
+
+// Streams a voice answer sentence by sentence. `onEvent` receives meta /
+// transcript / audio / done / error events; each audio event carries one
+// sentence's text and its MP3 as base64, in order, so playback can start
+// after the first sentence. done has the same URLs as voiceAsk.
+export async function streamVoice(
+  payload: any,
+  onEvent: (event: string, data: any) => void
+) {
+  const res = await fetch(`${API}/voice/explain`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ ...payload, stream: true }),
+  });
+  await readEvents(res, onEvent);
+}
+
 export async function voiceAsk(payload: any) {
   const res = await fetch(`${API}/voice/ask`, {
     method: "POST",
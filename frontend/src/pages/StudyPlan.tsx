@@ -1,4 +1,5 @@
 import React, { useState } from "react";
+import { waitForFile } from "../api";
 
 export default function StudyPlan() {
   const [file, setFile] = useState<File | null>(null);
@@ -10,6 +11,7 @@ export default function StudyPlan() {
   const [loading, setLoading] = useState(false);
   const [result, setResult] = useState<any>(null);
   const [error, setError] = useState<string | null>(null);
+  const [fileStatus, setFileStatus] = useState<string>("ready");
 
   const handleCheckbox = (day: string) => {
     setWeekdays(prev =>
@@ -53,6 +55,14 @@ export default function StudyPlan() {
       if (!res.ok) throw new Error(await res.text());
       const data = await res.json();
       setResult(data);
+      // the plan is shown right away; the printable file may still be rendering
+      const status = data.printable_file_status || "ready";
+      setFileStatus(status);
+      if (status === "pending") {
+        waitForFile("studyplan", data.printable_file_url)
+          .then(setFileStatus)
+          .catch(() => setFileStatus("failed"));
+      }
     } catch (err: any) {
       setError(err.message);
     } finally {
@@ -153,14 +163,20 @@ export default function StudyPlan() {
           <p><strong>Grades:</strong> {result.grades.join(", ")}</p>
           <p><strong>Weeks:</strong> {result.weeks}</p>
           <p><strong>Language:</strong> {result.target_language}</p>
-          <a
-            href={`http://localhost:8000${result.printable_file_url}`}
-            target="_blank"
-            rel="noopener noreferrer"
-            className="text-purple-400 underline"
-          >
-            Download {result.printable_file_url.split("/").pop()}
-          </a>
+          {fileStatus === "ready" ? (
+            <a
+              href={`http://localhost:8000${result.printable_file_url}`}
+              target="_blank"
+              rel="noopener noreferrer"
+              className="text-purple-400 underline"
+            >
+              Download {result.printable_file_url.split("/").pop()}
+            </a>
+          ) : fileStatus === "pending" ? (
+            <p className="text-gray-400">Preparing printable file...</p>
+          ) : (
+            <p className="text-red-400">Printable file could not be generated.</p>
+          )}
         </div>
       )}
     </div>
@@ -1,4 +1,5 @@
 import React, { useEffect, useMemo, useState } from "react";
+import { waitForFile } from "../api";
 
 type Difficulty = "easy" | "medium" | "hard";
 
@@ -6,6 +7,7 @@ type WorksheetSet = {
   set_no: number;
   difficulty: Difficulty;
   printable_pdf_url: string;
+  printable_pdf_status?: "pending" | "ready" | "failed";
   items: Array<{
     type: string;
     q: string;
@@ -39,6 +41,7 @@ export default function Worksheet() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [result, setResult] = useState<WorksheetResponse | null>(null);
+  const [pdfStatus, setPdfStatus] = useState<Record<number, string>>({});
 
   useEffect(() => {
     setPerSetDiffs(prev => {
@@ -116,6 +119,17 @@ export default function Worksheet() {
       if (!r.ok) throw new Error(await r.text());
       const data: WorksheetResponse = await r.json();
       setResult(data);
+      // sets are shown right away; their PDFs may still be rendering
+      const initial: Record<number, string> = {};
+      data.sets.forEach(s => { initial[s.set_no] = s.printable_pdf_status || "ready"; });
+      setPdfStatus(initial);
+      data.sets
+        .filter(s => initial[s.set_no] === "pending")
+        .forEach(s =>
+          waitForFile("image", s.printable_pdf_url)
+            .catch(() => "failed")
+            .then(status => setPdfStatus(prev => ({ ...prev, [s.set_no]: status })))
+        );
     } catch (err: any) {
       setError(err.message || String(err));
     } finally {
@@ -290,14 +304,20 @@ export default function Worksheet() {
                 <div>
                   <div className="font-medium">Set {s.set_no} — {s.difficulty}</div>
                 </div>
-                <a
-                  href={`${API_BASE}${s.printable_pdf_url}`}
-                  target="_blank"
-                  rel="noopener noreferrer"
-                  className="text-purple-400 underline"
-                >
-                  Download {s.printable_pdf_url.split("/").pop()}
-                </a>
+                {(pdfStatus[s.set_no] || "ready") === "ready" ? (
+                  <a
+                    href={`${API_BASE}${s.printable_pdf_url}`}
+                    target="_blank"
+                    rel="noopener noreferrer"
+                    className="text-purple-400 underline"
+                  >
+                    Download {s.printable_pdf_url.split("/").pop()}
+                  </a>
+                ) : pdfStatus[s.set_no] === "pending" ? (
+                  <span className="text-gray-400">Preparing PDF...</span>
+                ) : (
+                  <span className="text-red-400">PDF failed</span>
+                )}
               </li>
             ))}
           </ul>
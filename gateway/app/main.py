@@ -1,6 +1,8 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from .routers import studyplan, image, voice,upload
+from .routers import studyplan, image, voice, upload, files, jobs
+from .utils import tracing, job_queue
 from fastapi.middleware.cors import CORSMiddleware
 
 import os
@@ -20,17 +22,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[tracing.TRACE_HEADER],
 )
 
+# one trace ID per request, forwarded to the agents by the routers
+tracing.init("gateway")
+app.middleware("http")(tracing.middleware)
+
+# every worker runs bulk job items; the per-agent limits are shared through the queue
+@app.on_event("startup")
+async def start_job_runner():
+    job_queue.start()
+
 @app.get("/health", tags=["meta"])
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics/prometheus", tags=["meta"], response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Latency histograms of the proxy hops in Prometheus text format."""
+    return PlainTextResponse(tracing.prometheus_text(), media_type="text/plain; version=0.0.4")
+
 # Routers
 app.include_router(studyplan.router)
 app.include_router(image.router)
 app.include_router(voice.router)
 app.include_router(upload.router)
+app.include_router(jobs.router)
+# before the static mount: /files/<id>/<filename> resolves through the artifact index
+app.include_router(files.router)
 
 # Serve static files (PDFs and MP3s) from _filestore
 # gateway/main.py
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+import os
+from ..utils import artifact_index
+
+# Printable files (study plans, worksheets) live in the agents' content-addressed
+# store: FILE_STORE/_artifacts/<sha256>.<ext>, indexed by plan / worksheet ID in
+# artifacts.sqlite (see agents/*/app/artifacts.py). /files/<id>/<filename> is
+# resolved through that index; every other /files path is the static mount.
+router = APIRouter(prefix="/files", tags=["files"])
+
+MEDIA_TYPES = {".pdf": "application/pdf", ".md": "text/markdown; charset=utf-8"}
+
+@router.get("/{artifact_id}/{filename}")
+def get_artifact(artifact_id: str, filename: str):
+    row = artifact_index.lookup(artifact_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"unknown file: {artifact_id}")
+    sha, ext, status = row["sha256"], row["ext"], row["status"]
+    if status == "pending":
+        raise HTTPException(status_code=409, detail="file is still being rendered", headers={"Retry-After": "1"})
+    if status != "ready" or not sha:
+        raise HTTPException(status_code=404, detail=row["error"] or f"file not available: {artifact_id}")
+    path = os.path.join(artifact_index.ARTIFACT_DIR, f"{sha}{ext}")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"file not available: {artifact_id}")
+    # the ID always maps to the same content once ready
+    return FileResponse(path, media_type=MEDIA_TYPES.get(ext), filename=row["filename"],
+                        content_disposition_type="inline",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
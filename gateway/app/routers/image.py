@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Request
 from .. import deps
+from ..utils import tracing
 import httpx
 
 router = APIRouter(prefix="/image", tags=["image"])
@@ -9,7 +10,21 @@ async def generate_worksheet(request: Request):
     body = await request.json()
     try:
         async with httpx.AsyncClient(timeout=120) as client:
-            r = await client.post(f"{deps.IMAGE_URL}/worksheet", json=body)
+            with tracing.span("proxy_image"):
+                r = await client.post(f"{deps.IMAGE_URL}/worksheet", json=body, headers=tracing.headers())
+        if r.status_code != 200:
+            raise HTTPException(status_code=r.status_code, detail=r.text)
+        return r.json()
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=502, detail=f"image-agent unreachable: {e}")
+
+@router.get("/files/{artifact_id}/status")
+async def worksheet_file_status(artifact_id: str):
+    """Whether a worksheet PDF has been rendered yet (pending|ready|failed)."""
+    try:
+        async with httpx.AsyncClient(timeout=10) as client:
+            with tracing.span("proxy_file_status"):
+                r = await client.get(f"{deps.IMAGE_URL}/files/{artifact_id}/status", headers=tracing.headers())
         if r.status_code != 200:
             raise HTTPException(status_code=r.status_code, detail=r.text)
         return r.json()
@@ -0,0 +1,83 @@
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from pydantic import ValidationError
+from typing import Dict, Any, List, Optional, Tuple
+import json
+from ..schemas import BulkJobRequest, StudyPlanRequest
+from ..utils import job_queue
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+def _normalize(raw: List[Any], default_kind: Optional[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    """[(kind, request body)], validated before anything is queued; errors name the item index."""
+    if len(raw) > job_queue.JOB_MAX_ITEMS:
+        raise HTTPException(413, f"at most {job_queue.JOB_MAX_ITEMS} items per job")
+    items = []
+    for i, x in enumerate(raw):
+        if not isinstance(x, dict):
+            raise HTTPException(422, f"item {i}: expected an object")
+        kind, body = default_kind, x
+        if "request" in x:
+            kind, body = x.get("kind") or default_kind, x["request"]
+        if kind not in job_queue.KINDS:
+            raise HTTPException(422, f"item {i}: kind must be one of {sorted(job_queue.KINDS)}")
+        if not isinstance(body, dict):
+            raise HTTPException(422, f"item {i}: expected the request as an object")
+        if kind == "studyplan":
+            try:
+                body = StudyPlanRequest(**body).model_dump()
+            except ValidationError as e:
+                raise HTTPException(422, f"item {i}: {e}")
+        elif not body.get("file_ids"):
+            raise HTTPException(422, f"item {i}: worksheet requests need file_ids")
+        items.append((kind, body))
+    return items
+
+def _created(job_id: str, total: int):
+    return {"job_id": job_id, "total": total, "status_url": f"/jobs/{job_id}",
+            "results_url": f"/jobs/{job_id}/results"}
+
+@router.post("", status_code=202)
+def create_job(body: BulkJobRequest):
+    """Queue a list of studyplan / worksheet requests; they run in the background."""
+    items = _normalize(body.items, body.kind)
+    return _created(job_queue.create(items), len(items))
+
+@router.post("/jsonl", status_code=202)
+async def create_job_from_jsonl(file: UploadFile = File(...), kind: Optional[str] = Form(None)):
+    """Same as POST /jobs, from a JSONL file with one request (or {"kind", "request"}) per line."""
+    raw = []
+    for n, line in enumerate((await file.read()).decode("utf-8-sig").splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            raw.append(json.loads(line))
+        except ValueError as e:
+            raise HTTPException(422, f"line {n}: invalid JSON: {e}")
+    if not raw:
+        raise HTTPException(422, "no requests in file")
+    items = _normalize(raw, kind)
+    return _created(job_queue.create(items), len(items))
+
+@router.get("/{job_id}")
+def job_progress(job_id: str):
+    """Counts of queued|running|done|failed items and the job state (queued|running|done|failed)."""
+    st = job_queue.progress(job_id)
+    if st is None:
+        raise HTTPException(404, f"unknown job: {job_id}")
+    return st
+
+@router.get("/{job_id}/results")
+def job_results(job_id: str, status: Optional[str] = None, offset: int = 0, limit: int = 100):
+    """Items in order with their status, attempts, trace ID and result or last error."""
+    if job_queue.progress(job_id) is None:
+        raise HTTPException(404, f"unknown job: {job_id}")
+    if status is not None and status not in job_queue.STATUSES:
+        raise HTTPException(422, f"status must be one of {list(job_queue.STATUSES)}")
+    return {"job_id": job_id, "items": job_queue.results(job_id, status, max(0, offset), min(max(1, limit), 1000))}
+
+@router.post("/{job_id}/retry")
+def retry_job(job_id: str):
+    """Queue the failed items again; finished items keep their results."""
+    if job_queue.progress(job_id) is None:
+        raise HTTPException(404, f"unknown job: {job_id}")
+    return {"job_id": job_id, "requeued": job_queue.retry_failed(job_id)}
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from ..schemas import StudyPlanRequest, StudyPlanResponse
 from ..utils.ids import make_id
+from ..utils import tracing
 from .. import deps
 import httpx
 
@@ -9,8 +11,9 @@ router = APIRouter(prefix="/studyplan", tags=["studyplan"])
 @router.post("/from-syllabus")
 def create_plan(body: StudyPlanRequest):
     try:
-        with httpx.Client(timeout=60) as client:
-            r = client.post(f"{deps.STUDYPLAN_URL}/from-syllabus", json=body.model_dump())
+        with tracing.span("proxy_studyplan"), httpx.Client(timeout=60) as client:
+            r = client.post(f"{deps.STUDYPLAN_URL}/from-syllabus", json=body.model_dump(),
+                            headers=tracing.headers())
             if r.status_code != 200:
                 print("Studyplan-agent error:", r.text)
                 raise HTTPException(status_code=r.status_code, detail=r.text)
@@ -18,3 +21,48 @@ def create_plan(body: StudyPlanRequest):
     except httpx.RequestError as e:
         raise HTTPException(status_code=502, detail=f"studyplan-agent unreachable: {e}")
 
+@router.post("/from-syllabus/stream")
+async def create_plan_stream(body: StudyPlanRequest):
+    """Server-Sent Events passthrough: relays the agent's stream chunk by chunk."""
+    # no read timeout: the agent may think for a while between weeks
+    client = httpx.AsyncClient(timeout=httpx.Timeout(60, read=None))
+    try:
+        req = client.build_request("POST", f"{deps.STUDYPLAN_URL}/from-syllabus/stream", json=body.model_dump(),
+                                   headers=tracing.headers())
+        # time to the agent's response headers; the relayed body is paced by the agent
+        with tracing.span("proxy_studyplan_stream"):
+            r = await client.send(req, stream=True)
+    except httpx.RequestError as e:
+        await client.aclose()
+        raise HTTPException(status_code=502, detail=f"studyplan-agent unreachable: {e}")
+
+    if r.status_code != 200:
+        detail = (await r.aread()).decode("utf-8", "replace")
+        await r.aclose()
+        await client.aclose()
+        print("Studyplan-agent error:", detail)
+        raise HTTPException(status_code=r.status_code, detail=detail)
+
+    async def relay():
+        try:
+            async for chunk in r.aiter_raw():
+                yield chunk
+        finally:
+            await r.aclose()
+            await client.aclose()
+
+    return StreamingResponse(relay(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/files/{plan_id}/status")
+async def plan_file_status(plan_id: str):
+    """Whether the printable file of a plan has been rendered yet (pending|ready|failed)."""
+    try:
+        async with httpx.AsyncClient(timeout=10) as client:
+            with tracing.span("proxy_file_status"):
+                r = await client.get(f"{deps.STUDYPLAN_URL}/files/{plan_id}/status", headers=tracing.headers())
+        if r.status_code != 200:
+            raise HTTPException(status_code=r.status_code, detail=r.text)
+        return r.json()
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=502, detail=f"studyplan-agent unreachable: {e}")
@@ -1,5 +1,8 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-import os, shutil
+import os, hashlib
+import httpx
+from .. import deps
+from ..utils import tracing, file_index
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
@@ -37,10 +40,42 @@ async def upload_file(
     dest = os.path.join(FILE_ROOT, f"{file_id}{ext}")
 
     try:
-        with open(dest, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        sha, size = hashlib.sha256(), 0
+        with tracing.span("upload_write"), open(dest, "wb") as f:
+            while chunk := file.file.read(1024 * 1024):
+                sha.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
     except Exception as e:
         raise HTTPException(500, f"Failed to save file: {e}")
+    # lets the agents resolve file_id without probing extensions
+    file_index.record(file_id, os.path.basename(dest), size, sha.hexdigest())
 
-    return {"ok": True, "file_id": file_id, "saved_as": dest}
+    return {"ok": True, "file_id": file_id, "saved_as": dest, "ingestion": await _start_ingestion(file_id, ext)}
+
+async def _start_ingestion(file_id: str, ext: str):
+    """Have the image agent extract the text now, before any plan / worksheet asks for it."""
+    status_url = f"/upload/{file_id}/status"
+    if file_index.KINDS.get(ext) not in ("pdf", "slides"):
+        file_index.set_ingestion(file_id, "skipped")
+        return {"status": "skipped", "status_url": status_url}
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            r = await client.post(f"{deps.IMAGE_URL}/ingest/{file_id}", headers=tracing.headers())
+        r.raise_for_status()
+        status = r.json().get("status", "queued")
+    except httpx.HTTPError as e:
+        # the agents still extract on first use
+        print(f"[UPLOAD WARN] could not queue ingestion of {file_id}: {e}")
+        file_index.set_ingestion(file_id, "failed", error=f"ingestion not queued: {e}")
+        status = "failed"
+    return {"status": status, "status_url": status_url}
+
+@router.get("/{file_id}/status")
+def ingestion_status(file_id: str):
+    """Eager extraction state of an upload: queued|running|ready|failed|skipped, with pages and language once ready."""
+    st = file_index.ingestion(file_id)
+    if st is None:
+        raise HTTPException(404, f"unknown file_id: {file_id}")
+    return st
 
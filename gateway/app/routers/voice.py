@@ -1,5 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from .. import deps
+from ..utils import tracing
 import httpx
 
 router = APIRouter(prefix="/voice", tags=["voice"])
@@ -8,15 +10,50 @@ async def _forward(request: Request):
     body = await request.json()
     try:
         async with httpx.AsyncClient(timeout=120) as client:
-            r = await client.post(f"{deps.VOICE_URL}/explain", json=body)
+            with tracing.span("proxy_voice"):
+                r = await client.post(f"{deps.VOICE_URL}/explain", json=body, headers=tracing.headers())
         if r.status_code != 200:
             raise HTTPException(status_code=r.status_code, detail=r.text)
         return r.json()  # pass-through with standardized keys
     except httpx.RequestError as e:
         raise HTTPException(status_code=502, detail=f"voice-agent unreachable: {e}")
 
+async def _relay_stream(request: Request):
+    """Server-Sent Events passthrough of the agent's /explain/stream, chunk by chunk."""
+    body = await request.json()
+    client = httpx.AsyncClient(timeout=httpx.Timeout(60, read=None))
+    try:
+        req = client.build_request("POST", f"{deps.VOICE_URL}/explain/stream", json=body,
+                                   headers=tracing.headers())
+        # time to the agent's response headers; the audio events are paced by the agent
+        with tracing.span("proxy_voice_stream"):
+            r = await client.send(req, stream=True)
+    except httpx.RequestError as e:
+        await client.aclose()
+        raise HTTPException(status_code=502, detail=f"voice-agent unreachable: {e}")
+
+    if r.status_code != 200:
+        detail = (await r.aread()).decode("utf-8", "replace")
+        await r.aclose()
+        await client.aclose()
+        raise HTTPException(status_code=r.status_code, detail=detail)
+
+    async def relay():
+        try:
+            async for chunk in r.aiter_raw():
+                yield chunk
+        finally:
+            await r.aclose()
+            await client.aclose()
+
+    return StreamingResponse(relay(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @router.post("/explain")
 async def explain(request: Request):
+    # {"stream": true}: sentence-by-sentence audio as Server-Sent Events (see the agent's /explain/stream)
+    if (await request.json()).get("stream"):
+        return await _relay_stream(request)
     return await _forward(request)
 
 @router.post("/analyze")
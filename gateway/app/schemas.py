@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pydantic import BaseModel, Field, HttpUrl
-from typing import List, Dict, Optional, Literal
+from typing import List, Dict, Optional, Literal, Any
 
 # ===== Studyplan =====
 class StudyPlanRequest(BaseModel):
@@ -12,6 +12,7 @@ class StudyPlanRequest(BaseModel):
         description='e.g., {"per_day_minutes": 35, "weekdays": ["Mon","Wed","Fri"]}'
     )
     target_language: str = Field(default="en", description="Target language code, e.g., 'en', 'hi', 'ta'")
+    bypass_cache: bool = Field(default=False, description="Skip the agents' LLM response cache and regenerate")
 
 class WeeklyItem(BaseModel):
     week: int
@@ -75,3 +76,14 @@ class VoiceResponse(BaseModel):
     transcript: str
     answer_text: str
     answer_audio_url: str
+
+
+# ===== Bulk jobs =====
+JobKind = Literal["studyplan", "worksheet"]
+
+class BulkJobRequest(BaseModel):
+    kind: Optional[JobKind] = Field(default=None, description="Kind of every item that does not name its own")
+    items: List[Dict[str, Any]] = Field(
+        ..., min_length=1,
+        description='Request bodies of /studyplan/from-syllabus or /image/worksheet, or {"kind": ..., "request": {...}} to mix kinds'
+    )
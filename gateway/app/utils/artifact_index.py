@@ -0,0 +1,40 @@
+# app/utils/artifact_index.py
+# Read side of the agents' artifact index (agents/*/app/artifacts.py): printable
+# files live in FILE_STORE/_artifacts/<sha256>.<ext>, indexed by plan / worksheet
+# ID in artifacts.sqlite. effective_status() is the agents' rule, so a download
+# and /files/{id}/status agree on renders that never finished.
+
+import os, time, sqlite3
+from typing import Dict, Any, Optional, Tuple
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+ARTIFACT_DIR = os.path.join(FILE_ROOT, "_artifacts")
+ARTIFACT_DB_PATH = os.environ.get("ARTIFACT_DB_PATH", os.path.join(FILE_ROOT, "artifacts.sqlite"))
+ARTIFACT_PENDING_TIMEOUT = float(os.environ.get("ARTIFACT_PENDING_TIMEOUT", "300"))
+
+
+def effective_status(st: str, error: Optional[str], created: float) -> Tuple[str, Optional[str]]:
+    """A pending row older than ARTIFACT_PENDING_TIMEOUT counts as failed: its worker was restarted."""
+    if st == "pending" and time.time() - created > ARTIFACT_PENDING_TIMEOUT:
+        return "failed", "render timed out"
+    return st, error
+
+
+def lookup(artifact_id: str) -> Optional[Dict[str, Any]]:
+    """{filename, sha256, ext, status, error} with the effective status, or None for an unknown ID."""
+    if not os.path.exists(ARTIFACT_DB_PATH):
+        return None
+    conn = sqlite3.connect(ARTIFACT_DB_PATH, timeout=30)
+    try:
+        row = conn.execute(
+            "SELECT filename, sha256, ext, status, error, created FROM artifact_index WHERE id = ?", (artifact_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None  # index table not created yet
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    filename, sha, ext, st, error, created = row
+    st, error = effective_status(st, error, created)
+    return {"filename": filename, "sha256": sha, "ext": ext, "status": st, "error": error}
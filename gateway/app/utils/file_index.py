@@ -0,0 +1,86 @@
+# app/utils/file_index.py
+# Manifest of uploads: file_id -> file on FILE_STORE (name relative to FILE_STORE,
+# kind, size, sha256), written by /upload. The agents resolve file IDs through it
+# (agents/*/app/file_index.py) instead of probing extensions on the shared volume.
+# The ingestion table holds the state of each upload's eager text extraction.
+
+import os, time, sqlite3, threading
+from typing import Dict, Any, Optional
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+FILE_INDEX_PATH = os.environ.get("FILE_INDEX_PATH", os.path.join(FILE_ROOT, "file_index.sqlite"))
+
+KINDS = {
+    ".pdf": "pdf", ".pptx": "slides", ".ppt": "slides",
+    ".png": "image", ".jpg": "image", ".jpeg": "image", ".webp": "image",
+    ".wav": "audio", ".mp3": "audio", ".m4a": "audio",
+}
+
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(FILE_INDEX_PATH), exist_ok=True)
+        conn = sqlite3.connect(FILE_INDEX_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_index ("
+            " file_id TEXT PRIMARY KEY, path TEXT, ext TEXT, kind TEXT, size INTEGER,"
+            " sha256 TEXT, uploaded REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingestion ("
+            " file_id TEXT PRIMARY KEY, status TEXT, kind TEXT, pages INTEGER, chars INTEGER,"
+            " language TEXT, sha256 TEXT, error TEXT, updated REAL)"
+        )
+        _local.conn = conn
+    return conn
+
+
+def record(file_id: str, name: str, size: Optional[int] = None, sha256: Optional[str] = None):
+    """Add or replace the manifest row of file_id; `name` is relative to FILE_ROOT."""
+    ext = os.path.splitext(name)[1].lower()
+    try:
+        with _conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_index (file_id, path, ext, kind, size, sha256, uploaded)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_id, name, ext, KINDS.get(ext, "other"), size, sha256, time.time()),
+            )
+    except sqlite3.Error as e:
+        print(f"[FILE INDEX WARN] could not record {file_id}: {e}")
+
+
+# ---------- Ingestion ----------
+INGESTION_FIELDS = ("status", "kind", "pages", "chars", "language", "sha256", "error")
+
+
+def set_ingestion(file_id: str, status: str, **fields):
+    """Record the ingestion state of file_id; fields not given are cleared."""
+    values = [fields.get(k) for k in INGESTION_FIELDS[1:]]
+    try:
+        with _conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingestion (file_id, status, kind, pages, chars, language, sha256, error, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_id, status, *values, time.time()),
+            )
+    except sqlite3.Error as e:
+        print(f"[FILE INDEX WARN] could not record ingestion of {file_id}: {e}")
+
+
+def ingestion(file_id: str) -> Optional[Dict[str, Any]]:
+    """{file_id, status, kind, pages, chars, language, sha256, error, updated} or None."""
+    try:
+        row = _conn().execute(
+            "SELECT status, kind, pages, chars, language, sha256, error, updated FROM ingestion WHERE file_id = ?",
+            (file_id,),
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"[FILE INDEX WARN] ingestion lookup failed: {e}")
+        return None
+    if row is None:
+        return None
+    return {"file_id": file_id, **dict(zip(INGESTION_FIELDS + ("updated",), row))}
@@ -0,0 +1,243 @@
+# app/utils/job_queue.py
+# Bulk jobs: lists of studyplan / worksheet requests run in the background.
+#   - a job and its items live in FILE_STORE/jobs.sqlite (JOB_DB_PATH), so they
+#     survive restarts and every gateway worker sees the same queue
+#   - each gateway worker runs one runner loop (start()); a runner claims queued
+#     items in a BEGIN IMMEDIATE transaction, so per-agent limits
+#     (JOB_CONCURRENCY_STUDYPLAN / JOB_CONCURRENCY_IMAGE) hold across workers
+#   - a claimed item carries a lease; items of a runner that died are queued
+#     again once the lease runs out
+#   - network errors and 5xx answers are retried up to JOB_MAX_ATTEMPTS, 4xx are
+#     final; retry_failed() queues the failed items of a job again, finished
+#     items keep their results
+
+import os, time, json, asyncio, sqlite3, threading
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+from .. import deps
+from . import tracing
+from .ids import make_id
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(FILE_ROOT, "jobs.sqlite"))
+JOB_MAX_ITEMS = int(os.environ.get("JOB_MAX_ITEMS", "1000"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "600"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1.0"))
+
+# kind -> (agent, path, timeout); the limit is per agent, over every gateway worker
+KINDS: Dict[str, Tuple[str, str, float]] = {
+    "studyplan": ("studyplan", "/from-syllabus", 60),
+    "worksheet": ("image", "/worksheet", 120),
+}
+AGENT_LIMITS = {
+    "studyplan": int(os.environ.get("JOB_CONCURRENCY_STUDYPLAN", "2")),
+    "image": int(os.environ.get("JOB_CONCURRENCY_IMAGE", "2")),
+}
+STATUSES = ("queued", "running", "done", "failed")
+
+_local = threading.local()
+_wake: Optional[asyncio.Event] = None
+_runner_loop: Optional[asyncio.AbstractEventLoop] = None
+_runner: Optional[asyncio.Task] = None
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(JOB_DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(JOB_DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, total INTEGER, created REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_items ("
+            " job_id TEXT, idx INTEGER, kind TEXT, agent TEXT, request TEXT, status TEXT,"
+            " attempts INTEGER DEFAULT 0, trace_id TEXT, result TEXT, error TEXT,"
+            " queued REAL, lease_until REAL, started REAL, finished REAL,"
+            " PRIMARY KEY (job_id, idx))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS job_items_queue ON job_items (status, agent, queued)")
+        _local.conn = conn
+    return conn
+
+
+def _url(agent: str) -> str:
+    return {"studyplan": deps.STUDYPLAN_URL, "image": deps.IMAGE_URL}[agent]
+
+
+# ---------- Jobs ----------
+def create(items: List[Tuple[str, Dict[str, Any]]]) -> str:
+    """Queue [(kind, request body)] as one job; returns its ID."""
+    job_id = make_id("job")
+    now = time.time()
+    with _conn() as conn:
+        conn.execute("INSERT INTO jobs (job_id, total, created) VALUES (?, ?, ?)", (job_id, len(items), now))
+        conn.executemany(
+            "INSERT INTO job_items (job_id, idx, kind, agent, request, status, queued)"
+            " VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            [(job_id, i, kind, KINDS[kind][0], json.dumps(body, ensure_ascii=False), now)
+             for i, (kind, body) in enumerate(items)],
+        )
+    wake()
+    return job_id
+
+
+def progress(job_id: str) -> Optional[Dict[str, Any]]:
+    """{job_id, total, counts per status, state, created} or None."""
+    conn = _conn()
+    job = conn.execute("SELECT total, created FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if job is None:
+        return None
+    counts = {s: 0 for s in STATUSES}
+    counts.update(dict(conn.execute(
+        "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+    ).fetchall()))
+    if counts["queued"] or counts["running"]:
+        state = "running" if counts["running"] or counts["done"] or counts["failed"] else "queued"
+    else:
+        state = "failed" if counts["failed"] else "done"
+    return {"job_id": job_id, "total": job[0], "counts": counts, "state": state, "created": job[1]}
+
+
+def results(job_id: str, status: Optional[str] = None, offset: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+    """Items of a job in order, with their result once done or their last error."""
+    sql = ("SELECT idx, kind, status, attempts, trace_id, result, error, started, finished"
+           " FROM job_items WHERE job_id = ?")
+    args: List[Any] = [job_id]
+    if status:
+        sql += " AND status = ?"
+        args.append(status)
+    rows = _conn().execute(sql + " ORDER BY idx LIMIT ? OFFSET ?", (*args, limit, offset)).fetchall()
+    return [{"index": r[0], "kind": r[1], "status": r[2], "attempts": r[3], "trace_id": r[4],
+             "result": json.loads(r[5]) if r[5] else None, "error": r[6], "started": r[7], "finished": r[8]}
+            for r in rows]
+
+
+def retry_failed(job_id: str) -> int:
+    """Queue the failed items of a job again; returns how many."""
+    with _conn() as conn:
+        n = conn.execute(
+            "UPDATE job_items SET status = 'queued', attempts = 0, error = NULL, queued = ?"
+            " WHERE job_id = ? AND status = 'failed'",
+            (time.time(), job_id),
+        ).rowcount
+    if n:
+        wake()
+    return n
+
+
+# ---------- Runner ----------
+def claim() -> List[Dict[str, Any]]:
+    """Mark as many queued items running as the agents' limits allow, oldest first."""
+    conn = _conn()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("UPDATE job_items SET status = 'queued' WHERE status = 'running' AND lease_until < ?", (now,))
+        running = dict(conn.execute(
+            "SELECT agent, COUNT(*) FROM job_items WHERE status = 'running' GROUP BY agent"
+        ).fetchall())
+        claimed = []
+        for agent, limit in AGENT_LIMITS.items():
+            free = limit - running.get(agent, 0)
+            if free <= 0:
+                continue
+            rows = conn.execute(
+                "SELECT job_id, idx, kind, request, attempts FROM job_items"
+                " WHERE status = 'queued' AND agent = ? ORDER BY queued, job_id, idx LIMIT ?",
+                (agent, free),
+            ).fetchall()
+            for job_id, idx, kind, request, attempts in rows:
+                trace = tracing.new_trace_id()
+                conn.execute(
+                    "UPDATE job_items SET status = 'running', attempts = ?, trace_id = ?, lease_until = ?, started = ?"
+                    " WHERE job_id = ? AND idx = ?",
+                    (attempts + 1, trace, now + JOB_LEASE_SECONDS, now, job_id, idx),
+                )
+                claimed.append({"job_id": job_id, "idx": idx, "kind": kind, "request": json.loads(request),
+                                "attempts": attempts + 1, "trace_id": trace})
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return claimed
+
+
+def finish(item: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None):
+    with _conn() as conn:
+        conn.execute(
+            "UPDATE job_items SET status = ?, result = ?, error = ?, finished = ?, lease_until = NULL"
+            " WHERE job_id = ? AND idx = ?",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+             time.time(), item["job_id"], item["idx"]),
+        )
+
+
+async def run_item(item: Dict[str, Any]):
+    agent, path, timeout = KINDS[item["kind"]]
+    error, retryable = None, True
+    try:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            with tracing.span(f"job_{item['kind']}"):
+                r = await client.post(f"{_url(agent)}{path}", json=item["request"],
+                                      headers={tracing.TRACE_HEADER: item["trace_id"]})
+        if r.status_code == 200:
+            await asyncio.to_thread(finish, item, "done", r.json())
+            return
+        error, retryable = f"{agent}-agent {r.status_code}: {r.text[:2000]}", r.status_code >= 500
+    except httpx.HTTPError as e:
+        error = f"{agent}-agent unreachable: {e}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    if retryable and item["attempts"] < JOB_MAX_ATTEMPTS:
+        print(f"[JOBS WARN] {item['job_id']}#{item['idx']} attempt {item['attempts']} failed, retrying: {error}")
+        await asyncio.to_thread(_requeue, item, error)
+    else:
+        await asyncio.to_thread(finish, item, "failed", None, error)
+
+
+def _requeue(item: Dict[str, Any], error: str):
+    with _conn() as conn:
+        conn.execute(
+            "UPDATE job_items SET status = 'queued', error = ?, lease_until = NULL WHERE job_id = ? AND idx = ?",
+            (error, item["job_id"], item["idx"]),
+        )
+
+
+def wake():
+    """Have this worker's runner look at the queue now instead of at its next poll."""
+    if _wake is not None:
+        # routers may call this from the threadpool
+        _runner_loop.call_soon_threadsafe(_wake.set)
+
+
+async def _loop():
+    tasks = set()
+    while True:
+        _wake.clear()
+        try:
+            claimed = await asyncio.to_thread(claim)
+        except sqlite3.Error as e:
+            print(f"[JOBS WARN] could not claim job items: {e}")
+            claimed = []
+        for item in claimed:
+            t = asyncio.create_task(run_item(item))
+            tasks.add(t)
+            # a finished item frees a slot: claim again right away
+            t.add_done_callback(lambda t: (tasks.discard(t), _wake.set()))
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start():
+    """Start this worker's runner (gateway startup)."""
+    global _wake, _runner, _runner_loop
+    if _runner is None:
+        _runner_loop = asyncio.get_running_loop()
+        _wake = asyncio.Event()
+        _runner = asyncio.create_task(_loop())
@@ -0,0 +1,212 @@
+# app/utils/tracing.py
+# Lightweight per-stage spans and their Prometheus histograms.
+#   - span("llm", entry) times a block; the duration is added to entry["spans"][stage]
+#     (so it lands in the metrics JSONL) and to a per-stage histogram
+#   - the trace ID comes from the X-Trace-Id header (the gateway sets one per
+#     request) and lives in a contextvar; outgoing calls forward it via headers()
+#   - each worker process keeps its own histograms and dumps them to
+#     FILE_STORE/_prom/<service>/<pid>-<start>.json every PROM_DUMP_INTERVAL seconds;
+#     /metrics/prometheus sums every dump so all uvicorn workers are counted. Dumps
+#     not refreshed for PROM_STALE_SECONDS belong to exited workers and are folded
+#     into archive.json, so counters never go backwards.
+# Durations are recorded where the code awaits, not inside executor threads:
+# contextvars do not follow work handed to a thread pool.
+
+import os, json, time, uuid, fcntl, threading, contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+FILE_ROOT = os.environ.get("FILE_STORE", "/data")
+PROM_DIR = os.environ.get("PROM_DIR", os.path.join(FILE_ROOT, "_prom"))
+PROM_DUMP_INTERVAL = float(os.environ.get("PROM_DUMP_INTERVAL", "5"))
+PROM_STALE_SECONDS = float(os.environ.get("PROM_STALE_SECONDS", "60"))
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TRACE_HEADER = "X-Trace-Id"
+
+SERVICE = "unknown"
+_trace_id: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="")
+_lock = threading.Lock()
+_hist: Dict[str, Dict[str, Any]] = {}  # stage -> {"buckets": [...], "sum": s, "count": n, "errors": e}
+_token = f"{os.getpid()}-{int(time.time() * 1000)}"
+_dumper: Optional[threading.Thread] = None
+
+
+def init(service: str):
+    global SERVICE
+    SERVICE = service
+
+
+# ---------- Trace IDs ----------
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def trace_id() -> str:
+    return _trace_id.get()
+
+
+def headers() -> Dict[str, str]:
+    """Headers to forward the current trace to another service."""
+    tid = _trace_id.get()
+    return {TRACE_HEADER: tid} if tid else {}
+
+
+async def middleware(request, call_next):
+    """FastAPI http middleware: adopt or start a trace and echo its ID in the response."""
+    tid = request.headers.get(TRACE_HEADER) or new_trace_id()
+    token = _trace_id.set(tid)
+    try:
+        response = await call_next(request)
+    finally:
+        _trace_id.reset(token)
+    response.headers[TRACE_HEADER] = tid
+    return response
+
+
+# ---------- Spans ----------
+def observe(stage: str, seconds: float, error: bool = False):
+    global _dumper
+    with _lock:
+        h = _hist.get(stage)
+        if h is None:
+            h = _hist[stage] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0, "errors": 0}
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                h["buckets"][i] += 1
+        h["sum"] += seconds
+        h["count"] += 1
+        if error:
+            h["errors"] += 1
+        if _dumper is None:
+            _dumper = threading.Thread(target=_dump_loop, name="prom-dump", daemon=True)
+            _dumper.start()
+
+
+@contextmanager
+def span(stage: str, stats: Optional[Dict[str, Any]] = None):
+    """Time a pipeline stage; with stats (the metrics entry) its duration is also recorded there."""
+    t0 = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        observe(stage, seconds, error)
+        if stats is not None:
+            spans = stats.setdefault("spans", {})
+            spans[stage] = round(spans.get(stage, 0.0) + seconds, 4)
+
+
+# ---------- Exposition ----------
+def _service_dir() -> str:
+    return os.path.join(PROM_DIR, SERVICE)
+
+
+def _snapshot() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        return {k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"], "errors": v["errors"]}
+                for k, v in _hist.items()}
+
+
+def _merge(into: Dict[str, Dict[str, Any]], other: Dict[str, Dict[str, Any]]):
+    for stage, h in other.items():
+        cur = into.setdefault(stage, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0, "errors": 0})
+        if len(h.get("buckets", [])) != len(BUCKETS):
+            continue  # written with a different bucket layout
+        cur["buckets"] = [a + b for a, b in zip(cur["buckets"], h["buckets"])]
+        cur["sum"] += h["sum"]
+        cur["count"] += h["count"]
+        cur["errors"] += h.get("errors", 0)
+
+
+def _read(path: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(path: str, data: Dict[str, Any]):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def dump():
+    """Write this process's histograms where the other workers can see them."""
+    try:
+        os.makedirs(_service_dir(), exist_ok=True)
+        _write(os.path.join(_service_dir(), f"{_token}.json"), _snapshot())
+    except OSError as e:
+        print(f"[TRACING WARN] could not dump histograms: {e}")
+
+
+def _dump_loop():
+    while True:
+        time.sleep(PROM_DUMP_INTERVAL)
+        dump()
+
+
+def collect() -> Dict[str, Dict[str, Any]]:
+    """Histograms of every worker of this service (live dumps + archive of exited ones)."""
+    dump()
+    folder = _service_dir()
+    total: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(os.path.join(folder, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                archive_path = os.path.join(folder, "archive.json")
+                archive = _read(archive_path)
+                folded = False
+                now = time.time()
+                for name in os.listdir(folder):
+                    if not name.endswith(".json") or name == "archive.json":
+                        continue
+                    path = os.path.join(folder, name)
+                    data = _read(path)
+                    if name != f"{_token}.json" and now - os.path.getmtime(path) > PROM_STALE_SECONDS:
+                        _merge(archive, data)
+                        os.remove(path)
+                        folded = True
+                    else:
+                        _merge(total, data)
+                if folded:
+                    _write(archive_path, archive)
+                _merge(total, archive)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    except OSError as e:
+        print(f"[TRACING WARN] could not read worker histograms: {e}")
+        return _snapshot()
+    return total
+
+
+def prometheus_text() -> str:
+    """Prometheus text exposition (version 0.0.4) of the stage histograms."""
+    hist = collect()
+    svc = SERVICE.replace('"', "")
+    lines = [
+        "# HELP stage_duration_seconds Time spent in each pipeline stage.",
+        "# TYPE stage_duration_seconds histogram",
+    ]
+    for stage in sorted(hist):
+        h = hist[stage]
+        labels = f'service="{svc}",stage="{stage}"'
+        for le, n in zip(BUCKETS, h["buckets"]):
+            lines.append(f'stage_duration_seconds_bucket{{{labels},le="{le}"}} {n}')
+        lines.append(f'stage_duration_seconds_bucket{{{labels},le="+Inf"}} {h["count"]}')
+        lines.append(f"stage_duration_seconds_sum{{{labels}}} {h['sum']:.6f}")
+        lines.append(f"stage_duration_seconds_count{{{labels}}} {h['count']}")
+    lines += [
+        "# HELP stage_errors_total Stages that ended with an exception.",
+        "# TYPE stage_errors_total counter",
+    ]
+    for stage in sorted(hist):
+        lines.append(f'stage_errors_total{{service="{svc}",stage="{stage}"}} {hist[stage]["errors"]}')
+    return "\n".join(lines) + "\n"